@@ -0,0 +1,188 @@
+
+# runs the simulation scenarios of simulation_scenarios.json in parallel processes
+# every scenario is run in its own workspace (settings file, input file copy, temp results, results file), so the scenarios can overlap
+# the results files are merged into the results folder with the same naming as simulations.py
+
+import sediment_traps
+import maintenance
+# import utility functions
+from utilities import color_print, display_progress, stdout_redirected, format_duration
+# for reading the external files referenced by the input file
+from inp_parser import read_inp
+# for parallel execution
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from shutil import copy2, rmtree
+import os
+import time
+import json
+
+# folder containing the scenario workspaces
+batch_folder = os.path.join("temp", "batch")
+
+# files referenced by the input file (rain gage and time series files) that have to be copied along with it
+# only relative paths are returned, absolute paths remain valid in the workspace
+def get_external_files(input_file):
+	inp = read_inp(input_file)
+	files = []
+	for temp in inp.records("RAINGAGES"):
+		if len(temp) > 5 and temp[4].upper() == "FILE":
+			files.append(temp[5].strip("\""))
+	for temp in inp.records("TIMESERIES"):
+		if len(temp) > 2 and temp[1].upper() == "FILE":
+			files.append(temp[2].strip("\""))
+	return [f for f in files if not os.path.isabs(f)]
+
+# create the workspace of a scenario
+# the settings file is written with the default settings and the scenario specific settings
+# variation holds the settings of the scenario and of all scenarios before it, as simulations.py applies the scenarios one
+# after the other to the same settings file, so a setting of a scenario stays in effect for the following scenarios
+# the input file (and its backup) are copied into the workspace, the input file path in the settings is changed accordingly
+def create_workspace(folder, default_settings, variation):
+	if os.path.isdir(folder): rmtree(folder)
+	os.makedirs(os.path.join(folder, "temp"))
+	settings_path = os.path.join(folder, "settings_temp_s.ini")	# same name as in simulations.py, used by the maintenance
+	copy2("settings.ini", settings_path)
+	sediment_traps.write_settings(settings_path, default_settings)
+	sediment_traps.write_settings(settings_path, variation)
+	input_file = sediment_traps.read_settings(settings_path)["input_file"]
+	local_file = os.path.basename(input_file)
+	copy2(input_file, os.path.join(folder, local_file))
+	backup = os.path.splitext(input_file)[0] + ".bak"
+	if os.path.isfile(backup):
+		copy2(backup, os.path.join(folder, os.path.splitext(local_file)[0] + ".bak"))
+	input_folder = os.path.dirname(input_file)
+	for f in get_external_files(input_file):
+		if os.path.isfile(os.path.join(input_folder, f)):
+			target = os.path.join(folder, f)
+			if os.path.dirname(target) and not os.path.isdir(os.path.dirname(target)): os.makedirs(os.path.dirname(target))
+			copy2(os.path.join(input_folder, f), target)
+	sediment_traps.write_settings(settings_path, {"input_file": local_file})
+	copy2("simulation_scenarios.json", os.path.join(folder, "simulation_scenarios.json"))	# maintenance scenarios
+	return settings_path
+
+# run a single scenario in its workspace, executed in a worker process
+# the steps are the same as for a scenario in simulations.py, with the results and maintenance folders inside the workspace
+# and the maintenance only run if simulation_scenarios.json has maintenance scenarios or a maintenance sweep
+# the console output of the scenario is written to log.txt in the workspace
+# returns the result files created in the workspace, or the reason of the failure
+def run_workspace(index, folder, run_maintenance=True):
+	timer_start = time.time()
+	os.chdir(folder)
+	result = {"index": index, "folder": folder, "status": "complete", "files": []}
+	with stdout_redirected(to="log.txt"):
+		try:
+			settings = sediment_traps.read_settings("settings_temp_s.ini")
+			# do the simulations
+			sediment_traps.simulate_scenarios(settings_file="settings_temp_s.ini")
+			# export results to file
+			sediment_traps.export_results(settings)
+			# copy the results file to results folder
+			if not os.path.isdir("results"): os.mkdir("results")
+			suffix = "_" + settings["res_id"] + "_" + settings["start_date"].replace("/", "") + "_" + settings["end_date"].replace("/", "")
+			copy2(settings["results_file"], "results/" + settings["results_file"].replace(".xlsx", suffix + ".xlsx"))
+			# delete the temporary results file
+			os.unlink(settings["results_file"])
+			# run maintenance on results
+			if run_maintenance:
+				maintenance.run_maintenance()
+			for output_folder in ["results", "maintenance"]:
+				if os.path.isdir(output_folder):
+					result["files"] += [output_folder + "/" + f for f in sorted(os.listdir(output_folder))]
+		except Exception as e:
+			result["status"] = "failed: " + str(e)
+			print(result["status"])
+	result["simulation_time"] = format_duration(time.time() - timer_start)
+	return result
+
+# copy the result files of a scenario from its workspace to the results and maintenance folders
+# returns the paths of the merged files
+def merge_workspace(result):
+	for f in result["files"]:
+		output_folder = os.path.dirname(f)
+		if not os.path.isdir(output_folder): os.mkdir(output_folder)
+		copy2(os.path.join(result["folder"], f), f)
+	return result["files"]
+
+def main():
+
+	# needed for colored print to work
+	os.system("")
+
+	# load json data
+	with open("simulation_scenarios.json") as f:
+		sim_data = json.load(f)
+
+	names = [scenario for scenario in sim_data["simulation_scenarios"]]
+	variations = [{param: sim_data["simulation_scenarios"][scenario][param] for param in sim_data["simulation_scenarios"][scenario]} for scenario in names]
+	default_settings = {param: sim_data["default_settings"][param] for param in sim_data["default_settings"]}
+	run_maintenance = len(sim_data.get("maintenance", {})) > 0 or len(sim_data.get("maintenance_sweep", {})) > 0
+
+	# create the workspaces
+	print("\nCreating workspaces...")
+	if not os.path.isdir(batch_folder): os.makedirs(batch_folder)
+	scenarios = []	# indices of the scenarios with a workspace
+	folders = []
+	settings_list = []
+	cumulative = {}	# settings of the scenarios so far, applied cumulatively like in simulations.py
+	for i in range(len(variations)):
+		cumulative.update(variations[i])
+		folder = os.path.abspath(os.path.join(batch_folder, str(i) + "_" + names[i]))
+		try:
+			settings_path = create_workspace(folder, default_settings, dict(cumulative))
+		except Exception as e:
+			color_print("Could not create workspace for scenario " + names[i] + ": " + str(e), "red")
+			rmtree(folder, ignore_errors=True)
+			continue
+		scenarios.append(i)
+		settings_list.append(sediment_traps.read_settings(settings_path))
+		folders.append(folder)
+	color_print("Complete", "green")
+
+	# results files with the same name would overwrite each other
+	targets = {}
+	for k in range(len(settings_list)):
+		s = settings_list[k]
+		target = s["results_file"].replace(".xlsx", "_" + s["res_id"] + "_" + s["start_date"].replace("/", "") + "_" + s["end_date"].replace("/", "") + ".xlsx")
+		if target in targets:
+			color_print("Scenarios " + names[scenarios[targets[target]]] + " and " + names[scenarios[k]] + " write to the same results file " + target, "yellow")
+		targets[target] = k
+
+	# run the scenarios
+	processes = settings_list[0]["batch_processes"] if settings_list else 0
+	processes = processes if processes > 0 else (os.cpu_count() or 1)
+	processes = max(1, min(processes, len(folders)))
+	print("\nRunning " + str(len(folders)) + " simulation scenarios in " + str(processes) + " processes...")
+	print("The output of each scenario is written to log.txt in its workspace (" + batch_folder + ")")
+	total_sim_time_start = time.time()
+	results = [None] * len(folders)
+	display_progress(0)
+	with ProcessPoolExecutor(max_workers=processes) as executor:
+		futures = [executor.submit(run_workspace, k, folders[k], run_maintenance) for k in range(len(folders))]
+		done = 0
+		for future in as_completed(futures):
+			try:
+				result = future.result()
+			except Exception as e:	# the worker process itself failed
+				k = futures.index(future)
+				result = {"index": k, "folder": folders[k], "status": "failed: " + str(e)}
+			results[result["index"]] = result
+			done += 1
+			display_progress(done/len(futures))
+	color_print("\nComplete", "green")
+
+	# merge the results, in the order of the scenarios
+	print("\nMerging results...")
+	for result in results:
+		name = names[scenarios[result["index"]]]
+		if result["status"] != "complete":
+			color_print("Scenario " + name + " " + result["status"] + ", see " + os.path.join(result["folder"], "log.txt"), "red")
+			continue
+		for path in merge_workspace(result):
+			print(name + ": " + path)
+		rmtree(result["folder"], ignore_errors=True)	# failed workspaces are kept for inspection
+	color_print("Complete", "green")
+	print("\nTotal simulation time: " + format_duration(time.time() - total_sim_time_start))
+
+if __name__ == "__main__":
+	main()
+	print("\nProgram terminated")
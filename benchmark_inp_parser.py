@@ -0,0 +1,108 @@
+
+# this code compares the single-pass input file parser with the previous sequential section scans
+# synthetic input files of increasing size are generated into a temporary folder
+
+from inp_parser import index_lines, read_inp
+
+import os
+import random
+import tempfile
+import time
+
+# sections read by get_points_of_interest
+sections = ["SUBCATCHMENTS", "JUNCTIONS", "CONDUITS", "LANDUSES", "COVERAGES"]
+
+# write a synthetic input file with a tree shaped sewer network
+# every junction receives runoff from one subcatchment, some subcatchments drain into other subcatchments
+def write_synthetic_inp(path, n_junctions, seed=0):
+	rng = random.Random(seed)
+	landuses = ["Green", "Street", "Pavement", "Roof"]
+	lines = ["[TITLE]", ";;Project Title/Notes", "", \
+			"[OPTIONS]", ";;Option             Value", "FLOW_UNITS           LPS", "REPORT_STEP          00:01:00", \
+			"WET_STEP             00:00:04", "DRY_STEP             00:00:10", "ROUTING_STEP         0:00:03", ""]
+	lines += ["[SUBCATCHMENTS]", ";;Name           Rain Gage        Outlet           Area     %Imperv  Width    %Slope   CurbLen  SnowPack        ", \
+			";;-------------- ---------------- ---------------- -------- -------- -------- -------- -------- ----------------"]
+	for j in range(n_junctions):
+		outlet = "S" + str(j - 1) if j > 0 and rng.random() < 0.2 else "J" + str(j)
+		lines.append("S" + str(j) + "               RG1              " + outlet + "               " + str(round(rng.uniform(0.01, 1), 4)) + "     50       100      0.5      0                        ")
+	lines += ["", "[JUNCTIONS]", ";;Name           Elevation  MaxDepth   InitDepth  SurDepth   Aponded   ", \
+			";;-------------- ---------- ---------- ---------- ---------- ----------"]
+	for j in range(n_junctions):
+		lines.append("J" + str(j) + "               " + str(round(100 - j * 0.001, 3)) + "     2          0          0          0         ")
+	lines += ["", "[CONDUITS]", ";;Name           From Node        To Node          Length     Roughness  InOffset   OutOffset  InitFlow   MaxFlow   ", \
+			";;-------------- ---------------- ---------------- ---------- ---------- ---------- ---------- ---------- ----------"]
+	for j in range(1, n_junctions):
+		lines.append("C" + str(j) + "               J" + str(j) + "               J" + str(rng.randrange(j)) + "               25         0.013      0          0          0          0         ")
+	lines += ["", "[LANDUSES]", ";;               Sweeping   Fraction   Last      ", ";;Name           Interval   Available  Swept     ", \
+			";;-------------- ---------- ---------- ----------"]
+	for landuse in landuses:
+		lines.append(landuse + "            0          0          0         ")
+	lines += ["", "[COVERAGES]", ";;Subcatchment   Land Use         Percent   ", ";;-------------- ---------------- ----------"]
+	for j in range(n_junctions):
+		lines.append("S" + str(j) + "               " + rng.choice(landuses) + "            100       ")
+	lines += ["", "[COORDINATES]", ";;Node           X-Coord            Y-Coord           ", \
+			";;-------------- ------------------ ------------------"]
+	for j in range(n_junctions):
+		lines.append("J" + str(j) + "               " + str(rng.uniform(0, 1000)) + "     " + str(rng.uniform(0, 1000)))
+	lines.append("")
+	with open(path, "w") as f:
+		for line in lines:
+			f.write("%s\n" % line)
+
+# previous parser, every section is found by scanning the file from the first line
+def legacy_read_sections(input_file):
+	with open(input_file, "r") as f:
+		lines = f.readlines()
+		lines = [lines[x].rstrip() for x in range(len(lines))]	# remove new line characters
+		records = {}
+		for section in sections:
+			records[section] = []
+			if "[" + section + "]" in lines:
+				rows = []
+				i = 0
+				while lines[i] != "[" + section + "]":
+					i += 1
+				i += 1
+				while lines[i] != "":
+					if ";" not in lines[i]: rows.append(lines[i])
+					i += 1
+				for line in rows:
+					records[section].append([x for x in line.split(" ") if x != ""])
+	return records
+
+# new parser, a single pass over the file builds the index of all sections
+def indexed_read_sections(input_file):
+	with open(input_file, "r") as f:
+		lines = [line.rstrip() for line in f]	# remove new line characters
+	index = index_lines(lines)
+	return {section: index.records(section) for section in sections}
+
+# best of several runs, in seconds
+def time_function(function, argument, repeats=3):
+	best = None
+	for i in range(repeats):
+		start = time.perf_counter()
+		function(argument)
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+def main():
+	sizes = [1000, 10000, 50000, 100000]
+	with tempfile.TemporaryDirectory() as folder:
+		print("%10s %10s %12s %12s %8s %12s" % ("junctions", "lines", "legacy (s)", "indexed (s)", "speedup", "cached (s)"))
+		for size in sizes:
+			path = os.path.join(folder, "synthetic_" + str(size) + ".inp")
+			write_synthetic_inp(path, size)
+			with open(path, "r") as f:
+				line_count = sum(1 for line in f)
+			if legacy_read_sections(path) != indexed_read_sections(path):
+				print("Parsers disagree for " + str(size) + " junctions")
+			legacy = time_function(legacy_read_sections, path)
+			indexed = time_function(indexed_read_sections, path)
+			read_inp(path)	# fill the cache
+			cached = time_function(read_inp, path)
+			print("%10d %10d %12.4f %12.4f %8.1f %12.6f" % (size, line_count, legacy, indexed, legacy / indexed, cached))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,49 @@
+
+# this code benchmarks the maintenance planner on synthetic pollutant load series
+# the exact and greedy plans are compared with each other and with the best uniform maintenance interval
+
+from maintenance_engine import maintenance_steps, trap_removal
+from maintenance_planner import plan_maintenance_exact, plan_maintenance_greedy
+
+import numpy as np
+import time
+
+# hourly pollutant loads (mg) of a year, storms of random size with a trap specific load factor
+def synthetic_loads(n_traps, n_steps, seed=0):
+	rng = np.random.default_rng(seed)
+	storms = np.zeros(n_steps)
+	starts = rng.choice(n_steps, size=n_steps // 100, replace=False)
+	for s in starts:
+		length = rng.integers(2, 24)
+		storms[s:s+length] += rng.gamma(2, 1, size=len(storms[s:s+length]))
+	factors = rng.lognormal(10, 1.5, size=(n_traps, 1))	# traps with very different catchments
+	noise = rng.gamma(4, 0.25, size=(n_traps, n_steps))
+	return factors * storms * noise
+
+def main():
+	n_steps = 8760	# a year of hourly steps
+	epoch_times = 1230768000 + 3600 * np.arange(1, n_steps + 1, dtype=np.int64)
+	intervals = [float("inf"), 7, 14, 30, 60, 90, 180, 365]
+	steps = [maintenance_steps(epoch_times, interval) for interval in intervals]
+	visits = np.array([len(s) for s in steps])
+	capacity = 40 * 10**6	# mg
+	efficiency = 0.63
+
+	print("%8s %8s %12s %10s %10s %14s %14s %14s" % ("traps", "budget", "options (s)", "exact (s)", "greedy (s)", "exact (kg)", "greedy (kg)", "uniform (kg)"))
+	for n_traps in [50, 1000, 5000]:
+		loads = synthetic_loads(n_traps, n_steps, seed=n_traps)
+		start = time.perf_counter()
+		removal = np.array([trap_removal(loads, s, capacity, efficiency) for s in steps])	# options x traps
+		options_time = time.perf_counter() - start
+		budget = 2 * n_traps	# two visits per trap and year on average
+		start = time.perf_counter()
+		exact, used = plan_maintenance_exact(removal, visits, budget)
+		exact_time = time.perf_counter() - start
+		start = time.perf_counter()
+		greedy, used = plan_maintenance_greedy(removal, visits, budget)
+		greedy_time = time.perf_counter() - start
+		uniform = max(removal[i].sum() for i in range(len(intervals)) if visits[i] * n_traps <= budget)
+		print("%8d %8d %12.3f %10.3f %10.3f %14.1f %14.1f %14.1f" % (n_traps, budget, options_time, exact_time, greedy_time, removal[exact, np.arange(n_traps)].sum() / 10**6, removal[greedy, np.arange(n_traps)].sum() / 10**6, uniform / 10**6))
+
+if __name__ == "__main__":
+	main()
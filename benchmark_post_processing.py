@@ -0,0 +1,58 @@
+
+# this code benchmarks the post-processing of the pollutant load of the inlets in simulate_scenarios on synthetic series
+# the previous per inlet lists, with the upstream contribution summed in a loop over inlets x upstream inlets x steps,
+# are compared with the (inlets x steps) matrix and the sparse routing matrix product of the inlets
+# the networks are random trees where every inlet has up to three nearest upstream inlets
+
+from network_topology import routing_matrix, local_loads
+
+import numpy as np
+import time
+
+# previous computation of the load entering the network at every inlet, from the load through the inlets
+def list_loads(inlets, upstream_inlets, total_pollutant_through_node):
+	upstream_pollutant_contribution = {}
+	pollutant_load = {}
+	pollutant_load_tot = {}
+	for inlet in inlets:
+		upstream_pollutant_contribution[inlet] = [0 for i in range(len(total_pollutant_through_node[inlet]))]
+		for node in upstream_inlets[inlet]:
+			for i in range(len(upstream_pollutant_contribution[inlet])):
+				upstream_pollutant_contribution[inlet][i] += total_pollutant_through_node[node][i]
+	for inlet in inlets:
+		pollutant_load[inlet] = [abs(total_pollutant_through_node[inlet][i] - upstream_pollutant_contribution[inlet][i]) for i in range(len(total_pollutant_through_node[inlet]))]
+		pollutant_load_tot[inlet] = sum(pollutant_load[inlet])
+	return pollutant_load_tot
+
+# random tree of inlets, the downstream inlet of every inlet has a lower index
+def random_upstream_inlets(inlets, rng):
+	upstream_inlets = {inlet: [] for inlet in inlets}
+	for k in range(1, len(inlets)):
+		downstream = inlets[rng.integers(max(0, k - 10), k)]
+		if len(upstream_inlets[downstream]) < 3:
+			upstream_inlets[downstream].append(inlets[k])
+	return upstream_inlets
+
+def main():
+	rng = np.random.default_rng(0)
+	print("%10s %10s %12s %12s %16s" % ("inlets", "steps", "lists (s)", "matrix (s)", "max difference"))
+	for n_inlets, n_steps in [(100, 1000), (500, 5000), (1000, 10000), (5000, 20000)]:
+		inlets = ["J" + str(k) for k in range(n_inlets)]
+		upstream_inlets = random_upstream_inlets(inlets, rng)
+		loads = rng.random((n_inlets, n_steps))
+		start = time.perf_counter()
+		inlet_load = np.abs(local_loads(loads, routing_matrix(inlets, {inlet: {x: 1.0 for x in upstream_inlets[inlet]} for inlet in inlets})))
+		matrix_tot = np.cumsum(inlet_load, axis=1)[:, -1]
+		matrix_time = time.perf_counter() - start
+		if n_inlets * n_steps > 10**7:	# the lists take too long
+			print("%10d %10d %12s %12.3f %16s" % (n_inlets, n_steps, "-", matrix_time, "-"))
+			continue
+		through_node = {inlet: list(loads[k]) for k, inlet in enumerate(inlets)}
+		start = time.perf_counter()
+		list_tot = list_loads(inlets, upstream_inlets, through_node)
+		list_time = time.perf_counter() - start
+		difference = max(abs(list_tot[inlet] - matrix_tot[k]) for k, inlet in enumerate(inlets))
+		print("%10d %10d %12.3f %12.3f %16g" % (n_inlets, n_steps, list_time, matrix_time, difference))
+
+if __name__ == "__main__":
+	main()
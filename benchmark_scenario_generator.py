@@ -0,0 +1,44 @@
+
+# this code benchmarks the drawing of random treatment scenarios with land use prioritization
+# the list based drawing the scenarios were created with before is compared with the scenario generator
+
+from scenario_generator import create_inlet_sets
+
+import numpy as np
+import random
+import time
+
+# scenarios drawn one at a time from lists, as before the scenario generator
+def list_scenarios(junctions, landuses, preferred_land_uses, number_of_samples, number_of_scenarios):
+	preferred_junctions = []
+	for landuse in preferred_land_uses:
+		for junction in landuses[landuse]:
+			if junction not in preferred_junctions:
+				preferred_junctions.append(junction)
+	if number_of_samples < len(preferred_junctions):
+		return [random.sample(preferred_junctions, number_of_samples) for i in range(number_of_scenarios)]
+	non_preferred_junctions = [x for x in junctions if x not in preferred_junctions]
+	return [random.sample(preferred_junctions, len(preferred_junctions)) + random.sample(non_preferred_junctions, number_of_samples-len(preferred_junctions)) for i in range(number_of_scenarios)]
+
+def main():
+	rng = np.random.default_rng(0)
+	print("%10s %10s %10s %10s %12s %12s %12s" % ("inlets", "preferred", "samples", "scenarios", "lists (s)", "uniform (s)", "weighted (s)"))
+	for n_inlets, n_preferred, n_samples, n_scenarios in [(1000, 100, 10, 10000), (5000, 1000, 50, 10000), (5000, 20, 50, 50000), (20000, 5000, 100, 20000)]:
+		junctions = ["J" + str(i) for i in range(n_inlets)]
+		landuses = {"preferred": list(rng.choice(junctions, n_preferred, replace=False)), "other": junctions}
+		preferred_set = set(landuses["preferred"])
+		preferred = [x in preferred_set for x in junctions]
+		weights = rng.lognormal(0, 1, n_inlets)	# catchment areas
+		start = time.perf_counter()
+		list_scenarios(junctions, landuses, ["preferred"], n_samples, n_scenarios)
+		list_time = time.perf_counter() - start
+		start = time.perf_counter()
+		create_inlet_sets(n_inlets, n_samples, n_scenarios, 0, None, preferred)
+		uniform_time = time.perf_counter() - start
+		start = time.perf_counter()
+		create_inlet_sets(n_inlets, n_samples, n_scenarios, 0, weights, preferred)
+		weighted_time = time.perf_counter() - start
+		print("%10d %10d %10d %10d %12.3f %12.3f %12.3f" % (n_inlets, n_preferred, n_samples, n_scenarios, list_time, uniform_time, weighted_time))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,65 @@
+
+# this code benchmarks the separation of junctions on synthetic input files, see benchmark_inp_parser
+# the previous renaming of the inlets, every line x every inlet x every token with str.replace on the whole line, is
+# compared with the single sweep of separate_junctions, and the lines where the results differ are counted
+# (the previous renaming also changed ids containing the id of a renamed inlet, e.g. J10 when renaming J1)
+
+import sediment_traps
+from benchmark_inp_parser import write_synthetic_inp
+from inp_parser import read_inp
+from utilities import stdout_redirected
+
+import os
+import tempfile
+import time
+
+settings = {"junction_suffix": "_manhole", "height_offset": 0.001, "conduit_length": 2.3, "coord_offset": 0.5}
+
+# previous renaming of the inlets that are only manholes, applied to the lines with the new junctions already added
+def legacy_rename(lines, data, suffix):
+	lines = list(lines)
+	junc_of_int = []
+	for node in data["junctions_with_manholes"]:
+		if node not in data["junctions_to_modify"]:
+			junc_of_int.append(node)
+	for i in range(len(lines)):
+		for node in junc_of_int:
+			for e in lines[i].split(" "):
+				if e == node:
+					lines[i] = lines[i].replace(node, node+suffix)
+	return lines
+
+def main():
+	with tempfile.TemporaryDirectory() as folder:
+		print("%10s %10s %14s %14s %16s" % ("junctions", "lines", "previous (s)", "sweep (s)", "lines differing"))
+		for size in [500, 1000, 2000, 50000]:
+			path = os.path.join(folder, "synthetic_" + str(size) + ".inp")
+			write_synthetic_inp(path, size)
+			data = sediment_traps.get_points_of_interest(path)
+			start = time.perf_counter()
+			with stdout_redirected():
+				sediment_traps.separate_junctions(path, data, settings)
+			sweep_time = time.perf_counter() - start
+			separated = read_inp(path).lines
+			if size > 2000:	# the previous renaming takes too long
+				print("%10d %10d %14s %14.3f %16s" % (size, len(separated), "-", sweep_time, "-"))
+				continue
+			# the previous renaming, starting from the separated file without the renaming of the inlets
+			unrenamed = []
+			renamed = set(data["junctions_with_manholes"]) - set(data["junctions_to_modify"])
+			for line in separated:
+				unrenamed.append(" ".join(x[:-len(settings["junction_suffix"])] if x.endswith(settings["junction_suffix"]) and x[:-len(settings["junction_suffix"])] in renamed else x for x in line.split(" ")))
+			start = time.perf_counter()
+			legacy = legacy_rename(unrenamed, data, settings["junction_suffix"])
+			legacy_time = time.perf_counter() - start
+			differing = sum(1 for a, b in zip(legacy, separated) if a != b)
+			print("%10d %10d %14.3f %14.3f %16d" % (size, len(separated), legacy_time, sweep_time, differing))
+	# an inlet whose id is contained in another id of the same line
+	line = "C7               J1               J12              25         0.013      0          0          0          0"
+	data = {"junctions_with_manholes": ["J1", "J12"], "junctions_to_modify": ["J12"]}
+	print("\nRenaming J1 in: " + line)
+	print("previous: " + legacy_rename([line], data, settings["junction_suffix"])[0])
+	print("sweep:    " + sediment_traps.rename_tokens(line, {"J1"}, settings["junction_suffix"]))
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,69 @@
+
+# checkpoints of a running simulation of simulate_scenarios, so an interrupted run can be resumed instead of started again
+# a checkpoint holds a SWMM hotstart file with the state of the model and the state of the step capture at the same time
+#	hotstart_<n>.hsf	state of the model, saved by swmm
+#	checkpoint.p		state of the capture, time of the checkpoint and the hotstart file to resume from
+# the checkpoint is only used by a run with the same input file content, period, nodes and capture settings (see checkpoint_key)
+# the checkpoint file is written under a temporary name and renamed after the hotstart file is complete, so an interruption
+# while saving leaves the previous checkpoint intact
+# the results of a resumed run are approximate: a swmm hotstart file does not hold the complete state of the model (e.g.
+# the runoff of the subcatchments), so the resumed part drifts from an uninterrupted run, by some tenths of a percent
+# on the test models, checkpoints are saved when a result block is closed, so no block is integrated across the restart
+
+from topology_cache import inp_hash
+import hashlib
+import pickle
+import os
+
+# default location of the checkpoint
+checkpoint_folder = os.path.join("temp", "checkpoint")
+# hotstart files of the window starts of window_runner, saved by its continuous run
+# defined here with the checkpoint, so delete_all_sim_files.py finds both without importing the simulation modules
+hotstart_folder = os.path.join("temp", "windows")
+
+# identifies the runs a checkpoint can be used for
+# inp_file: the prepared input file, period: (start_time, end_time), node_ids: the captured nodes
+def checkpoint_key(inp_file, period, node_ids, pollutant, mod_num, report_step):
+	content = hashlib.sha256(inp_hash(inp_file).encode("utf-8"))
+	content.update(repr([str(period[0]), str(period[1]), list(node_ids), pollutant, mod_num, report_step]).encode("utf-8"))
+	return content.hexdigest()
+
+# save a checkpoint of the simulation at time (seconds from the simulation start), the previous hotstart file is deleted
+def save_checkpoint(sim, capture, time, key, folder=checkpoint_folder):
+	os.makedirs(folder, exist_ok=True)
+	previous = read_checkpoint(key, folder)
+	number = previous["number"] + 1 if previous is not None else 0
+	hotstart_file = "hotstart_" + str(number) + ".hsf"
+	sim.save_hotstart(os.path.abspath(os.path.join(folder, hotstart_file)))
+	path = os.path.join(folder, "checkpoint.p")
+	with open(path + ".tmp", "wb") as f:
+		pickle.dump({"key": key, "number": number, "time": time, "hotstart_file": hotstart_file, "capture": capture.get_state()}, f, protocol=pickle.HIGHEST_PROTOCOL)
+	os.replace(path + ".tmp", path)
+	if previous is not None and previous["hotstart_file"] != hotstart_file:
+		remove_file(os.path.join(folder, previous["hotstart_file"]))
+
+# the checkpoint of a run, None if there is none or it was saved by a different run
+# returns {key, number, time, hotstart_file, capture} with the absolute path of the hotstart file
+def read_checkpoint(key, folder=checkpoint_folder):
+	try:
+		with open(os.path.join(folder, "checkpoint.p"), "rb") as f:
+			checkpoint = pickle.load(f)
+	except Exception:	# no checkpoint
+		return None
+	if checkpoint["key"] != key or not os.path.isfile(os.path.join(folder, checkpoint["hotstart_file"])):
+		return None
+	checkpoint["hotstart_file"] = os.path.abspath(os.path.join(folder, checkpoint["hotstart_file"]))
+	return checkpoint
+
+# delete the checkpoint, after the run is complete
+def delete_checkpoint(folder=checkpoint_folder):
+	if os.path.isdir(folder):
+		for file in os.listdir(folder):
+			if file.endswith(".hsf") or file.startswith("checkpoint.p"):
+				remove_file(os.path.join(folder, file))
+
+def remove_file(path):
+	try:
+		os.unlink(path)
+	except OSError:
+		pass
@@ -1,6 +1,9 @@
 
 # delete all simulation related files, including temporary results
 
+from result_store import results_folder, delete_results
+from checkpoint import checkpoint_folder, delete_checkpoint, hotstart_folder
+
 import os
 from shutil import copy2
 from pathlib import Path
@@ -26,6 +29,23 @@ def main():
 			print("temp/"+item)
 			os.unlink("temp/"+item)
 			print("Item deleted\n")
+	
+	if os.path.isdir(results_folder):
+		print(results_folder)
+		delete_results(results_folder)
+		print("Item deleted\n")
+	
+	if os.path.isdir(checkpoint_folder):
+		print(checkpoint_folder)
+		delete_checkpoint(checkpoint_folder)
+		print("Item deleted\n")
+	
+	if os.path.isdir(hotstart_folder):
+		print(hotstart_folder)
+		for item in os.listdir(hotstart_folder):
+			if item.endswith(".hsf"):
+				os.unlink(os.path.join(hotstart_folder, item))
+		print("Item deleted\n")
 
 if __name__ == "__main__":
 	main()
@@ -15,7 +15,7 @@ def main():
 	# read settings from file
 	settings = sediment_traps.read_settings(settings_path)
 	# export data as gis
-	sediment_traps.export_to_csv(settings)
+	sediment_traps.export_gis(settings)
 
 if __name__ == "__main__":
 	main()
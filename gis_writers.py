@@ -0,0 +1,127 @@
+
+# writers of the gis layers exported from the input file (see sediment_traps.export_gis)
+# every writer receives the features of a layer one at a time and writes them to a buffered file, so no layer is held in memory
+# a feature is (id, geometry type, coordinates, properties) with the geometry types Point, LineString and Polygon,
+# coordinates as (x, y) pairs and properties as {name: value}
+# the fields of a layer are given as [(name, type)] with the types TEXT and REAL
+# the coordinates can be given as read from the input file (strings), the csv keeps them as they are
+# csv: delimited text with wkt geometry for QGIS (Delimited Text Layer), the format of the previous export
+# geojson: one feature collection per layer
+# gpkg: all layers in a single GeoPackage, written with sqlite3 (geometry as GeoPackage binary with little endian wkb)
+
+import json
+import os
+import sqlite3
+import struct
+
+buffer_size = 2**20
+
+# well known text of a geometry, in the notation of the previous csv export
+def wkt(geometry, coordinates):
+	points = ",".join([str(x) + " " + str(y) for x, y in coordinates])
+	return geometry.upper() + "((" + points + "))"
+
+class CsvLayerWriter:
+	def __init__(self, path, fields=[], delimiter="|"):
+		self.file = open(path, "w", buffering=buffer_size)
+		self.property_names = [name for name, type in fields]
+		self.delimiter = delimiter
+		self.file.write(delimiter.join(["id", "features"] + self.property_names) + "\n")
+
+	def write(self, id, geometry, coordinates, properties={}):
+		self.file.write(self.delimiter.join([id, wkt(geometry, coordinates)] + [str(properties.get(name, "")) for name in self.property_names]) + "\n")
+
+	def close(self):
+		self.file.close()
+
+class GeoJsonLayerWriter:
+	def __init__(self, path, fields=[]):
+		self.file = open(path, "w", buffering=buffer_size)
+		self.count = 0
+		self.file.write('{"type": "FeatureCollection", "features": [\n')
+
+	def write(self, id, geometry, coordinates, properties={}):
+		coordinates = [[float(x), float(y)] for x, y in coordinates]
+		if geometry == "Point":
+			geometry_coordinates = coordinates[0]
+		elif geometry == "LineString":
+			geometry_coordinates = coordinates
+		else:
+			geometry_coordinates = [closed_ring(coordinates)]
+		feature = {"type": "Feature", "id": id, "geometry": {"type": geometry, "coordinates": geometry_coordinates}, "properties": dict(properties, id=id)}
+		self.file.write((",\n" if self.count else "") + json.dumps(feature))
+		self.count += 1
+
+	def close(self):
+		self.file.write("\n]}\n")
+		self.file.close()
+
+# the first point repeated at the end, as polygon rings need to be closed in geojson and wkb
+def closed_ring(coordinates):
+	coordinates = list(coordinates)
+	return coordinates if coordinates[0] == coordinates[-1] else coordinates + [coordinates[0]]
+
+# wkb geometry types
+wkb_types = {"Point": 1, "LineString": 2, "Polygon": 3}
+
+# GeoPackage binary of a geometry: header (magic, version, flags: little endian without envelope, srs id) followed by wkb
+def gpkg_geometry(geometry, coordinates, srs_id):
+	coordinates = [(float(x), float(y)) for x, y in coordinates]
+	header = struct.pack("<2sBBi", b"GP", 0, 1, srs_id)
+	if geometry == "Point":
+		wkb = struct.pack("<BIdd", 1, wkb_types[geometry], *coordinates[0])
+	elif geometry == "LineString":
+		wkb = struct.pack("<BII", 1, wkb_types[geometry], len(coordinates)) + b"".join([struct.pack("<dd", x, y) for x, y in coordinates])
+	else:
+		ring = closed_ring(coordinates)
+		wkb = struct.pack("<BIII", 1, wkb_types[geometry], 1, len(ring)) + b"".join([struct.pack("<dd", x, y) for x, y in ring])
+	return header + wkb
+
+# a GeoPackage holding several layers, the coordinates of SWMM models are stored without a coordinate reference system
+# (srs id -1, undefined cartesian), the layers are written in one transaction per layer
+class GeoPackage:
+	srs_id = -1
+
+	def __init__(self, path):
+		if os.path.isfile(path):
+			os.unlink(path)
+		self.connection = sqlite3.connect(path)
+		self.connection.execute("PRAGMA application_id = 1196444487")	# "GPKG"
+		self.connection.execute("PRAGMA user_version = 10300")
+		self.connection.execute("CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY, organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT)")
+		self.connection.executemany("INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)", \
+									[("Undefined cartesian SRS", -1, "NONE", -1, "undefined", "undefined cartesian coordinate reference system"), \
+									("Undefined geographic SRS", 0, "NONE", 0, "undefined", "undefined geographic coordinate reference system"), \
+									("WGS 84 geodetic", 4326, "EPSG", 4326, 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]]', "longitude/latitude coordinates in decimal degrees on the WGS 84 spheroid")])
+		self.connection.execute("CREATE TABLE gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE, description TEXT DEFAULT '', last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')), min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER)")
+		self.connection.execute("CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL, CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name))")
+
+	# writer of a layer (table) of the GeoPackage
+	def layer(self, name, geometry, fields=[]):
+		return GpkgLayerWriter(self, name, geometry, fields)
+
+	def close(self):
+		self.connection.commit()
+		self.connection.close()
+
+class GpkgLayerWriter:
+	def __init__(self, package, name, geometry, fields=[]):
+		self.package = package
+		self.name = name
+		self.property_names = [name for name, type in fields]
+		self.bounds = [float("inf"), float("inf"), -float("inf"), -float("inf")]
+		columns = "".join([', "' + name + '" ' + type for name, type in fields])
+		package.connection.execute('CREATE TABLE "' + name + '" (fid INTEGER PRIMARY KEY AUTOINCREMENT, geom ' + geometry.upper() + ', id TEXT' + columns + ')')
+		package.connection.execute("INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) VALUES (?, 'features', ?, ?)", (name, name, package.srs_id))
+		package.connection.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', ?, ?, 0, 0)", (name, geometry.upper(), package.srs_id))
+		self.insert = 'INSERT INTO "' + name + '" (geom, id' + "".join([', "' + p + '"' for p in self.property_names]) + ") VALUES (?, ?" + ", ?" * len(self.property_names) + ")"
+
+	def write(self, id, geometry, coordinates, properties={}):
+		self.package.connection.execute(self.insert, [gpkg_geometry(geometry, coordinates, self.package.srs_id), id] + [properties.get(p) for p in self.property_names])
+		for x, y in [(float(x), float(y)) for x, y in coordinates]:
+			self.bounds = [min(self.bounds[0], x), min(self.bounds[1], y), max(self.bounds[2], x), max(self.bounds[3], y)]
+
+	def close(self):
+		if self.bounds[0] <= self.bounds[2]:
+			self.package.connection.execute("UPDATE gpkg_contents SET min_x = ?, min_y = ?, max_x = ?, max_y = ? WHERE table_name = ?", self.bounds + [self.name])
+		self.package.connection.commit()
@@ -0,0 +1,162 @@
+
+# single-pass parser for SWMM input files
+# the file is read once and every section is indexed by name (line range + tokenized data rows)
+# the index is shared by all functions that read or modify the input file
+# the functions that modify the input file edit an InpDocument, so several edits need a single read and a single write
+
+import os
+
+# a section of the input file, e.g. [JUNCTIONS]
+# header: line index of the section name
+# start/end: line range of the section contents, end is the line after the last non-empty line of the section
+# rows: line indices of the data rows (rows containing ";" are comments and skipped)
+# records: the data rows split into tokens, in the same order as rows
+class InpSection:
+	def __init__(self, name, header):
+		self.name = name
+		self.header = header
+		self.start = header + 1
+		self.end = header + 1
+		self.rows = []
+		self.records = []
+
+# index of the whole input file
+# lines are stored without new line characters
+class InpIndex:
+	def __init__(self, lines):
+		self.lines = lines
+		self.sections = {}	# {section_name: InpSection}
+
+	def __contains__(self, name):
+		return name in self.sections
+
+	# return the section object, or None if the section does not exist
+	def section(self, name):
+		return self.sections.get(name)
+
+	# return the tokenized data rows of a section, empty list if the section does not exist
+	def records(self, name):
+		return self.sections[name].records if name in self.sections else []
+
+	# return (line index, tokens) pairs of a section, empty list if the section does not exist
+	def rows(self, name):
+		if name not in self.sections:
+			return []
+		section = self.sections[name]
+		return list(zip(section.rows, section.records))
+
+# build the section index in a single pass over the lines
+# a section runs until the next header, empty lines inside a section are skipped
+def index_lines(lines):
+	index = InpIndex(lines)
+	section = None
+	for i, line in enumerate(lines):
+		if line.startswith("[") and line.endswith("]"):
+			section = InpSection(line[1:-1], i)
+			if section.name not in index.sections:	# first occurrence wins, like the sequential scans did
+				index.sections[section.name] = section
+		elif section is not None and line != "":
+			section.end = i + 1	# trailing empty lines are not part of the section
+			if ";" not in line:
+				section.rows.append(i)
+				section.records.append(line.split())
+	return index
+
+# parsed files are cached by path, the cache entry is invalidated if the file changes on disk
+_inp_cache = {}	# {absolute_path: ((mtime, size), InpIndex)}
+
+# read and index an input file, reusing the cached index if the file is unchanged
+# the returned index is shared, copy its lines before modifying them
+def read_inp(input_file):
+	key = os.path.abspath(input_file)
+	stat = os.stat(input_file)
+	signature = (stat.st_mtime_ns, stat.st_size)
+	cached = _inp_cache.get(key)
+	if cached is not None and cached[0] == signature:
+		return cached[1]
+	with open(input_file, "r") as f:
+		lines = [line.rstrip() for line in f]	# remove new line characters
+	index = index_lines(lines)
+	_inp_cache[key] = (signature, index)
+	return index
+
+# editable input file held in memory
+# the preprocessing functions apply their edits to the document, which is written once with save
+# the section index is rebuilt when it is read after an edit, the (line index, tokens) pairs returned by rows stay valid
+# for edits that replace single lines
+class InpDocument:
+	def __init__(self, lines, path=None):
+		self.lines = list(lines)
+		self.path = path	# file the document was read from, written by save
+		self.index = index_lines(self.lines)
+
+	# the section index of the current lines
+	def current(self):
+		if self.index is None:
+			self.index = index_lines(self.lines)
+		return self.index
+
+	def __contains__(self, name):
+		return name in self.current()
+
+	def section(self, name):
+		return self.current().section(name)
+
+	def records(self, name):
+		return self.current().records(name)
+
+	def rows(self, name):
+		return self.current().rows(name)
+
+	# replace the line i
+	def set_line(self, i, line):
+		self.lines[i] = line
+		self.index = None
+
+	# replace the lines from start to end (excluded) with new lines, the following lines move
+	def replace_lines(self, start, end, lines):
+		self.lines[start:end] = lines
+		self.index = None
+
+	# insert new lines before existing lines in a single sweep, inserted = {line index: [new lines]}
+	def insert_lines(self, inserted):
+		if not inserted:
+			return
+		lines = []
+		for i in range(len(self.lines)):
+			if i in inserted:
+				lines += inserted[i]
+			lines.append(self.lines[i])
+		self.lines = lines
+		self.index = None
+
+	# write the document to path, by default to the file it was read from
+	def save(self, path=None):
+		write_inp(path if path is not None else self.path, self.lines)
+
+# open an input file for editing, a document is returned as it is so the edits of several functions are collected
+def open_inp(source):
+	if isinstance(source, InpDocument):
+		return source
+	return InpDocument(read_inp(source).lines, source)
+
+# write the edits of a function to the file, if the function was given a path instead of a document
+# a document given to the function is written by whoever opened it
+def close_inp(source, document):
+	if not isinstance(source, InpDocument):
+		document.save()
+
+# accept either a path, an already built index or a document
+def load_inp(source):
+	if isinstance(source, InpIndex):
+		return source
+	if isinstance(source, InpDocument):
+		return source.current()
+	return read_inp(source)
+
+# write lines to an input file and drop its cached index
+def write_inp(input_file, lines):
+	with open(input_file, "w") as f:
+		for line in lines:
+			f.write("%s\n" % line)
+	_inp_cache.pop(os.path.abspath(input_file), None)
@@ -1,6 +1,4 @@
-
-import as sediment_traps
-#import sediment_traps
+import sediment_traps
 
 import os
 from shutil import copy2
@@ -11,56 +9,54 @@ def run_maintenance():
 
 	# needed for colored print to work
 	os.system("")
-	
+
 	settings_path = "settings_temp_m.ini"
 	# copy settings file to avoid corruption
-	if Path("settings_temp_s.ini"):
+	if os.path.isfile("settings_temp_s.ini"):
 		copy2("settings_temp_s.ini", settings_path)
 	else:
 		copy2("settings.ini", settings_path)
-	
+
 	# load json data
 	with open("simulation_scenarios.json") as f:
 		sim_data = json.load(f)
-	
+
+	# maintenance scenarios, each exported to its own results file
 	variations = []
-	
-	# test scenarios, not run but used for settings modification
-	for scenario in sim_data["maintenance"]:
-		variations.append({"maintenance_id": "maintenance_" + sim_data["maintenance"][scenario]["max_capacity"] + "kg_" + sim_data["maintenance"][scenario]["maintenance_interval"] + "d", \
-							"suppress_output": "1", \
-							"run_simulations": "0", \
-							"rank_junctions": "0", \
-							"max_capacity": sim_data["maintenance"][scenario]["max_capacity"], \
-							"maintenance_interval": sim_data["maintenance"][scenario]["maintenance_interval"]})
-	
+	scenarios = sim_data.get("maintenance", {})	# only the maintenance_sweep may be given
+	for scenario in scenarios:
+		variations.append({"maintenance_id": "maintenance_" + scenarios[scenario]["max_capacity"] + "kg_" + scenarios[scenario]["maintenance_interval"] + "d", \
+							"max_capacity": float(scenarios[scenario]["max_capacity"]), \
+							"maintenance_interval": float(scenarios[scenario]["maintenance_interval"])})
+
+	# all maintenance policies, the maintenance scenarios and the grid of the maintenance sweep (every max capacity with every interval)
+	policies = [(variation["max_capacity"], variation["maintenance_interval"]) for variation in variations]
+	sweep = sim_data.get("maintenance_sweep", {"max_capacity": [], "maintenance_interval": []})
+	for max_capacity in sweep["max_capacity"]:
+		for maintenance_interval in sweep["maintenance_interval"]:
+			if (float(max_capacity), float(maintenance_interval)) not in policies:
+				policies.append((float(max_capacity), float(maintenance_interval)))
+
 	##########
-	
-	count = 0
-	for variation in variations:
-		# change settings
-		sediment_traps.write_settings(settings_path, variation)
-		# read settings from file
-		settings = sediment_traps.read_settings(settings_path)
-		# do the simulations
-		print("--------------------")
-		sediment_traps.simulate_scenarios(settings_file=settings_path)
-		print("--------------------")
-		# increase counter
-		count += 1
-		# calculate maintenance and export to results file
-		sediment_traps.export_maintenance(settings)
-		# copy the results file to results folder
-		if not os.path.isdir("maintenance"): os.mkdir("maintenance")
+
+	# read settings from file
+	settings = sediment_traps.read_settings(settings_path)
+	# calculate maintenance for all policies, the simulation results are loaded once
+	simulation_results, removed = sediment_traps.calc_maintenance_sweep(settings, policies)
+	if not os.path.isdir("maintenance"): os.mkdir("maintenance")
+	for count in range(len(variations)):
+		variation = variations[count]
+		# export the maintenance scenario to its own results file
+		for i in range(len(simulation_results)):
+			sediment_traps.set_maintenance_removal(simulation_results[i], removed[count][i])
 		new_path = "results_" + settings["res_id"] + "_" + variation["maintenance_id"] + ".xlsx"
-		copy2(settings["results_file"], "maintenance/" + new_path)
-		# delete the temporary results file
-		os.unlink(settings["results_file"])
-	
+		sediment_traps.export_maintenance(dict(settings, max_capacity=variation["max_capacity"], maintenance_interval=variation["maintenance_interval"], results_file="maintenance/" + new_path), simulation_results)
+	# export all policies to a single results file
+	if policies:
+		sediment_traps.export_maintenance_sweep(settings, simulation_results, policies, removed, "maintenance/results_" + settings["res_id"] + "_maintenance_sweep.xlsx")
+
 	# delete backup file
 	os.unlink(settings_path)
 
 if __name__ == "__main__":
 	run_maintenance()
-
-
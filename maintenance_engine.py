@@ -0,0 +1,78 @@
+
+# vectorized calculation of the pollutant removed by sediment traps with limited capacity and scheduled maintenance
+# gives the same results as stepping through the time series of each inlet:
+#	at every step (except the last one) the time since the previous maintenance is updated, when it reaches the maintenance
+#	interval the trap is emptied (the stored pollutant is removed) before the step
+#	a trap holding more than its capacity captures nothing, otherwise it captures the load of the step times the efficiency
+#	whatever is stored at the end of the simulation is removed as well
+
+import numpy as np
+
+# steps at which maintenance is done, computed once from the step times and shared by all inlets
+# epoch_times: end of each result step in seconds since the epoch (int64), maintenance_interval in days
+# the countdown is reset to the full interval at every maintenance, so the next maintenance is at the first step
+# whose end time is at least one interval after the end time of the step before the previous maintenance
+# an infinite interval means no maintenance, the trap is only emptied at the end of the simulation
+# returns the indices i (0 <= i < steps-1) of the steps preceded by maintenance
+def maintenance_steps(epoch_times, maintenance_interval):
+	times = np.asarray(epoch_times, dtype=np.int64)
+	interval = maintenance_interval*86400	# same expression as the countdown, in seconds
+	steps = []
+	if len(times) == 0 or not np.isfinite(interval):
+		return np.array(steps, dtype=np.int64)
+	offset = int(np.ceil(interval))	# the step times are whole seconds, so t >= t0 + interval <=> t >= t0 + ceil(interval)
+	anchor = 0	# index of the step time the countdown started from
+	while True:
+		k = int(np.searchsorted(times, times[anchor] + offset, side="left"))
+		k = max(k, anchor + 1)	# the countdown is decreased at least once
+		if k >= len(times):
+			break
+		steps.append(k - 1)
+		anchor = k
+	return np.array(steps, dtype=np.int64)
+
+# pollutant removed by the traps of a block of inlets
+# loads: pollutant load per step (inlets x steps), only the first steps-1 steps are captured
+# capacity is a single value or a list of capacities sharing the same maintenance steps
+# returns the removed pollutant of each inlet (or capacities x inlets for a list), in the unit of the loads
+def trap_removal(loads, maintenance, capacity, efficiency):
+	loads = np.asarray(loads)
+	capacities = np.atleast_1d(capacity)
+	captured = loads[:, :loads.shape[1]-1] * efficiency	# load captured by a trap that is not full
+	rows = np.arange(loads.shape[0])
+	removed = np.zeros((len(capacities), loads.shape[0]))
+	bounds = [0] + [int(i) for i in maintenance] + [captured.shape[1]]
+	for s, e in zip(bounds[:-1], bounds[1:]):	# one segment per maintenance interval, the trap is empty at its start
+		if e <= s:
+			continue
+		stored = np.cumsum(captured[:, s:e], axis=1)	# stored pollutant after each step, as long as the trap is not full
+		for c in range(len(capacities)):
+			full = stored > capacities[c]
+			first_full = np.argmax(full, axis=1)	# once full, the trap keeps what it held after that step
+			removed[c] = removed[c] + np.where(full.any(axis=1), stored[rows, first_full], stored[:, -1])
+	return removed if np.ndim(capacity) else removed[0]
+
+# pollutant removed by the traps of all records of a result set, for several maintenance policies, see result_store.ResultSet
+# policies = [(max_capacity, maintenance_interval), ...] with max_capacity in kg and maintenance_interval in days
+# the series are read once, in blocks of records, and all policies are evaluated on each block
+# the maintenance steps are computed once per interval and shared by the policies with the same interval
+# returns an array with the removed pollutant (mg) of each policy and record (policies x records)
+def maintenance_sweep(results, policies, efficiency, block_size=256):
+	epoch_times = results.epoch_times()
+	intervals = {}	# {maintenance_interval: [policy indices]}
+	for p in range(len(policies)):
+		intervals.setdefault(policies[p][1], []).append(p)
+	maintenance = {interval: maintenance_steps(epoch_times, interval) for interval in intervals}
+	removed = np.zeros((len(policies), len(results)))
+	for start in range(0, len(results), block_size):
+		rows = slice(start, min(start + block_size, len(results)))
+		loads = np.asarray(results.series("tss_per_step", rows))
+		for interval in intervals:
+			capacities = [policies[p][0]*(10**6) for p in intervals[interval]]	# unit convert max capacity from kg -> mg
+			removed[intervals[interval], rows] = trap_removal(loads, maintenance[interval], capacities, efficiency)
+	return removed
+
+# pollutant removed by the traps of all records of a result set, for a single maintenance policy
+# returns an array with the removed pollutant (mg) of each record
+def maintenance_removal(results, max_capacity, maintenance_interval, efficiency, block_size=256):
+	return maintenance_sweep(results, [(max_capacity, maintenance_interval)], efficiency, block_size)[0]
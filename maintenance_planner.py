@@ -0,0 +1,182 @@
+
+# plans the maintenance of the sediment traps under a limited number of crew visits
+# every trap is given its own maintenance interval, chosen from the candidate intervals in the settings file,
+# so that the total pollutant removal with maintenance is as large as possible without exceeding the visit budget
+# the removal of every trap with every candidate interval is calculated from the simulation results, see maintenance_engine
+
+import sediment_traps
+# import utility functions
+from utilities import color_print
+# for calculating the removal of the candidate intervals
+from maintenance_engine import maintenance_steps
+# for data export
+from pandas import DataFrame, ExcelWriter
+import numpy as np
+import heapq
+import os
+
+# average length of a month in days
+month_days = 365.25 / 12
+
+# greedy solution of the multiple-choice knapsack, see plan_maintenance
+# fast for any number of traps and visits, but not always optimal: the options of every trap are reduced to their upper concave hull, so that
+# the extra removal per extra visit decreases from option to option, and the steps with the highest removal per visit are
+# taken first over all traps as long as they fit the budget
+# every trap needs an option without visits (the traps are always emptied at the end of the simulation)
+# returns the chosen option of every trap and the number of visits used
+def plan_maintenance_greedy(removal, visits, budget):
+	removal = np.asarray(removal)
+	visits = np.asarray(visits)
+	order = np.argsort(visits, kind="stable")
+	free = [o for o in order if visits[o] == 0]
+	if not free:
+		raise ValueError("An option without visits is needed")
+	chosen = np.zeros(removal.shape[1], dtype=np.int64)
+	hulls = []	# for every trap, the options on its upper concave hull, ordered by visits
+	heap = []	# (-removal per visit, trap, position on the hull)
+	for t in range(removal.shape[1]):
+		start = max(free, key=lambda o: removal[o, t])
+		hull = [start]
+		for o in order:
+			if visits[o] == 0 or removal[o, t] <= removal[hull[-1], t]:
+				continue	# dominated, more visits without more removal
+			while len(hull) > 1:
+				a, b = hull[-2], hull[-1]	# drop b if it lies below the line from a to o
+				if (removal[b, t] - removal[a, t]) * (visits[o] - visits[a]) <= (removal[o, t] - removal[a, t]) * (visits[b] - visits[a]):
+					hull.pop()
+				else:
+					break
+			hull.append(o)
+		hulls.append(hull)
+		chosen[t] = start
+		if len(hull) > 1:
+			heapq.heappush(heap, (-(removal[hull[1], t] - removal[start, t]) / (visits[hull[1]] - visits[start]), t, 1))
+	used = 0
+	while heap:
+		ratio, t, k = heapq.heappop(heap)
+		hull = hulls[t]
+		extra = visits[hull[k]] - visits[hull[k-1]]
+		if used + extra > budget:
+			continue	# does not fit, the further steps of this trap depend on this one
+		used += extra
+		chosen[t] = hull[k]
+		if k + 1 < len(hull):
+			heapq.heappush(heap, (-(removal[hull[k+1], t] - removal[hull[k], t]) / (visits[hull[k+1]] - visits[hull[k]]), t, k + 1))
+	return chosen, used
+
+# exact solution of the multiple-choice knapsack by dynamic programming over the number of visits, see plan_maintenance
+# best[b] is the largest removal of the traps so far with at most b visits, the chosen option of every trap and number
+# of visits is stored to recover the plan, so the time and memory grow with traps x budget
+def plan_maintenance_exact(removal, visits, budget):
+	removal = np.asarray(removal)
+	visits = np.asarray(visits)
+	if not (visits == 0).any():
+		raise ValueError("An option without visits is needed")
+	best = np.zeros(budget + 1)
+	choice = np.zeros((removal.shape[1], budget + 1), dtype=np.int16)
+	for t in range(removal.shape[1]):
+		new = np.full(budget + 1, -np.inf)
+		for o in range(len(visits)):
+			if visits[o] > budget:
+				continue
+			candidate = best[:budget + 1 - visits[o]] + removal[o, t]
+			better = candidate > new[visits[o]:]
+			new[visits[o]:][better] = candidate[better]
+			choice[t, visits[o]:][better] = o
+		best = new
+	chosen = np.zeros(removal.shape[1], dtype=np.int64)
+	b = budget
+	for t in range(removal.shape[1] - 1, -1, -1):
+		chosen[t] = choice[t, b]
+		b -= visits[chosen[t]]
+	return chosen, int(visits[chosen].sum())
+
+# choose one option for every trap, maximizing the total removal with at most budget visits in total
+# removal: removal of every option and trap (options x traps), visits: number of visits of every option (options)
+# every trap needs an option without visits (the traps are always emptied at the end of the simulation)
+# solved exactly if traps x budget is at most max_cells, otherwise greedily
+# returns the chosen option of every trap and the number of visits used
+def plan_maintenance(removal, visits, budget, max_cells=10**8):
+	if np.shape(removal)[1] * (budget + 1) <= max_cells:
+		return plan_maintenance_exact(removal, visits, budget)
+	return plan_maintenance_greedy(removal, visits, budget)
+
+# label of a maintenance interval in the results
+def interval_label(interval):
+	return interval if np.isfinite(interval) else "end of period"
+
+# plan the maintenance from the simulation results and export the plan to excel
+def run_maintenance_planner(settings_file="settings.ini"):
+
+	# needed for colored print to work
+	os.system("")
+
+	print("\nReading data from settings file...")
+	settings = sediment_traps.read_settings(settings_file)
+	color_print("Complete", "green")
+
+	# candidate intervals, infinity = only emptied at the end of the simulation
+	intervals = [float("inf")] + sorted(set(float(x) for x in settings["candidate_intervals"]))
+	simulation_results, removed = sediment_traps.calc_maintenance_sweep(settings, [(settings["max_capacity"], interval) for interval in intervals])
+	traps = [k for k in range(len(simulation_results)) if len(simulation_results[k]["nodes"]) == 1 and list(simulation_results[k]["nodes"]) != ["system"]]	# results of a single trap
+	if not traps:
+		color_print("No results of single traps, run the simulations with rank_junctions = 1", "red")
+		return
+	epoch_times = simulation_results.epoch_times()
+	step_times = simulation_results.step_times()
+	simulation_results.close()
+	steps = [maintenance_steps(epoch_times, interval) for interval in intervals]
+	visits = np.array([len(s) for s in steps])
+	removal = removed[:, traps]
+
+	# budget of the simulated period
+	start = simulation_results[0]["start"]
+	end = simulation_results[0]["end"]
+	months = (end - start).total_seconds() / 86400 / month_days
+	budget = int(settings["crew_visits_per_month"] * months)
+
+	print("\nPlanning maintenance of " + str(len(traps)) + " traps with " + str(budget) + " visits...")
+	chosen, used = plan_maintenance(removal, visits, budget)
+	planned = removal[chosen, np.arange(len(traps))]
+	color_print("Complete", "green")
+
+	# the same interval for all traps, for comparison
+	uniform = [i for i in range(len(intervals)) if visits[i] * len(traps) <= budget]
+	best_uniform = max(uniform, key=lambda i: removal[i].sum())
+	print("\nTSS removal with planned maintenance:\t" + str(round(planned.sum()/10**6, 3)) + " kg, " + str(used) + " visits")
+	print("TSS removal with uniform maintenance:\t" + str(round(removal[best_uniform].sum()/10**6, 3)) + " kg, " + str(visits[best_uniform] * len(traps)) + " visits (interval " + str(interval_label(intervals[best_uniform])) + ")")
+
+	# visits of every trap, maintenance before step i is done at the end of step i-1
+	visit_rows = {"nodes": [], "date": []}
+	for t in range(len(traps)):
+		for i in steps[chosen[t]]:
+			visit_rows["nodes"].append(simulation_results[traps[t]]["nodes"][0].replace(settings["junction_suffix"], ""))
+			visit_rows["date"].append(step_times[i-1] if i > 0 else start)
+	visit_rows["month"] = [d.strftime("%Y-%m") for d in visit_rows["date"]]
+	visits_per_month = DataFrame(visit_rows).groupby("month").size().reset_index(name="visits")
+
+	if not os.path.isdir("maintenance"): os.mkdir("maintenance")
+	results_file = "maintenance/results_" + settings["res_id"] + "_maintenance_plan.xlsx"
+	print("\nExporting results...")
+	with ExcelWriter(results_file) as writer:
+		DataFrame({"nodes": [simulation_results[k]["nodes"][0].replace(settings["junction_suffix"], "") for k in traps], \
+					"Maintenance interval (days)": [interval_label(intervals[c]) for c in chosen], \
+					"Visits": visits[chosen], \
+					"TSS removal max potential (kg)": [simulation_results[k]["removal_mass"]/10**6 for k in traps], \
+					"TSS removal with maintenance (kg)": planned/10**6, \
+					"TSS removal with maintenance (% of max potential)": [0 if simulation_results[traps[t]]["removal_mass"] == 0 else planned[t] / simulation_results[traps[t]]["removal_mass"] * 100 for t in range(len(traps))]}).sort_values("TSS removal with maintenance (kg)", ascending=False).to_excel(writer, sheet_name="plan")
+		DataFrame(visit_rows).sort_values(["date", "nodes"]).to_excel(writer, sheet_name="visits")
+		visits_per_month.to_excel(writer, sheet_name="visits per month")
+		DataFrame({"Max capacity (kg)": [settings["max_capacity"]], \
+					"Visits per month": [settings["crew_visits_per_month"]], \
+					"Visit budget": [budget], \
+					"Visits used": [used], \
+					"TSS removal with planned maintenance (kg)": [planned.sum()/10**6], \
+					"Best uniform interval (days)": [interval_label(intervals[best_uniform])], \
+					"TSS removal with uniform maintenance (kg)": [removal[best_uniform].sum()/10**6]}).to_excel(writer, sheet_name="summary")
+	color_print("Complete", "green")
+	print("Results exported to " + results_file)
+
+if __name__ == "__main__":
+	run_maintenance_planner()
+	print("\nProgram terminated")
@@ -0,0 +1,240 @@
+
+# monte carlo estimate of the uncertainty of the inlet ranking under uncertain buildup and washoff parameters
+# every realization scales the buildup and washoff coefficients of each land use with random factors (log-normal with a
+# mean of 1 and the coefficient of variation from the settings file) and simulates the network without treatment
+# the factors are applied to a copy of the input file built in memory and written to the temporary folder of the realization,
+# the prepared input file is never changed
+# the pollutant load of every inlet (the removal_mass of rank_junctions) and its rank are added to streaming statistics,
+# so the memory use does not depend on the number of realizations
+
+import sediment_traps
+# import utility functions
+from utilities import color_print, display_progress, format_duration
+# for capturing node values during the simulation
+from simulation_capture import NodeReader, StepCapture, CapturePlan
+# for running a realization in a temporary folder
+from scenario_runner import WorkerSimulation
+# for the load entering the network at every inlet
+from network_topology import routing_matrix, local_loads
+# for parallel execution
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+# for data export
+from pandas import DataFrame, ExcelWriter
+import numpy as np
+import time
+import os
+
+# running mean, standard deviation and quantiles of a vector of values (one per inlet) over the realizations
+# mean and variance by Welford's algorithm, quantiles by the P-square algorithm of Jain and Chlamtac:
+# five markers per quantile and inlet are moved towards their desired positions, so no realizations are stored
+class StreamingStatistics:
+	def __init__(self, size, quantiles):
+		self.size = size
+		self.quantiles = list(quantiles)	# between 0 and 1
+		self.count = 0
+		self.mean = np.zeros(size)
+		self.m2 = np.zeros(size)	# sum of squared differences from the mean
+		self.minimum = np.full(size, np.inf)
+		self.maximum = np.full(size, -np.inf)
+		self.first = []	# the first five realizations, used to start the markers
+		self.heights = [None for p in self.quantiles]	# marker heights (size x 5) of every quantile
+		self.positions = [None for p in self.quantiles]	# marker positions (size x 5) of every quantile
+		self.desired = [np.array([1, 1 + 2*p, 1 + 4*p, 3 + 2*p, 5]) for p in self.quantiles]	# desired marker positions, the same for all inlets
+		self.increments = [np.array([0, p/2, p, (1 + p)/2, 1]) for p in self.quantiles]
+
+	# add the values of a realization
+	def add(self, values):
+		values = np.asarray(values, dtype=float)
+		self.count += 1
+		delta = values - self.mean
+		self.mean += delta / self.count
+		self.m2 += delta * (values - self.mean)
+		self.minimum = np.minimum(self.minimum, values)
+		self.maximum = np.maximum(self.maximum, values)
+		if self.count <= 5:
+			self.first.append(values)
+			if self.count == 5:
+				start = np.sort(np.array(self.first).T, axis=1)
+				for j in range(len(self.quantiles)):
+					self.heights[j] = start.copy()
+					self.positions[j] = np.tile(np.arange(1, 6, dtype=float), (self.size, 1))
+			return
+		self.first = []
+		rows = np.arange(self.size)
+		for j in range(len(self.quantiles)):
+			q = self.heights[j]
+			n = self.positions[j]
+			q[:, 0] = np.minimum(q[:, 0], values)
+			q[:, 4] = np.maximum(q[:, 4], values)
+			cell = np.clip(np.sum(values[:, None] >= q[:, 1:4], axis=1), 0, 3)	# marker cell of the value
+			n += np.arange(5) > cell[:, None]
+			self.desired[j] = self.desired[j] + self.increments[j]
+			for i in range(1, 4):
+				d = self.desired[j][i] - n[:, i]
+				move = ((d >= 1) & (n[:, i+1] - n[:, i] > 1)) | ((d <= -1) & (n[:, i-1] - n[:, i] < -1))
+				if not move.any():
+					continue
+				d = np.sign(d)
+				with np.errstate(divide="ignore", invalid="ignore"):
+					parabolic = q[:, i] + d / (n[:, i+1] - n[:, i-1]) * ((n[:, i] - n[:, i-1] + d) * (q[:, i+1] - q[:, i]) / (n[:, i+1] - n[:, i]) \
+								+ (n[:, i+1] - n[:, i] - d) * (q[:, i] - q[:, i-1]) / (n[:, i] - n[:, i-1]))
+					neighbour = (i + d).astype(np.int64)
+					linear = q[:, i] + d * (q[rows, neighbour] - q[:, i]) / (n[rows, neighbour] - n[:, i])
+				inside = (q[:, i-1] < parabolic) & (parabolic < q[:, i+1])
+				q[:, i] = np.where(move, np.where(inside, parabolic, linear), q[:, i])
+				n[:, i] = np.where(move, n[:, i] + d, n[:, i])
+
+	# standard deviation of every inlet
+	def std(self):
+		return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else np.zeros(self.size)
+
+	# estimate of the quantile j of every inlet, exact for up to five realizations
+	def quantile(self, j):
+		if self.count == 0:
+			return np.full(self.size, np.nan)
+		if self.count <= 5:
+			return np.quantile(np.array(self.first), self.quantiles[j], axis=0)
+		return self.heights[j][:, 2].copy()
+
+# rank of every inlet in a realization, 1 = largest load, ties get the same rank
+def load_ranks(loads):
+	order = np.sort(loads)[::-1]
+	return np.searchsorted(-order, -np.asarray(loads), side="left") + 1
+
+# random factors of a realization, log-normal with mean 1 and coefficient of variation cv
+# returns {land_use: [buildup coeff1, buildup coeff2, washoff coeff1, washoff coeff2]}
+def sample_factors(rng, landuses, buildup_cv, washoff_cv):
+	cv = np.array([buildup_cv, buildup_cv, washoff_cv, washoff_cv])
+	sigma = np.sqrt(np.log(1 + cv**2))
+	factors = {}
+	for landuse in landuses:
+		factors[landuse] = [float(x) for x in np.exp(rng.normal(-sigma**2/2, sigma))]
+	return factors
+
+# pollutant load entering the network at every inlet, the same as removal_mass of simulate_scenarios
+# loads: pollutant load per step through the nodes (steps x inlets), upstream: routing matrix of the inlets, see routing_matrix
+def inlet_loads(loads, upstream):
+	return np.abs(local_loads(np.ascontiguousarray(loads.T), upstream)).sum(axis=1)
+
+# simulate a single realization, executed in a worker process
+# the input file with the scaled coefficients is written into a temporary folder inside work_folder, which is deleted afterwards
+# inlets: the captured inlets, rows: the rows of the reported inlets among them (see CapturePlan)
+# returns the load of every reported inlet and of the system, or the reason of the failure
+def run_realization(index, inp_file, factors, inlets, upstream, rows, settings, work_folder, timeout=0):
+	result = {"index": index, "factors": factors, "status": "complete"}
+	with WorkerSimulation("realization_" + str(index) + "_", result, work_folder) as worker:
+		sim = worker.open(inp_file, lambda inp: sediment_traps.scale_buildup_washoff(inp, factors, settings["pollutant"]))
+		sim.start_time, sim.end_time = sediment_traps.get_simulation_period(settings)
+		start_time = sim.start_time
+		capture = StepCapture(NodeReader(sim, [settings["outfall_node"]] + inlets, settings["pollutant"]), 1000, sediment_traps.get_report_step(settings))
+		worker.run(capture, start_time, timeout)
+		block_times, blocks = capture.finish((sim.end_time - start_time).total_seconds())
+		result["loads"] = inlet_loads(blocks["pollutant_load"][:, 1:], upstream)[rows]
+		result["total_TSS_system"] = capture.totals["pollutant_load"][0]
+	return result
+
+# run the realizations in a process pool and add their results to the statistics as they complete
+# only a few realizations per process are submitted at a time, the factors of a realization are drawn when it is submitted
+# returns the statistics of the loads, of the ranks and of the system load, and the failed realizations
+def run_realizations(inp_file, inlets, upstream, rows, landuses, settings, processes=0, timeout=0, work_folder="temp"):
+	if not os.path.isdir(work_folder): os.mkdir(work_folder)
+	realizations = settings["monte_carlo_realizations"]
+	quantiles = [float(x) / 100 for x in settings["monte_carlo_quantiles"]]
+	processes = processes if processes > 0 else (os.cpu_count() or 1)
+	processes = max(1, min(processes, realizations))
+	rng = np.random.default_rng(settings["random_seed"] if settings["random_seed"] >= 0 else None)
+	loads = StreamingStatistics(len(rows), quantiles)
+	ranks = StreamingStatistics(len(rows), quantiles)
+	system = StreamingStatistics(1, quantiles)
+	failed = []
+	print("\nRunning " + str(realizations) + " realizations in " + str(processes) + " processes...")
+	display_progress(0)
+	with ProcessPoolExecutor(max_workers=processes) as executor:
+		pending = set()
+		submitted = 0
+		done = 0
+		while done < realizations:
+			while submitted < realizations and len(pending) < 2 * processes:
+				factors = sample_factors(rng, landuses, settings["buildup_uncertainty"], settings["washoff_uncertainty"])
+				pending.add(executor.submit(run_realization, submitted, os.path.abspath(inp_file), factors, inlets, upstream, rows, settings, os.path.abspath(work_folder), timeout))
+				submitted += 1
+			finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+			for future in finished:
+				try:
+					result = future.result()
+				except Exception as e:	# the worker process itself failed
+					result = {"index": -1, "status": "failed: " + str(e)}
+				if result["status"] == "complete":
+					loads.add(result["loads"])
+					ranks.add(load_ranks(result["loads"]))
+					system.add([result["total_TSS_system"]])
+				else:
+					failed.append(result)
+				done += 1
+				display_progress(done/realizations)
+	if failed:
+		color_print("\n" + str(len(failed)) + " realizations failed", "red")
+		for r in failed:
+			color_print("Realization " + str(r["index"]) + ": " + r["status"], "red")
+	else:
+		color_print("\nComplete", "green")
+	return loads, ranks, system, failed
+
+# prepare the input file, run the realizations and export the statistics of every inlet to excel
+def run_monte_carlo(settings_file="settings.ini"):
+
+	# needed for colored print to work
+	os.system("")
+
+	print("\nReading data from settings file...")
+	settings = sediment_traps.read_settings(settings_file)
+	color_print("Complete", "green")
+
+	data = sediment_traps.prepare_input_file(settings)
+	# the same inlets and routing as simulate_scenarios, so both rankings agree, see CapturePlan
+	plan = CapturePlan(data, settings["capture_inlets"], settings["junction_suffix"])
+	upstream = routing_matrix(plan.inlets, plan.routing)
+	reported = set(plan.reported)
+	rows = np.array([k for k, inlet in enumerate(plan.inlets) if inlet in reported], dtype=int)
+	landuses = list(data["junction_coverages"].keys())
+	color_print("Complete", "green")
+	for warning in plan.warnings("ranked"):
+		color_print(warning, "yellow")
+
+	total_sim_time_start = time.time()
+	loads, ranks, system, failed = run_realizations(settings["input_file"], plan.inlets, upstream, rows, landuses, settings, settings["parallel_processes"], settings["scenario_timeout"])
+	if loads.count == 0:
+		color_print("No results, all realizations failed", "red")
+		return
+	print("\nTotal simulation time: " + format_duration(time.time() - total_sim_time_start))
+
+	if not os.path.isdir("results"): os.mkdir("results")
+	results_file = "results/" + settings["results_file"].replace(".xlsx", "_" + settings["res_id"] + "_monte_carlo.xlsx")
+	print("\nExporting results...")
+	columns = {"nodes": [inlet.replace(settings["junction_suffix"], "") for inlet in plan.reported], \
+				"TSS removal mean (kg)": loads.mean/10**6, \
+				"TSS removal std (kg)": loads.std()/10**6, \
+				"TSS removal min (kg)": loads.minimum/10**6, \
+				"TSS removal max (kg)": loads.maximum/10**6}
+	for j in range(len(loads.quantiles)):
+		columns["TSS removal P" + settings["monte_carlo_quantiles"][j] + " (kg)"] = loads.quantile(j)/10**6
+	columns["Rank mean"] = ranks.mean
+	for j in range(len(ranks.quantiles)):
+		columns["Rank P" + settings["monte_carlo_quantiles"][j]] = ranks.quantile(j)
+	columns["Rank best"] = ranks.minimum
+	columns["Rank worst"] = ranks.maximum
+	with ExcelWriter(results_file) as writer:
+		DataFrame(columns).sort_values("TSS removal mean (kg)", ascending=False).to_excel(writer, sheet_name="inlets")
+		DataFrame({"Realizations": [settings["monte_carlo_realizations"]], \
+					"Completed": [loads.count], \
+					"Failed": [len(failed)], \
+					"Buildup uncertainty (CV)": [settings["buildup_uncertainty"]], \
+					"Washoff uncertainty (CV)": [settings["washoff_uncertainty"]], \
+					"System TSS mean (kg)": [system.mean[0]/10**6], \
+					"System TSS std (kg)": [system.std()[0]/10**6]}).to_excel(writer, sheet_name="summary")
+	color_print("Complete", "green")
+	print("Results exported to " + results_file)
+
+if __name__ == "__main__":
+	run_monte_carlo()
+	print("\nProgram terminated")
@@ -0,0 +1,294 @@
+
+# network topology of the sewer system, built from the conduits of the input file
+# the adjacency index is built once and shared by all upstream/downstream queries
+
+import numpy as np
+from scipy import sparse
+
+# conduits = {conduit_1: {from: junction_1, to: junction_2}, conduit_2: ...}
+# dividers is an optional list of nodes known to split flow, e.g. the [DIVIDERS] section
+class NetworkTopology:
+	def __init__(self, conduits, dividers=None):
+		self.nodes = []	# [node_1, node_2, ...] in the order they appear in the conduits
+		self.upstream = {}	# {node: [direct upstream nodes]}
+		self.downstream = {}	# {node: [direct downstream nodes]}
+		for c in conduits:
+			from_node = conduits[c]["from"]
+			to_node = conduits[c]["to"]
+			for node in (from_node, to_node):
+				if node not in self.upstream:
+					self.nodes.append(node)
+					self.upstream[node] = []
+					self.downstream[node] = []
+			if to_node not in self.downstream[from_node]:	# parallel conduits count as one connection
+				self.downstream[from_node].append(to_node)
+				self.upstream[to_node].append(from_node)
+		# strongly connected components in topological order, from the most upstream to the most downstream
+		self.components = self._strongly_connected_components()
+		self.order = [node for component in self.components for node in component]	# topological order of the nodes
+		self.position = {node: i for i, node in enumerate(self.order)}
+		# nodes routing water in a loop, each cycle is a list of nodes
+		self.cycles = [component for component in self.components if self._is_cyclic(component)]
+		self.cycle_members = set(node for cycle in self.cycles for node in cycle)
+		# nodes splitting their outflow between several downstream nodes
+		self.dividers = [node for node in self.nodes if len(self.downstream[node]) > 1]
+		for node in dividers or []:
+			if node in self.upstream and node not in self.dividers:
+				self.dividers.append(node)
+
+	def __contains__(self, node):
+		return node in self.upstream
+
+	# a component is a cycle if it has several nodes or a node routing into itself
+	def _is_cyclic(self, component):
+		return len(component) > 1 or component[0] in self.downstream[component[0]]
+
+	# iterative Tarjan's algorithm following the flow direction
+	# components are found downstream first, so the reversed list is in topological order
+	def _strongly_connected_components(self):
+		index = {}
+		low = {}
+		stack = []
+		on_stack = set()
+		components = []
+		counter = 0
+		for root in self.nodes:
+			if root in index:
+				continue
+			index[root] = low[root] = counter
+			counter += 1
+			stack.append(root)
+			on_stack.add(root)
+			work = [(root, iter(self.downstream[root]))]
+			while work:
+				node, children = work[-1]
+				advanced = False
+				for child in children:
+					if child not in index:
+						index[child] = low[child] = counter
+						counter += 1
+						stack.append(child)
+						on_stack.add(child)
+						work.append((child, iter(self.downstream[child])))
+						advanced = True
+						break
+					elif child in on_stack:
+						low[node] = min(low[node], index[child])
+				if advanced:
+					continue
+				work.pop()
+				if work:
+					parent = work[-1][0]
+					low[parent] = min(low[parent], low[node])
+				if low[node] == index[node]:
+					component = []
+					while True:
+						member = stack.pop()
+						on_stack.discard(member)
+						component.append(member)
+						if member == node:
+							break
+					components.append(component)
+		components.reverse()
+		return components
+
+	# all nodes upstream of a node, found with a breadth-first search over the upstream index
+	def upstream_nodes(self, node):
+		if node not in self.upstream:
+			return []
+		visited = set([node])
+		found = []
+		queue = list(self.upstream[node])
+		while queue:
+			next_queue = []
+			for n in queue:
+				if n not in visited:
+					visited.add(n)
+					found.append(n)
+					next_queue += self.upstream[n]
+			queue = next_queue
+		if node in self.cycle_members:
+			found.append(node)	# a node on a cycle is upstream of itself
+		return found
+
+	# immediate upstream nodes of a node
+	def immediate_upstream_nodes(self, node):
+		return list(self.upstream.get(node, []))
+
+	# upstream nodes of every node, computed in one sweep in topological order
+	# returns {node: set of upstream nodes}
+	# note that the sets can grow large for the downstream end of big networks
+	def upstream_sets(self):
+		sets = {}
+		for component in self.components:
+			members = set(component)
+			found = set(members) if self._is_cyclic(component) else set()
+			for node in component:
+				for p in self.upstream[node]:
+					if p not in members:
+						found.add(p)
+						found |= sets[p]
+			for node in component:
+				sets[node] = found
+		return sets
+
+	# for every inlet, the closest inlets upstream of it, i.e. the upstream inlets that are not separated from it by another inlet
+	# computed in one sweep in topological order, nodes on the same cycle share their upstream inlets
+	# returns {inlet: [inlet_1, inlet_2, ...]} with the upstream inlets in topological order
+	def nearest_upstream_inlets(self, inlets):
+		inlet_set = set(inlets)
+		nearest = {}	# {node: set of nearest upstream inlets}
+		for component in self.components:
+			members = set(component)
+			cyclic = self._is_cyclic(component)
+			predecessors = [p for node in component for p in self.upstream[node] if p not in members]
+			if not cyclic and len(predecessors) == 1 and predecessors[0] not in inlet_set:
+				found = nearest[predecessors[0]]	# share the set along chains of plain junctions
+			else:
+				found = set()
+				for p in predecessors:
+					if p in inlet_set:
+						found.add(p)
+					else:
+						found |= nearest[p]
+			for node in component:
+				nearest[node] = (found | ((inlet_set & members) - set([node]))) if cyclic else found
+		return {inlet: sorted(nearest.get(inlet, []), key=self.position.get) for inlet in inlets}
+
+	# fraction of the outflow of node p that flows to its downstream node n
+	# split_fractions = {node: {downstream node: fraction}} for nodes splitting their outflow, other splits are equal
+	def _fraction(self, p, n, split_fractions):
+		if p in split_fractions:
+			return split_fractions[p].get(n, 0.0)
+		return 1.0 / len(self.downstream[p])
+
+	# for every inlet, the fraction of the outflow of each upstream inlet that arrives at it without passing another inlet
+	# computed in one sweep in topological order, the fractions are multiplied along the paths and added where paths join
+	# on a cycle, the fractions of the members are found by solving the linear system of the cycle
+	# without splitting nodes every fraction is 1 and the upstream inlets are the nearest upstream inlets
+	# returns {inlet: {upstream inlet: fraction}} with the upstream inlets in topological order
+	def inlet_routing(self, inlets, split_fractions={}):
+		inlet_set = set(inlets)
+		arriving = {}	# {node: {inlet: fraction of the outflow of the inlet arriving at the node}}
+		# fractions passed on by a node, an inlet passes its own outflow
+		def passing(node):
+			return {node: 1.0} if node in inlet_set else arriving[node]
+		for component in self.components:
+			members = set(component)
+			if not self._is_cyclic(component):
+				node = component[0]
+				predecessors = self.upstream[node]
+				if len(predecessors) == 1 and self._fraction(predecessors[0], node, split_fractions) == 1.0:
+					arriving[node] = passing(predecessors[0])	# shared along chains, never changed afterwards
+					continue
+				found = {}
+				for p in predecessors:
+					f = self._fraction(p, node, split_fractions)
+					for inlet, fraction in passing(p).items():
+						found[inlet] = found.get(inlet, 0.0) + f * fraction
+				arriving[node] = found
+				continue
+			# arriving = external + F * arriving, with F the fractions between the members that are not inlets
+			# the inlets on the cycle pass their own outflow like the nodes upstream of the cycle
+			external = {node: {} for node in component}
+			keys = []
+			for node in component:
+				for p in self.upstream[node]:
+					if p in members and p not in inlet_set:
+						continue
+					f = self._fraction(p, node, split_fractions)
+					for inlet, fraction in passing(p).items():
+						if inlet not in external[node]:
+							external[node][inlet] = 0.0
+							if inlet not in keys:
+								keys.append(inlet)
+						external[node][inlet] += f * fraction
+			position = {node: i for i, node in enumerate(component)}
+			matrix = np.eye(len(component))
+			for node in component:
+				for p in self.upstream[node]:
+					if p in members and p not in inlet_set:
+						matrix[position[node], position[p]] -= self._fraction(p, node, split_fractions)
+			rhs = np.array([[external[node].get(inlet, 0.0) for inlet in keys] for node in component]).reshape(len(component), len(keys))
+			solution = np.linalg.lstsq(matrix, rhs, rcond=None)[0]	# least squares, a closed loop without outflow is singular
+			for node in component:
+				arriving[node] = {inlet: float(solution[position[node], i]) for i, inlet in enumerate(keys)}
+		routing = {}
+		for inlet in inlets:
+			found = arriving.get(inlet, {})
+			routing[inlet] = {x: found[x] for x in sorted(found, key=self.position.get) if found[x] != 0}
+		return routing
+
+# routing between the remaining inlets when some inlets are treated as plain junctions that pass their inflow on
+# (e.g. inlets without contributing area), routing = {inlet: {upstream inlet: fraction}} as returned by inlet_routing
+# every removed inlet is replaced in the rows of its downstream inlets by its own upstream inlets, with the fractions
+# multiplied, a removed inlet receiving part of its own outflow (on a cycle) passes on the sum of the returning flow
+# returns the routing of the remaining inlets
+def remove_inlets(routing, removed):
+	routing = {inlet: dict(routing[inlet]) for inlet in routing}
+	downstream = {}	# {inlet: set of the inlets it routes to}
+	for inlet in routing:
+		for x in routing[inlet]:
+			downstream.setdefault(x, set()).add(inlet)
+	for r in removed:
+		if r not in routing:
+			continue
+		upstream = routing.pop(r)
+		loop = upstream.pop(r, 0.0)
+		scale = 1.0 / (1.0 - loop) if loop < 1.0 else 0.0	# a closed loop without outflow passes nothing on
+		for inlet in downstream.pop(r, set()):
+			if inlet not in routing:
+				continue
+			fraction = routing[inlet].pop(r) * scale
+			for x, f in upstream.items():
+				routing[inlet][x] = routing[inlet].get(x, 0.0) + fraction * f
+				downstream.setdefault(x, set()).add(inlet)
+		for x in upstream:
+			if x in downstream:
+				downstream[x].discard(r)
+	return routing
+
+# sparse routing matrix of the inlets (inlets x inlets), row k holds the fractions of the outflow of its nearest upstream inlets
+# that arrive at inlet k, see NetworkTopology.inlet_routing
+# inlets = [inlet_1, inlet_2, ...], routing = {inlet: {upstream inlet: fraction}}
+# upstream inlets that are not in inlets are left out, the columns of a row are in the order of routing
+def routing_matrix(inlets, routing):
+	index = {inlet: k for k, inlet in enumerate(inlets)}
+	columns = [[(index[x], fraction) for x, fraction in routing.get(inlet, {}).items() if x in index] for inlet in inlets]
+	indptr = np.cumsum([0] + [len(c) for c in columns])
+	indices = np.array([k for c in columns for k, fraction in c], dtype=np.int64)
+	fractions = np.array([fraction for c in columns for k, fraction in c], dtype=float)
+	return sparse.csr_matrix((fractions, indices, indptr), shape=(len(inlets), len(inlets)))
+
+# pollutant load entering the network at every inlet in every step, i.e. the load through the inlet minus the load arriving
+# from its upstream inlets, all steps at once
+# the result is signed, negative values mean that more load arrived from upstream than passed the inlet
+# loads: load through the inlets (inlets x steps), routing: see routing_matrix
+def local_loads(loads, routing):
+	return loads - routing @ loads
+
+# raised when subcatchments route their runoff to each other in a loop
+class RoutingCycleError(Exception):
+	pass
+
+# find the node that finally receives the runoff of every subcatchment, following subcatchment to subcatchment routing
+# every subcatchment is visited once, resolved chains are cached so later lookups stop at the first resolved subcatchment
+# subcatchments = {subcatchment_1: {outlet: junction/subcatchment, ...}, subcatchment_2: ...}
+# returns {subcatchment_1: node, subcatchment_2: ...}
+def resolve_subcatchment_outlets(subcatchments):
+	terminal = {}	# {subcatchment: node}
+	for s in subcatchments:
+		path = []	# unresolved subcatchments on the current chain
+		on_path = set()
+		current = s
+		while current in subcatchments and current not in terminal:
+			if current in on_path:
+				cycle = path[path.index(current):] + [current]
+				raise RoutingCycleError("Subcatchments route runoff in a loop: " + " -> ".join(cycle))
+			path.append(current)
+			on_path.add(current)
+			current = subcatchments[current]["outlet"]
+		outlet = terminal[current] if current in terminal else current
+		for p in path:	# compress the chain, every subcatchment on it points directly to the node
+			terminal[p] = outlet
+	return terminal
@@ -0,0 +1,158 @@
+
+# chooses the K inlets where sediment traps remove the most pollutant together
+# the pollutant load of every inlet comes from the simulation results (rank_junctions = 1), the flow between the inlets
+# from the inlet routing of get_points_of_interest, so no simulation is needed for evaluating a set of traps
+# the load entering the network at an inlet passes the trap of that inlet and the traps of the inlets downstream of it,
+# at a flow split only the fraction routed to a branch passes the traps of that branch (see NetworkTopology.inlet_routing)
+# each trap removes the fraction R of the treatment formula from what reaches it, so loads shared between traps are not counted twice
+# the chosen set can be verified with a simulation of the set, see scenario_runner
+
+import sediment_traps
+# import utility functions
+from utilities import color_print
+# for the verification run
+from scenario_runner import run_scenarios_parallel
+# for the fractions of the loads passing the inlets
+from network_topology import routing_matrix, remove_inlets
+from scipy import sparse
+from scipy.sparse.linalg import splu
+# for data export
+from pandas import DataFrame, ExcelWriter
+import numpy as np
+import heapq
+import os
+
+# for every inlet, the inlets whose load passes through it (the inlet itself and the inlets upstream of it) and the
+# fraction of their load that passes it, the product of the split fractions along the way
+# inlets = [inlet_1, inlet_2, ...], routing = {inlet: {upstream inlet: fraction}} as returned by inlet_routing
+# the fractions x of all inlets passing inlet k solve x = e_k + R^T x, with R the routing matrix of the inlets, a load
+# passing an inlet more than once on a cycle is counted once
+# returns a list of index arrays into inlets and a list of the fractions of these inlets
+def get_contributing_inlets(inlets, routing):
+	n = len(inlets)
+	if n == 0:
+		return [], []
+	lu = splu(sparse.csc_matrix(sparse.identity(n) - routing_matrix(inlets, routing).T))
+	contributing = []
+	fractions = []
+	unit = np.zeros(n)
+	for k in range(n):
+		unit[k] = 1.0
+		x = lu.solve(unit)
+		unit[k] = 0.0
+		x[k] = 1.0
+		found = np.flatnonzero(x > 1e-12)
+		contributing.append(found.astype(np.int64))
+		fractions.append(np.minimum(x[found], 1.0))
+	return contributing, fractions
+
+# pollutant removed by traps in the given inlets (indices into loads)
+# the load of an inlet passing traps is reduced to the product of (1-efficiency*fraction) over the traps, i.e. to
+# (1-efficiency)^m of its value for m traps passed by all of its load, traps on parallel branches after a split are
+# counted as if in series, which slightly underestimates their removal
+def placement_removal(loads, contributing, fractions, efficiency, traps):
+	kept = np.ones(len(loads))	# fraction of the load of every inlet passing the traps
+	for t in traps:
+		kept[contributing[t]] *= 1 - efficiency * fractions[t]
+	return float(np.sum(loads * (1 - kept)))
+
+# choose k trap locations greedily, each time the inlet with the largest additional removal
+# the removal of a set of traps has diminishing returns, so the additional removal of an inlet can only decrease when traps
+# are added and is only recalculated for the inlet on top of the queue (lazy greedy)
+# loads: pollutant load entering the network at every inlet, contributing/fractions: see get_contributing_inlets
+# returns the chosen inlets (indices) and the additional removal of each of them, in the order they were chosen
+def place_traps(loads, contributing, fractions, efficiency, k):
+	remaining = np.array(loads, dtype=float)	# load of every inlet still reaching the outfall
+	lengths = np.array([len(c) for c in contributing])
+	flat = np.concatenate(contributing) if contributing else np.zeros(0, dtype=np.int64)
+	flat_fractions = np.concatenate(fractions) if fractions else np.zeros(0)
+	starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+	gains = efficiency * np.add.reduceat(remaining[flat] * flat_fractions, starts) if len(flat) else np.zeros(0)	# removal of every inlet alone
+	heap = [(-gains[t], t, 0) for t in range(len(contributing))]	# (-additional removal, inlet, number of traps when calculated)
+	heapq.heapify(heap)
+	chosen = []
+	removal = []
+	while heap and len(chosen) < k:
+		gain, t, count = heapq.heappop(heap)
+		if count == len(chosen):	# up to date, still the best
+			chosen.append(t)
+			removal.append(-gain)
+			remaining[contributing[t]] *= (1 - efficiency * fractions[t])
+		else:
+			heapq.heappush(heap, (-efficiency * (remaining[contributing[t]] * fractions[t]).sum(), t, len(chosen)))
+	return chosen, removal
+
+# choose the trap locations from the simulation results, optionally verify them with a simulation, and export them to excel
+def run_placement_optimizer(settings_file="settings.ini"):
+
+	# needed for colored print to work
+	os.system("")
+
+	print("\nReading data from settings file...")
+	settings = sediment_traps.read_settings(settings_file)
+	color_print("Complete", "green")
+	if settings["formula"].split("=")[0].strip() != "R":
+		color_print("The placement requires a removal (R) treatment formula", "red")
+		return
+	efficiency = float(settings["formula"].split("=")[1])
+
+	# pollutant load of every inlet, from the single inlet results
+	simulation_results = sediment_traps.get_simulation_results()
+	loads_by_inlet = {}
+	for res in simulation_results:
+		if len(res["nodes"]) == 1 and list(res["nodes"]) != ["system"]:
+			loads_by_inlet[res["nodes"][0]] = res["removal_mass"]
+	if not loads_by_inlet:
+		color_print("No results of single inlets, run the simulations with rank_junctions = 1", "red")
+		return
+	total_load = [res["total_TSS_system"] for res in simulation_results if list(res["nodes"]) == ["system"]]
+	total_load = total_load[0] if total_load else sum(loads_by_inlet.values())
+	simulation_results.close()	# only the scalar values are used
+
+	# flow between the inlets, from the (already prepared) input file
+	print("\nReading data from input file...")
+	data = sediment_traps.get_points_of_interest_cached(settings["input_file"], settings)
+	inlets = [inlet for inlet in data["junctions_with_manholes"] if inlet in loads_by_inlet]
+	loads = np.array([loads_by_inlet[inlet] for inlet in inlets])
+	# inlets without results (e.g. without contributing area) pass the load of their upstream inlets on
+	routing = remove_inlets(data["inlet_routing"], [inlet for inlet in data["inlet_routing"] if inlet not in loads_by_inlet])
+	contributing, fractions = get_contributing_inlets(inlets, routing)
+	color_print("Complete", "green")
+
+	k = min(settings["placement_traps"], len(inlets))
+	print("\nPlacing " + str(k) + " traps among " + str(len(inlets)) + " inlets...")
+	chosen, removal = place_traps(loads, contributing, fractions, efficiency, k)
+	ranked = list(np.argsort(-loads, kind="stable")[:k])	# the k inlets with the largest single inlet removal
+	color_print("Complete", "green")
+	print("\nTSS removal of the placed traps:\t" + str(round(sum(removal)/10**6, 3)) + " kg")
+	print("TSS removal of the ranked inlets:\t" + str(round(placement_removal(loads, contributing, fractions, efficiency, ranked)/10**6, 3)) + " kg")
+
+	# simulate the chosen set and the default scenario without treatment
+	simulated = None
+	if settings["verify_placement"]:
+		nodes = {}
+		for t in chosen:
+			nodes[inlets[t]] = {"pollutant": settings["pollutant"], "function": settings["formula"]}
+		results = run_scenarios_parallel(settings["input_file"], [{}, nodes], settings, settings["parallel_processes"], settings["scenario_timeout"])
+		if all(r["status"] == "complete" for r in results):
+			simulated = results[0]["total_TSS_system"] - results[1]["total_TSS_system"]
+			print("TSS removal of the placed traps (simulated):\t" + str(round(simulated/10**6, 3)) + " kg")
+
+	if not os.path.isdir("results"): os.mkdir("results")
+	results_file = "results/" + settings["results_file"].replace(".xlsx", "_" + settings["res_id"] + "_placement.xlsx")
+	print("\nExporting results...")
+	with ExcelWriter(results_file) as writer:
+		DataFrame({"nodes": [inlets[t].replace(settings["junction_suffix"], "") for t in chosen], \
+					"TSS removal single inlet (kg)": [loads[t] * efficiency / 10**6 for t in chosen], \
+					"TSS removal additional (kg)": np.array(removal) / 10**6, \
+					"TSS removal cumulative (kg)": np.cumsum(removal) / 10**6, \
+					"TSS removal cumulative (%)": np.cumsum(removal) / total_load * 100 if total_load != 0 else np.zeros(len(removal))}).to_excel(writer, sheet_name="placement")
+		DataFrame({"method": ["placement", "ranking"] + (["placement (simulated)"] if simulated is not None else []), \
+					"TSS removal (kg)": [sum(removal)/10**6, placement_removal(loads, contributing, fractions, efficiency, ranked)/10**6] + ([simulated/10**6] if simulated is not None else []), \
+					"nodes": [", ".join([inlets[t].replace(settings["junction_suffix"], "") for t in s]) for s in [chosen, ranked]] + ([", ".join([inlets[t].replace(settings["junction_suffix"], "") for t in chosen])] if simulated is not None else [])}).to_excel(writer, sheet_name="comparison")
+	color_print("Complete", "green")
+	print("Results exported to " + results_file)
+
+if __name__ == "__main__":
+	run_placement_optimizer()
+	print("\nProgram terminated")
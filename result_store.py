@@ -0,0 +1,245 @@
+
+# columnar store of the simulation results of a run
+# the results of all nodes/scenarios are stored together in one folder instead of one pickle file per node
+#	step_times.npy		end of each result step, int64 seconds since the epoch, stored once for all records
+#	<series>.npy		per step series, float64 array of (records x steps), e.g. volume_per_step.npy
+#	table.p				scalar values of the records, one row per record (pandas DataFrame)
+# the series are memory mapped when read, so only the rows that are accessed are loaded
+
+import numpy as np
+from pandas import DataFrame, read_pickle
+import os
+
+# default location of the store
+results_folder = os.path.join("temp", "simulation_results")
+
+# per step series of a record, the cumulative series are computed from these when loading
+series_names = ["volume_per_step", "tss_per_step"]
+# scalar values of a record
+scalar_names = ["start", "end", "simulation_time", "total_volume", "flow_error", "total_TSS", "total_TSS_system", "quality_error", \
+				"removal_mass", "removal_percent", "removal_per_area", "area_covered_total"]
+# prefix of the area columns in the table, one column per key of area_covered
+area_prefix = "area:"
+
+# convert a list of datetimes to int64 seconds since the epoch
+def to_epoch(times):
+	return np.array(times, dtype="datetime64[s]").astype(np.int64)
+
+# convert int64 seconds since the epoch to a list of datetimes
+def from_epoch(seconds):
+	return np.asarray(seconds).astype("datetime64[s]").tolist()
+
+# check if a store exists in the folder
+def results_exist(folder=results_folder):
+	return os.path.isfile(os.path.join(folder, "table.p"))
+
+# delete the store in the folder, and the pickle files of the previous result format in its parent folder
+def delete_results(folder=results_folder):
+	if os.path.isdir(folder):
+		for file in os.listdir(folder):
+			if file.endswith(".npy") or file == "table.p":
+				os.unlink(os.path.join(folder, file))
+	parent = os.path.dirname(folder)
+	if parent and os.path.isdir(parent):
+		for file in os.listdir(parent):
+			if "simulation_results" in file and file.endswith(".p"):
+				os.unlink(os.path.join(parent, file))
+
+# write result records into the store, replacing the previous results
+# records are dicts in the format exported by simulate_scenarios, all records must have the same step_times
+# step_times: list of datetimes, volume/tss_per_step: list of values, volume/tss_manhole_per_step: the same lists or None
+# the cumulative series are not stored, they are the cumulative sums of the per step series
+def write_records(records, folder=results_folder):
+	delete_results(folder)
+	if not os.path.isdir(folder): os.makedirs(folder)
+	step_times = records[0]["step_times"] if records else []
+	np.save(os.path.join(folder, "step_times.npy"), to_epoch(step_times))
+	for name in series_names:
+		data = np.empty((len(records), len(step_times)))
+		for i in range(len(records)):
+			data[i] = records[i][name]
+		np.save(os.path.join(folder, name + ".npy"), data)
+	table = {"nodes": [list(r["nodes"]) for r in records]}
+	for name in scalar_names:
+		table[name] = [r[name] for r in records]
+	areas = []	# area keys in the order of the first record
+	for r in records:
+		for a in r["area_covered"]:
+			if a not in areas:
+				areas.append(a)
+	for a in areas:
+		table[area_prefix + a] = [r["area_covered"].get(a, 0) for r in records]
+	table["manhole_series"] = [r["volume_manhole_per_step"] is not None for r in records]
+	DataFrame(table).to_pickle(os.path.join(folder, "table.p"))
+
+# read access to the store
+# the table is loaded when the store is opened, the step times and series are memory mapped when first accessed
+class ResultStore:
+	def __init__(self, folder=results_folder):
+		self.folder = folder
+		self.table = read_pickle(os.path.join(folder, "table.p"))
+		self.areas = [c[len(area_prefix):] for c in self.table.columns if c.startswith(area_prefix)]
+		self._arrays = {}
+
+	def __len__(self):
+		return len(self.table)
+
+	# memory mapped array of the store
+	def array(self, name):
+		if name not in self._arrays:
+			self._arrays[name] = np.load(os.path.join(self.folder, name + ".npy"), mmap_mode="r")
+		return self._arrays[name]
+
+	# release the memory mapped arrays, so the files can be deleted (on windows a mapped file cannot be deleted)
+	# the arrays are mapped again when accessed after closing
+	def close(self):
+		self._arrays = {}
+
+	# end of each result step in seconds since the epoch
+	def step_times(self):
+		return self.array("step_times")
+
+	# per step series of all records, (records x steps)
+	def series(self, name):
+		return self.array(name)
+
+	# scalar values of all records, as a list of dicts, read column by column
+	def scalars(self):
+		columns = {name: self.table[name].tolist() for name in self.table.columns}
+		records = []
+		for i in range(len(self.table)):
+			res = {name: columns[name][i] for name in scalar_names}
+			for name in ["start", "end"]:
+				if hasattr(res[name], "to_pydatetime"):
+					res[name] = res[name].to_pydatetime()
+			res["nodes"] = columns["nodes"][i]
+			res["area_covered"] = {a: columns[area_prefix + a][i] for a in self.areas}
+			records.append(res)
+		return records
+
+# sum consecutive groups of mod_num values along the last axis, the last group may be shorter
+def downsample(values, mod_num):
+	values = np.asarray(values)
+	if mod_num <= 1:
+		return values
+	n = values.shape[-1]
+	full = n // mod_num * mod_num
+	summed = values[..., :full].reshape(values.shape[:-1] + (n // mod_num, mod_num)).sum(axis=-1)
+	if full < n:
+		summed = np.concatenate([summed, values[..., full:].sum(axis=-1, keepdims=True)], axis=-1)
+	return summed
+
+# series of a record that are loaded on demand
+lazy_names = ["step_times", "volume_per_step", "tss_per_step", "cumulative_volume", "cumulative_tss", "volume_manhole_per_step", "tss_manhole_per_step"]
+
+# a record of the result set, a dict holding the scalar values
+# the series are read through the loader of the set (see SeriesLoader) when first accessed and then kept in the record
+# the record does not refer to the set, so the set and its memory mapped files are released as soon as they are not used
+class ResultRecord(dict):
+	def __init__(self, loader, i, scalars):
+		dict.__init__(self, scalars)
+		self["i"] = i
+		self.loader = loader
+
+	def __missing__(self, key):
+		if key not in lazy_names:
+			raise KeyError(key)
+		value = self.loader.record_series(self["i"], key)
+		self[key] = value
+		return value
+
+	def __contains__(self, key):
+		return dict.__contains__(self, key) or key in lazy_names
+
+	def get(self, key, default=None):
+		return self[key] if key in self else default
+
+# reads the series of the records from the store, shared by the result set and its records
+# the series are returned as copies, so no array outside of the store keeps the files mapped
+class SeriesLoader:
+	def __init__(self, store, mod_num, manhole_series):
+		self.store = store
+		self.mod_num = mod_num
+		self.manhole_series = manhole_series
+		self._step_times = None
+
+	# step times in seconds since the epoch
+	def epoch_times(self):
+		return np.array(self.store.step_times()[0::self.mod_num])
+
+	# step times as datetimes, shared by all records
+	def step_times(self):
+		if self._step_times is None:
+			self._step_times = from_epoch(self.epoch_times())
+		return self._step_times
+
+	# series of the given records (all records if rows is None) as an array of (records x steps)
+	# name is one of volume_per_step, tss_per_step, cumulative_volume, cumulative_tss
+	def series(self, name, rows=None):
+		if name in ["cumulative_volume", "cumulative_tss"]:
+			data = self.store.series("volume_per_step" if name == "cumulative_volume" else "tss_per_step")
+			data = data if rows is None else data[rows]
+			return np.cumsum(data, axis=-1)[..., 0::self.mod_num]
+		data = self.store.series(name)
+		data = downsample(data if rows is None else data[rows], self.mod_num)
+		return np.array(data) if self.mod_num <= 1 else data	# downsampled series are new arrays already
+
+	# a single series of a record
+	def record_series(self, i, name):
+		if name == "step_times":
+			return self.step_times()
+		if name in ["volume_manhole_per_step", "tss_manhole_per_step"]:
+			return self.series(name.replace("_manhole", ""), i) if self.manhole_series[i] else None
+		return self.series(name, i)
+
+	def close(self):
+		if self.store is not None:
+			self.store.close()
+
+# lazy access to the results of a run
+# only the scalar table is loaded when opening, the series are loaded per record or per column when needed
+# the series can be downsampled by summing groups of mod_num steps, the step times and cumulative series are then taken at the first step of each group
+# the set is empty if there are no results in the folder
+# close() releases the memory mapped files of the store, call it (or use the set in a with statement) before the results are deleted
+class ResultSet:
+	def __init__(self, folder=results_folder, mod_num=1):
+		self.store = ResultStore(folder) if results_exist(folder) else None
+		self.mod_num = mod_num
+		self.records = []
+		if self.store is None:
+			self.loader = SeriesLoader(None, mod_num, [])
+			return
+		self.loader = SeriesLoader(self.store, mod_num, self.store.table["manhole_series"].tolist())
+		for i, scalars in enumerate(self.store.scalars()):
+			self.records.append(ResultRecord(self.loader, i, scalars))
+
+	def __len__(self):
+		return len(self.records)
+
+	def __iter__(self):
+		return iter(self.records)
+
+	def __getitem__(self, i):
+		return self.records[i]
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	# release the memory mapped files, the series already loaded into the records are kept
+	def close(self):
+		self.loader.close()
+
+	def epoch_times(self):
+		return self.loader.epoch_times()
+
+	def step_times(self):
+		return self.loader.step_times()
+
+	def series(self, name, rows=None):
+		return self.loader.series(name, rows)
+
+	def record_series(self, i, name):
+		return self.loader.record_series(i, name)
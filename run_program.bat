@@ -16,6 +16,12 @@ echo 4 = Maintenance
 echo 5 = Export GIS
 echo 6 = Restore all backups
 echo 7 = Delete all simulation files
+echo 8 = Treatment scenarios ^(parallel^)
+echo 9 = Simulation ^(automated, parallel^)
+echo 10 = Maintenance planning
+echo 11 = Trap placement
+echo 12 = Monte Carlo uncertainty
+echo 13 = Simulation ^(time windows, parallel^)
 echo exit = Terminate program
 echo cls = Clear terminal
 
@@ -44,15 +50,39 @@ IF %input%==6 (
 IF %input%==7 (
 	python delete_all_sim_files.py
 )
+IF %input%==8 (
+	python scenario_runner.py
+)
+IF %input%==9 (
+	python batch_simulations.py
+)
+IF %input%==10 (
+	python maintenance_planner.py
+)
+IF %input%==11 (
+	python placement_optimizer.py
+)
+IF %input%==12 (
+	python monte_carlo.py
+)
+IF %input%==13 (
+	python window_runner.py
+)
 
 IF %input%==0 (
 	echo 1. Simulation ^(automated^): Run the simulations.py file, executing various sets of simulation scenarios automatically and dynamically modifying the settings.ini file between scenarios
 	echo 2. Simulation ^(basic^): Only run the simulation scenario defined in the settings.ini file
 	echo 3. Export results: Export simulation results to excel ^(make sure that results exist^)
 	echo 4. Maintenance: Run maintenance calculations and export results to excel
-	echo 5. Export GIS: Export the SWMM parametrization into csv files that can be imported as Delimited Text Layers in QGIS
+	echo 5. Export GIS: Export the SWMM parametrization into csv files that can be imported as Delimited Text Layers in QGIS, and optionally into GeoJSON files or a GeoPackage with the removal of the inlets added if results exist ^(see gis_formats in the settings file^)
 	echo 6. Restore all backups: Restore all files into their original, and delete the backup files
-	echo 7. Delete all simulation files: Delete all files created for simulation scenarios, including temporary result files
+	echo 7. Delete all simulation files: Delete all files created for simulation scenarios, including temporary result files, checkpoints and window hotstart files
+	echo 8. Treatment scenarios ^(parallel^): Run every treatment scenario as a separate simulation with treatment added to the input file, in parallel processes, and store the results for export
+	echo 9. Simulation ^(automated, parallel^): Run the simulation scenarios of simulation_scenarios.json like option 1, but in parallel processes, each scenario in its own workspace, and merge the results into the results folder
+	echo 10. Maintenance planning: Choose the maintenance interval of each sediment trap to maximize the pollutant removal with the number of crew visits per month given in the settings file, and export the plan to excel ^(make sure that results exist^)
+	echo 11. Trap placement: Choose the inlets where the number of sediment traps given in the settings file remove the most pollutant together, taking the flow between the inlets into account, optionally verify the choice with a simulation, and export it to excel ^(make sure that results exist^)
+	echo 12. Monte Carlo uncertainty: Simulate the network many times with random buildup and washoff coefficients of the land uses, and export the mean, spread and quantiles of the pollutant load and rank of every inlet to excel
+	echo 13. Simulation ^(time windows, parallel^): Simulate the period of the settings file in time windows ^(e.g. months^) in parallel processes, each started by a warm-up run or a hotstart file, stitch the results and store them for export, optionally comparing them with a continuous run in a validation report
 )
 
 IF %input%==exit (
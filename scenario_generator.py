@@ -0,0 +1,119 @@
+
+# draws the inlet sets of the random treatment scenarios
+# all sets are drawn at once as a matrix of inlet indices (sets x samples) with a numpy random generator, so a fixed seed
+# gives the same scenarios in every run and tens of thousands of sets take no longer than a few list operations
+# the inlets are split into groups that are taken in order: preferred inlets (land use prioritization) before the others, and
+# within those the inlets with a sampling weight before the ones without, a set only holds inlets of a group when all inlets
+# of the groups before it are taken
+# within a group the inlets are drawn without replacement with probability proportional to their weight (weighted random
+# sampling by Efraimidis and Spirakis: every inlet gets the key e/weight with e exponentially distributed and the smallest keys are taken)
+
+import numpy as np
+from math import comb
+
+# sampling weight of every inlet from the sampling_weights setting
+# none = all inlets equally likely, area = catchment area of the inlet, land_use = area of the preferred land uses of the inlet
+# areas = {junction: {total: value, land_use_1: value, ...}} as returned by get_points_of_interest
+# returns the weights, or None if all inlets are equally likely
+def get_sampling_weights(settings, junctions, areas):
+	if settings["sampling_weights"] == "none":
+		return None
+	if settings["sampling_weights"] == "area":
+		return np.array([areas[j]["total"] for j in junctions], dtype=float)
+	if settings["sampling_weights"] == "land_use":
+		return np.array([sum(areas[j].get(l, 0) for l in settings["preferred_land_uses"]) for j in junctions], dtype=float)
+	raise ValueError("Unknown sampling weights: " + settings["sampling_weights"])
+
+# the groups of inlets in the order they are taken, see the top of the file
+def sampling_groups(weights, preferred):
+	groups = []
+	for p in [True, False]:
+		for w in [True, False]:
+			group = np.flatnonzero((preferred == p) & ((weights > 0) == w))
+			if len(group):
+				groups.append(group)
+	return groups
+
+# draw n_sets sets of n_samples inlets out of n_inlets
+# weights: sampling weight of every inlet (None = equal), preferred: True for the inlets taken first (None = no preference)
+# rng: numpy random generator, block_size: number of random values drawn at a time
+# returns a matrix with the inlet indices of every set (n_sets x n_samples)
+def sample_inlet_sets(n_inlets, n_samples, n_sets, rng, weights=None, preferred=None, block_size=2**22):
+	if n_samples > n_inlets or n_samples < 0:
+		raise ValueError("Sample larger than the number of inlets or negative")
+	weights = np.ones(n_inlets) if weights is None else np.asarray(weights, dtype=float)
+	preferred = np.zeros(n_inlets, dtype=bool) if preferred is None else np.asarray(preferred, dtype=bool)
+	# the groups that are taken completely are the same in every set, only the last group is drawn from
+	fixed = []
+	drawn = np.zeros(0, dtype=np.int64)
+	remaining = n_samples
+	for group in sampling_groups(weights, preferred):
+		if remaining >= len(group):
+			fixed.append(group)
+			remaining -= len(group)
+		else:
+			drawn = group
+			break
+	fixed = np.concatenate(fixed) if fixed else np.zeros(0, dtype=np.int64)
+	sets = np.empty((n_sets, n_samples), dtype=np.int64)
+	sets[:, :len(fixed)] = fixed
+	if remaining == 0:
+		return sets
+	scale = np.where(weights[drawn] > 0, weights[drawn], 1)	# inlets without weight are drawn with equal probability
+	if (scale == scale[0]).all() and remaining * remaining <= 16 * len(drawn):
+		sets[:, len(fixed):] = drawn[floyd_sample(len(drawn), remaining, n_sets, rng)]	# few samples out of many equally likely inlets
+		return sets
+	rows = max(1, block_size // len(drawn))
+	for start in range(0, n_sets, rows):
+		end = min(start + rows, n_sets)
+		keys = rng.standard_exponential((end - start, len(drawn))) / scale
+		sets[start:end, len(fixed):] = drawn[np.argpartition(keys, remaining - 1, axis=1)[:, :remaining]]
+	return sets
+
+# draw n_sets sets of n_samples out of n items with equal probability (Floyd's algorithm, one column of all sets at a time)
+# takes samples^2 instead of n steps per set, so it is faster than the keys of sample_inlet_sets for few samples out of many items
+def floyd_sample(n, n_samples, n_sets, rng):
+	sets = np.empty((n_sets, n_samples), dtype=np.int64)
+	for c, j in enumerate(range(n - n_samples, n)):
+		t = rng.integers(0, j + 1, size=n_sets)
+		taken = (sets[:, :c] == t[:, None]).any(axis=1)	# already in the set, take j instead (j is never in the set yet)
+		sets[:, c] = np.where(taken, j, t)
+	return sets
+
+# remove repeated sets, the inlets of every set are sorted and the sets are kept in the order they were drawn
+def unique_inlet_sets(sets):
+	sets = np.sort(sets, axis=1)
+	if len(sets) == 0:
+		return sets
+	first = np.unique(sets, axis=0, return_index=True)[1]
+	return sets[np.sort(first)]
+
+# number of different sets that can be drawn, see sample_inlet_sets
+def count_inlet_sets(n_inlets, n_samples, weights=None, preferred=None):
+	weights = np.ones(n_inlets) if weights is None else np.asarray(weights, dtype=float)
+	preferred = np.zeros(n_inlets, dtype=bool) if preferred is None else np.asarray(preferred, dtype=bool)
+	remaining = n_samples
+	for group in sampling_groups(weights, preferred):
+		if remaining < len(group):
+			return comb(len(group), remaining)
+		remaining -= len(group)
+	return 1
+
+# draw the inlet sets of the random scenarios
+# seed: seed of the random generator, a negative seed gives different sets in every run
+# if unique, repeated sets are drawn again (at most max_rounds times), so fewer sets are returned only if there are
+# not enough different sets
+# returns a matrix with the inlet indices of every set (sets x n_samples)
+def create_inlet_sets(n_inlets, n_samples, n_sets, seed=-1, weights=None, preferred=None, unique=True, max_rounds=10):
+	rng = np.random.default_rng(seed if seed >= 0 else None)
+	sets = sample_inlet_sets(n_inlets, n_samples, n_sets, rng, weights, preferred)
+	if not unique:
+		return sets
+	target = min(n_sets, count_inlet_sets(n_inlets, n_samples, weights, preferred))
+	sets = unique_inlet_sets(sets)
+	rounds = 1
+	while len(sets) < target and rounds < max_rounds:
+		more = sample_inlet_sets(n_inlets, n_samples, 2 * (target - len(sets)), rng, weights, preferred)
+		sets = unique_inlet_sets(np.concatenate([sets, more]))
+		rounds += 1
+	return sets[:target]
@@ -0,0 +1,209 @@
+
+# runs the treatment scenarios as separate swmm simulations in parallel processes
+# every scenario gets its own working copy of the input file, in its own temporary folder, with the treatment added
+# the system (outfall) results of each scenario are compared to the default scenario without treatment
+# and exported in the same record format as the simulation results of simulate_scenarios
+
+import sediment_traps
+# import pyswmm modules
+from pyswmm import Simulation, SystemStats
+# import utility functions
+from utilities import color_print, display_progress, stdout_redirected, format_duration
+# for capturing node values during the simulation
+from simulation_capture import NodeReader, StepCapture
+# for writing the input file of a scenario
+from inp_parser import open_inp
+# for storing the results
+from result_store import write_records
+# for parallel execution
+from concurrent.futures import ProcessPoolExecutor, as_completed
+# for the working copies
+from shutil import rmtree
+import tempfile
+import os
+import time
+from datetime import timedelta
+from numpy import cumsum
+
+# raised in a worker when a scenario runs longer than the timeout
+class ScenarioTimeout(Exception):
+	pass
+
+# a simulation of a worker process (treatment scenarios, monte carlo realizations, time windows), used in a with statement
+# the report and output files, and the edited copy of the input file, are written into a temporary folder inside work_folder
+# a failure inside the with statement is not raised, it is stored as the status of result ("failed: reason")
+# when the with statement is left the simulation is closed, the folder is deleted and the run time is added to result
+class WorkerSimulation:
+	def __init__(self, prefix, result, work_folder):
+		self.prefix = prefix
+		self.result = result
+		self.work_folder = work_folder
+		self.sim = None
+
+	def __enter__(self):
+		self.timer_start = time.time()
+		self.folder = tempfile.mkdtemp(prefix=self.prefix, dir=self.work_folder)
+		return self
+
+	def __exit__(self, exc_type, exc, traceback):
+		if exc is not None and isinstance(exc, Exception):
+			self.result["status"] = "failed: " + str(exc)
+		if self.sim is not None:
+			try:
+				self.sim.close()
+			except Exception:
+				pass
+		rmtree(self.folder, ignore_errors=True)
+		self.result["simulation_time"] = format_duration(time.time() - self.timer_start)
+		return exc is None or isinstance(exc, Exception)	# interruptions by the user are raised
+
+	# open the simulation of inp_file, edit(inp) changes a copy of the input file in the folder, None = simulate the file itself
+	def open(self, inp_file, edit=None):
+		path = os.path.join(self.folder, os.path.basename(inp_file))
+		if edit is not None:
+			inp = open_inp(inp_file)	# the input file is parsed once per worker process, see inp_parser.read_inp
+			edit(inp)
+			inp.save(path)
+		with stdout_redirected():
+			self.sim = Simulation(path if edit is not None else inp_file, reportfile=path.replace(".inp", ".rpt"), outputfile=path.replace(".inp", ".out"))
+		return self.sim
+
+	# run the simulation and capture every step, times are given in seconds from period_start
+	# the steps up to capture_start are not captured (e.g. a warm-up), on_step(sim) is called before capturing each step
+	# timeout: maximum run time of the worker in seconds, 0 = no limit, ScenarioTimeout is raised when exceeded
+	def run(self, capture, period_start, timeout=0, capture_start=None, on_step=None):
+		for step in self.sim:
+			current_time = (self.sim.current_time - period_start).total_seconds()
+			if on_step is not None:
+				on_step(self.sim)
+			if capture_start is None or current_time > capture_start:
+				capture.capture(current_time)
+			if timeout and time.time() - self.timer_start > timeout:
+				raise ScenarioTimeout("exceeded the timeout of " + str(timeout) + " seconds")
+
+# run a single treatment scenario, executed in a worker process
+# the input file with the treatment is written into a temporary folder inside work_folder, which is deleted afterwards
+# returns the system results of the scenario, or the reason of the failure
+def run_treatment_scenario(index, inp_file, treatment, settings, work_folder, timeout=0):
+	result = {"index": index, "nodes": list(treatment), "status": "complete"}
+	with WorkerSimulation("scenario_" + str(index) + "_", result, work_folder) as worker:
+		sim = worker.open(inp_file, lambda inp: sediment_traps.add_treatment(inp, treatment))
+		sim.start_time, sim.end_time = sediment_traps.get_simulation_period(settings)
+		start_time = sim.start_time
+		system_routing = SystemStats(sim)
+		capture = StepCapture(NodeReader(sim, [settings["outfall_node"]], settings["pollutant"]), 1000, sediment_traps.get_report_step(settings))
+		worker.run(capture, start_time, timeout)
+		block_times, blocks = capture.finish((sim.end_time - start_time).total_seconds())
+		result["start"] = sim.start_time
+		result["end"] = sim.end_time
+		result["step_times"] = [start_time + timedelta(seconds=t) for t in block_times]
+		result["volume_per_step"] = list(blocks["volume_total_inflow"][:, 0])
+		result["tss_per_step"] = list(blocks["pollutant_load"][:, 0])
+		result["total_volume"] = capture.totals["volume_total_inflow"][0]
+		result["total_TSS_system"] = capture.totals["pollutant_load"][0]
+		result["flow_error"] = system_routing.routing_stats["routing_error"]
+		result["quality_error"] = sim.quality_error
+	return result
+
+# run all treatment scenarios in a process pool
+# processes: maximum number of worker processes (0 = number of cpus), never more than the number of scenarios
+# timeout: maximum run time of a single scenario in seconds (0 = no limit)
+# returns the scenario results in the order of the scenarios
+def run_scenarios_parallel(inp_file, treatment_scenarios, settings, processes=0, timeout=0, work_folder="temp"):
+	if not os.path.isdir(work_folder): os.mkdir(work_folder)
+	processes = processes if processes > 0 else (os.cpu_count() or 1)
+	processes = max(1, min(processes, len(treatment_scenarios)))
+	print("\nRunning " + str(len(treatment_scenarios)) + " scenarios in " + str(processes) + " processes...")
+	results = [None] * len(treatment_scenarios)
+	display_progress(0)
+	with ProcessPoolExecutor(max_workers=processes) as executor:
+		futures = [executor.submit(run_treatment_scenario, i, os.path.abspath(inp_file), treatment_scenarios[i], settings, os.path.abspath(work_folder), timeout) for i in range(len(treatment_scenarios))]
+		done = 0
+		for future in as_completed(futures):
+			try:
+				result = future.result()
+			except Exception as e:	# the worker process itself failed
+				i = futures.index(future)
+				result = {"index": i, "nodes": list(treatment_scenarios[i]), "status": "failed: " + str(e), "simulation_time": format_duration(0)}
+			results[result["index"]] = result
+			done += 1
+			display_progress(done/len(futures))
+	failed = [r for r in results if r["status"] != "complete"]
+	if failed:
+		color_print("\n" + str(len(failed)) + " scenarios failed", "red")
+		for r in failed:
+			color_print("Scenario " + str(r["index"]) + " (" + ", ".join(r["nodes"]) + "): " + r["status"], "red")
+	else:
+		color_print("\nComplete", "green")
+	return results
+
+# convert the scenario results into simulation result records, relative to the default scenario (the first one)
+# removal is the reduction of the pollutant load at the outfall compared to the default scenario
+# areas = {junction_1: {total: value, land_use_1: value, ...}, ...} in ha, see get_points_of_interest
+def get_scenario_records(results, areas, landuses):
+	baseline = results[0]
+	records = []
+	for result in results:
+		if result["status"] != "complete" or baseline["status"] != "complete":
+			continue
+		nodes = result["nodes"] if result["nodes"] else ["system"]
+		area_covered = {"total": 0}	# area in m2
+		for landuse in landuses:
+			area_covered[landuse] = 0
+		for node in result["nodes"]:
+			for a in areas.get(node, {}):
+				area_covered[a] += areas[node][a] * 10**4
+		removal = baseline["total_TSS_system"] - result["total_TSS_system"]
+		records.append({"start": result["start"], \
+						"end": result["end"], \
+						"simulation_time": result["simulation_time"], \
+						"nodes": nodes, \
+						"total_volume": result["total_volume"], \
+						"flow_error": result["flow_error"], \
+						"total_TSS": baseline["total_TSS_system"], \
+						"total_TSS_system": result["total_TSS_system"], \
+						"quality_error": result["quality_error"], \
+						"removal_mass": removal, \
+						"removal_percent": 0 if baseline["total_TSS_system"] == 0 else removal / baseline["total_TSS_system"] * 100, \
+						"removal_per_area": 0 if area_covered["total"] == 0 else removal / area_covered["total"], \
+						"step_times": result["step_times"], \
+						"volume_per_step": result["volume_per_step"], \
+						"tss_per_step": result["tss_per_step"], \
+						"cumulative_volume": cumsum(result["volume_per_step"]), \
+						"cumulative_tss": cumsum(result["tss_per_step"]), \
+						"area_covered": area_covered, \
+						"area_covered_total": area_covered["total"], \
+						"volume_manhole_per_step": None, \
+						"tss_manhole_per_step": None})
+	return records
+
+# prepare the input file, create the treatment scenarios and run them in parallel
+# the records replace the simulation results in the result store, so they can be exported with export_results
+def run_treatment_scenarios(settings_file="settings.ini"):
+
+	# needed for colored print to work
+	os.system("")
+
+	print("\nReading data from settings file...")
+	settings = sediment_traps.read_settings(settings_file)
+	color_print("Complete", "green")
+
+	data = sediment_traps.prepare_input_file(settings)
+	color_print("Complete", "green")
+	treatment_scenarios = sediment_traps.create_treatment_scenarios(settings, data["junctions_with_manholes"], data["junction_coverages"], data["junction_areas"])
+
+	total_sim_time_start = time.time()
+	results = run_scenarios_parallel(settings["input_file"], treatment_scenarios, settings, settings["parallel_processes"], settings["scenario_timeout"])
+	records = get_scenario_records(results, data["junction_areas"], data["junction_coverages"].keys())
+	if not records:
+		color_print("No results, the default scenario without treatment failed", "red")
+		return
+
+	print("\nExporting simulation results")
+	write_records(records)
+	color_print("\nComplete", "green")
+	print("\nTotal simulation time: " + format_duration(time.time() - total_sim_time_start))
+
+if __name__ == "__main__":
+	run_treatment_scenarios()
+	print("\nProgram terminated")
@@ -4,18 +4,22 @@ IMPORT PACKAGES
 '''
 
 # import pyswmm modules
-from pyswmm import Simulation, Nodes, SystemStats
+from pyswmm import Simulation, SystemStats
 # import utility functions
-from utilities import progressbar_simple, progressbar, display_progress, color_print, get_yes_no, suppress_stdout, nostdout, stdout_redirected, write_iterable, print_iterable
+from utilities import progressbar_simple, progressbar, display_progress, color_print, get_yes_no, suppress_stdout, nostdout, stdout_redirected, write_iterable, print_iterable, time_to_seconds
+# for reading and writing the input file
+from inp_parser import load_inp, open_inp, close_inp
+# for resolving the network upstream of the inlets
+from network_topology import NetworkTopology, resolve_subcatchment_outlets, routing_matrix, local_loads
 # for data export
 from pandas import DataFrame, ExcelWriter
 # for making backup copy
 from shutil import copy2
 from pathlib import Path
-# for randomness
-import random
 # for colored print
 import os
+# for replacing values in the input file
+import re
 # for getting duration of simulations
 from datetime import datetime, timedelta
 import time
@@ -24,12 +28,19 @@ from numpy import cumsum, mean
 # general numpy stuff
 import numpy as np
 # for temporary export
-import pickle
-# for finding simulation results
-from os import listdir
-from os.path import isfile, join
-# for making deep copies
-import copy
+from result_store import write_records, delete_results, ResultSet
+# for calculating the maintenance of the sediment traps
+from maintenance_engine import maintenance_removal, maintenance_sweep
+# for drawing the random treatment scenarios
+from scenario_generator import get_sampling_weights, create_inlet_sets
+# for caching the points of interest of the input file
+from topology_cache import cached_points_of_interest
+# for exporting the gis layers
+from gis_writers import CsvLayerWriter, GeoJsonLayerWriter, GeoPackage
+# for resuming interrupted simulations
+from checkpoint import checkpoint_key, save_checkpoint, read_checkpoint, delete_checkpoint
+# for capturing node values during the simulation
+from simulation_capture import NodeReader, StepCapture, CapturePlan, node_indices
 
 # pyswmm documentation at
 # https://pyswmm.readthedocs.io/en/stable/reference/index.html
@@ -38,375 +49,347 @@ import copy
 DEFINE FUNCTIONS
 '''
 
+# sections of the input file holding links between nodes
+link_sections = ["CONDUITS", "PUMPS", "ORIFICES", "WEIRS", "OUTLETS"]
+# slope used for conduits without a downward slope when comparing capacities
+min_capacity_slope = 0.0001
+
+# full flow capacity of a conduit with Manning's equation, without the unit factor that is the same for all conduits
+# returns None for shapes without a simple full flow cross section
+def conduit_capacity(shape, geom1, geom2, roughness, slope, barrels=1):
+	if shape == "CIRCULAR":
+		area = np.pi * geom1**2 / 4
+		radius = geom1 / 4
+	elif shape == "RECT_CLOSED":
+		area = geom1 * geom2
+		radius = area / (2 * geom1 + 2 * geom2) if area > 0 else 0
+	elif shape == "RECT_OPEN":
+		area = geom1 * geom2
+		radius = area / (2 * geom1 + geom2) if area > 0 else 0
+	else:
+		return None
+	if area <= 0 or roughness <= 0:
+		return None
+	return barrels * area * radius**(2/3) * max(slope, min_capacity_slope)**0.5 / roughness
+
+# fractions of the outflow of the nodes splitting their flow, in proportion to the full flow capacity of the outgoing conduits
+# flow dividers are included, their diversion rule depends on the flow and is approximated by the capacities as well
+# links = {link_1: {from: junction_1, to: junction_2}, link_2: ...} of all link types, topology: NetworkTopology of the links
+# returns {node: {downstream node: fraction}} and the splitting nodes with an outgoing link without capacity (pumps,
+# orifices, weirs, outlets, other shapes), which are split equally
+def get_split_fractions(inp, links, topology):
+	offsets_as_elevation = any(temp[0].upper() == "LINK_OFFSETS" and temp[1].upper() == "ELEVATION" for temp in inp.records("OPTIONS"))
+	elevations = {}
+	for section in ["JUNCTIONS", "OUTFALLS", "DIVIDERS", "STORAGE"]:
+		for temp in inp.records(section):
+			elevations[temp[0]] = temp[1]
+	conduits = {temp[0]: temp for temp in inp.records("CONDUITS")}
+	xsections = {temp[0]: temp for temp in inp.records("XSECTIONS")}
+	outgoing = {}	# {node: [link_1, link_2, ...]}
+	for l in links:
+		outgoing.setdefault(links[l]["from"], []).append(l)
+	split_fractions = {}
+	equal_splits = []
+	for node in topology.dividers:
+		if len(topology.downstream[node]) < 2:
+			continue
+		capacities = {}	# {downstream node: capacity}
+		for l in outgoing[node]:
+			capacity = None
+			if l in conduits and l in xsections:
+				try:
+					temp = conduits[l]
+					from_node, to_node, length, roughness = temp[1], temp[2], float(temp[3]), float(temp[4])
+					in_offset = float(temp[5]) if len(temp) > 5 else 0
+					out_offset = float(temp[6]) if len(temp) > 6 else 0
+					if offsets_as_elevation:
+						drop = in_offset - out_offset
+					else:
+						drop = float(elevations[from_node]) + in_offset - float(elevations[to_node]) - out_offset
+					x = xsections[l]
+					capacity = conduit_capacity(x[1].upper(), float(x[2]), float(x[3]) if len(x) > 3 else 0, roughness, drop / length if length > 0 else 0, float(x[6]) if len(x) > 6 else 1)
+				except (ValueError, KeyError):	# missing values or elevations
+					capacity = None
+			if capacity is None:
+				capacities = None
+				break
+			capacities[links[l]["to"]] = capacities.get(links[l]["to"], 0) + capacity
+		if capacities is None:
+			equal_splits.append(node)
+			continue
+		total = sum(capacities.values())
+		split_fractions[node] = {n: capacities[n] / total for n in capacities}
+	return split_fractions, equal_splits
+
 # identify nodes and subcatchments of interest
 # the input file is parsed and information stored in dict/list objects
 # returns a dict object containing these dict/list objects
 def get_points_of_interest(input_file):
-	with open(input_file, "r") as f:
-		lines = f.readlines()
-		lines = [lines[x].rstrip() for x in range(len(lines))]	# remove new line characters
-		# read subcatchment data
-		subcatchments = {}	# {subcatchment_1: {outlet: junction/subcatchment, area: value}, subcatchment_2: ...}
-		if "[SUBCATCHMENTS]" in lines:
-			sub = []
-			i = 0
-			while lines[i] != "[SUBCATCHMENTS]":
-				i += 1
-			i += 1
-			while lines[i] != "":
-				if ";" not in lines[i]: sub.append(lines[i])
-				i += 1
-			for line in sub:
-				temp = [x for x in line.split(" ") if x != ""]
-				subcatchments[temp[0]] = {}
-				subcatchments[temp[0]]["outlet"] = temp[2]
-				subcatchments[temp[0]]["area"] = temp[3]
-		# read junction data
-		junctions = {}	# {junction_1: {}, junction_2: ...}
-		if "[JUNCTIONS]" in lines:
-			junc = []
-			i = 0
-			while lines[i] != "[JUNCTIONS]":
-				i += 1
-			i += 1
-			while lines[i] != "":
-				if ";" not in lines[i]: junc.append(lines[i])
-				i += 1
-			for line in junc:
-				temp = [x for x in line.split(" ") if x != ""]
-				junctions[temp[0]] = {}
-		# read conduit data
-		conduits = {}	# {conduit_1: {from: junction_1, to: junction_2}, conduit_2: ...}
-		if "[CONDUITS]" in lines:
-			cond = []
-			i = 0
-			while lines[i] != "[CONDUITS]":
-				i += 1
-			i += 1
-			while lines[i] != "":
-				if ";" not in lines[i]: cond.append(lines[i])
-				i += 1
-			for line in cond:
-				temp = [x for x in line.split(" ") if x != ""]
-				conduits[temp[0]] = {}
-				conduits[temp[0]]["from"] = temp[1]
-				conduits[temp[0]]["to"] = temp[2]
-		# read land use data
-		landuses = []	# [land_use_1, land_use_2, ...]
-		if "[LANDUSES]" in lines:
-			lu = []
-			i = 0
-			while lines[i] != "[LANDUSES]":
-				i += 1
-			i += 1
-			while lines[i] != "":
-				if ";" not in lines[i]: lu.append(lines[i])
-				i += 1
-			for line in lu:
-				temp = [x for x in line.split(" ") if x != ""]
-				if temp[0] not in landuses:
-					landuses.append(temp[0])
-		# read coverage data to determine land uses
-		coverages = {}	# {subcatchment_1: {land_use_1: value, land_use_2: value, ...}, subcatchment_2: ...}
-		if "[COVERAGES]" in lines:
-			cov = []
-			i = 0
-			while lines[i] != "[COVERAGES]":
-				i += 1
-			i += 1
-			while lines[i] != "":
-				if ";" not in lines[i]: cov.append(lines[i])
-				i += 1
-			for line in cov:
-				temp = [x for x in line.split(" ") if x != ""]
-				if temp[0] not in coverages.keys():
-					coverages[temp[0]] = {}
-				coverages[temp[0]][temp[1]] = temp[2]
-		# find subcatchments leading into junctions/nodes
-		sub_of_int = []	# [subcatchment_1, subcatchment_2, ...]
-		for s in subcatchments:
-			if subcatchments[s]["outlet"] not in subcatchments.keys():
-				sub_of_int.append(s)
-		# find junctions that have incoming flow from subcatchments, i.e. inlets
-		junc_of_int = []	# [junction_1, junction_2, ...]
-		for s in sub_of_int:
-			if subcatchments[s]["outlet"] not in junc_of_int:	# avoid duplicates
-				junc_of_int.append(subcatchments[s]["outlet"])
-		junc_inlets = {}	# {junction_1: [subcatchment_1, subcatchment_2, ...]}
-		# find which subcatchments' runoff leads to which inlet
-		sub_copy = copy.deepcopy(subcatchments)
-		sub_copy_copy = [s for s in sub_of_int]
-		categorised_all_subcatchments = False
-		while not categorised_all_subcatchments:
-			categorised_all_subcatchments = True
-			for s in sub_copy:
-				if s not in sub_copy_copy:
-					categorised_all_subcatchments = False
-					if sub_copy[s]["outlet"] in sub_copy_copy:
-						sub_copy[s]["outlet"] = sub_copy[sub_copy[s]["outlet"]]["outlet"]
-						sub_copy_copy.append(s)
-		for j in junc_of_int:
-			junc_inlets[j] = [s for s in sub_copy_copy if j == sub_copy[s]["outlet"]]
-		# find junctions that have both incoming flow from subcatchments and other junctions and need to be separated
-		junc_to_mod = []	# [junction_1, junction_2, ...]
-		for c in conduits:
-			if conduits[c]["to"] in junc_of_int and conduits[c]["to"] not in junc_to_mod:
-				junc_to_mod.append(conduits[c]["to"])
-		# find inlets which receive water from other inlets, requires model to not have divider junctions that split water
-		upstream_inlets = {}	# {inlet: [inlet_1, inlet_2, ...]}
-		for j in junc_of_int:
-			upstream_nodes = get_upstream_nodes(j, conduits)
-			upstream_inlets[j] = [x for x in upstream_nodes if x in junc_of_int]
-		for inlet in upstream_inlets:	# for every inlet in the system
-			for upstream_inlet in upstream_inlets[inlet]:	# for every inlet upstream of the inlet
-				if len(upstream_inlets[upstream_inlet]) > 0:	# if the upstream inlet has other inlets upstream of it
-					for x in upstream_inlets[upstream_inlet]:	# for each of those inlets
-						upstream_inlets[inlet].remove(x)	# remove them from the original inlet's list of usptream inlets
-		# find junctions that have incoming flow from different land uses
-		cov_of_int = {}	# {subcatchment_1: {land_use_1: value, land_use_2: value, ...}, subcatchment_2: ...}
-		for s in coverages:
-			if s in sub_of_int:
-				cov_of_int[s] = coverages[s]
-		junc_cov = {}	# {land_use_1: [junction_1, junction_2, ...], land_use_2: ...}
-		for landuse in landuses:
-			junc_cov[landuse] = []
-			for subcatchment in cov_of_int:
-				if landuse in cov_of_int[subcatchment].keys() and subcatchments[subcatchment]["outlet"] not in junc_cov[landuse]:
-					junc_cov[landuse].append(subcatchments[subcatchment]["outlet"])
-		# find area of each land use contributing to catchment area going into each junction
-		junc_area = {}	# {junction_1: {total: value, land_use_1: value, land_use_2: value, ...}, junction_2: ...}
-		for j in junc_of_int:
-			junc_area[j] = {"total": 0}
-			for l in landuses:
-				junc_area[j][l] = 0
-			for s in junc_inlets[j]:
-				for c in coverages[s]:
-					junc_area[j][c] += float(coverages[s][c]) / 100 * float(subcatchments[s]["area"])
-					junc_area[j]["total"] += float(coverages[s][c]) / 100 * float(subcatchments[s]["area"])
-		return {"junctions_with_manholes": junc_of_int, "junctions_to_modify": junc_to_mod, "junction_coverages": junc_cov, "junction_areas": junc_area, "upstream_inlets": upstream_inlets}
+	inp = load_inp(input_file)	# input_file can be a path, a document or an already parsed index
+	# read subcatchment data
+	subcatchments = {}	# {subcatchment_1: {outlet: junction/subcatchment, area: value}, subcatchment_2: ...}
+	for temp in inp.records("SUBCATCHMENTS"):
+		subcatchments[temp[0]] = {}
+		subcatchments[temp[0]]["outlet"] = temp[2]
+		subcatchments[temp[0]]["area"] = temp[3]
+	# read junction data
+	junctions = {}	# {junction_1: {}, junction_2: ...}
+	for temp in inp.records("JUNCTIONS"):
+		junctions[temp[0]] = {}
+	# read conduit data
+	conduits = {}	# {conduit_1: {from: junction_1, to: junction_2}, conduit_2: ...}
+	for temp in inp.records("CONDUITS"):
+		conduits[temp[0]] = {}
+		conduits[temp[0]]["from"] = temp[1]
+		conduits[temp[0]]["to"] = temp[2]
+	# read link data of all link types, the network topology follows every link
+	links = {}	# {link_1: {from: junction_1, to: junction_2}, link_2: ...}
+	for section in link_sections:
+		for temp in inp.records(section):
+			links[temp[0]] = {"from": temp[1], "to": temp[2]}
+	# read land use data
+	landuses = []	# [land_use_1, land_use_2, ...]
+	for temp in inp.records("LANDUSES"):
+		if temp[0] not in landuses:
+			landuses.append(temp[0])
+	# read coverage data to determine land uses
+	coverages = {}	# {subcatchment_1: {land_use_1: value, land_use_2: value, ...}, subcatchment_2: ...}
+	for temp in inp.records("COVERAGES"):
+		if temp[0] not in coverages.keys():
+			coverages[temp[0]] = {}
+		coverages[temp[0]][temp[1]] = temp[2]
+	# find subcatchments leading into junctions/nodes
+	sub_of_int = []	# [subcatchment_1, subcatchment_2, ...]
+	for s in subcatchments:
+		if subcatchments[s]["outlet"] not in subcatchments.keys():
+			sub_of_int.append(s)
+	# find junctions that have incoming flow from subcatchments, i.e. inlets
+	junc_of_int = []	# [junction_1, junction_2, ...]
+	inlet_set = set()
+	for s in sub_of_int:
+		if subcatchments[s]["outlet"] not in inlet_set:	# avoid duplicates
+			junc_of_int.append(subcatchments[s]["outlet"])
+			inlet_set.add(subcatchments[s]["outlet"])
+	# find which subcatchments' runoff leads to which inlet, raises RoutingCycleError if subcatchments route in a loop
+	sub_outlets = resolve_subcatchment_outlets(subcatchments)	# {subcatchment_1: junction_1, subcatchment_2: ...}
+	junc_inlets = {j: [] for j in junc_of_int}	# {junction_1: [subcatchment_1, subcatchment_2, ...]}
+	for s in sub_outlets:
+		junc_inlets[sub_outlets[s]].append(s)
+	# find junctions that have both incoming flow from subcatchments and other junctions and need to be separated
+	junc_to_mod = []	# [junction_1, junction_2, ...]
+	for c in conduits:
+		if conduits[c]["to"] in inlet_set and conduits[c]["to"] not in junc_to_mod:
+			junc_to_mod.append(conduits[c]["to"])
+	# find inlets which receive water from other inlets
+	topology = NetworkTopology(links, [temp[0] for temp in inp.records("DIVIDERS")])
+	warnings = []	# printed again when the data is read from the topology cache
+	if topology.cycles:
+		warnings.append("Cyclic routing between nodes: " + "; ".join([", ".join(cycle) for cycle in topology.cycles]))
+	split_fractions, equal_splits = get_split_fractions(inp, links, topology)
+	if split_fractions:
+		warnings.append("Flow splits at nodes, the loads of the upstream inlets are divided by the full flow capacity of the outgoing conduits: " + ", ".join(split_fractions))
+	if equal_splits:
+		warnings.append("Flow splits at nodes without the capacity of all outgoing links, the loads of the upstream inlets are divided equally: " + ", ".join(equal_splits))
+	for warning in warnings:
+		color_print(warning, "yellow")
+	upstream_inlets = topology.nearest_upstream_inlets(junc_of_int)	# {inlet: [inlet_1, inlet_2, ...]}
+	inlet_routing = topology.inlet_routing(junc_of_int, split_fractions)	# {inlet: {inlet_1: fraction, inlet_2: ...}}
+	# find junctions that have incoming flow from different land uses
+	sub_of_int_set = set(sub_of_int)
+	cov_of_int = {}	# {subcatchment_1: {land_use_1: value, land_use_2: value, ...}, subcatchment_2: ...}
+	for s in coverages:
+		if s in sub_of_int_set:
+			cov_of_int[s] = coverages[s]
+	junc_cov = {}	# {land_use_1: [junction_1, junction_2, ...], land_use_2: ...}
+	for landuse in landuses:
+		junc_cov[landuse] = []
+		added = set()
+		for subcatchment in cov_of_int:
+			if landuse in cov_of_int[subcatchment].keys() and subcatchments[subcatchment]["outlet"] not in added:
+				junc_cov[landuse].append(subcatchments[subcatchment]["outlet"])
+				added.add(subcatchments[subcatchment]["outlet"])
+	# find area of each land use contributing to catchment area going into each junction
+	junc_area = {}	# {junction_1: {total: value, land_use_1: value, land_use_2: value, ...}, junction_2: ...}
+	for j in junc_of_int:
+		junc_area[j] = {"total": 0}
+		for l in landuses:
+			junc_area[j][l] = 0
+		for s in junc_inlets[j]:
+			for c in coverages[s]:
+				junc_area[j][c] += float(coverages[s][c]) / 100 * float(subcatchments[s]["area"])
+				junc_area[j]["total"] += float(coverages[s][c]) / 100 * float(subcatchments[s]["area"])
+	return {"junctions_with_manholes": junc_of_int, "junctions_to_modify": junc_to_mod, "junction_coverages": junc_cov, "junction_areas": junc_area, "upstream_inlets": upstream_inlets, "inlet_routing": inlet_routing, "warnings": warnings}
+
+# identify nodes and subcatchments of interest, from the topology cache if the input file was parsed before
+# the size of the cache is set in the settings file
+def get_points_of_interest_cached(input_file, settings):
+	return cached_points_of_interest(input_file, get_points_of_interest, settings["topology_cache_size"])
 
 # get nodes upstream of node
 def get_upstream_nodes(node, conduits):
-	upstream_nodes = []
-	direct_upstream_nodes = []
-	for c in conduits:
-		if node == conduits[c]["to"]:
-			direct_upstream_nodes.append(conduits[c]["from"])
-	for upstream_node in direct_upstream_nodes:
-		upstream_nodes.append(upstream_node)
-		upstream_nodes += get_upstream_nodes(upstream_node, conduits)
-	return upstream_nodes
+	return NetworkTopology(conduits).upstream_nodes(node)
 
 # get immediate upstream nodes of node
 def get_immediate_upstream_nodes(node, conduits):
-	direct_upstream_nodes = []
-	for c in conduits:
-		if node == conduits[c]["to"]:
-			direct_upstream_nodes.append(conduits[c]["from"])
-	return direct_upstream_nodes
+	return NetworkTopology(conduits).immediate_upstream_nodes(node)
+
+# replace the token at position (0 = first) of an input file line, keeping the spacing of the other columns
+def replace_token(line, position, value):
+	spans = [m.span() for m in re.finditer(r"\S+", line)]
+	start, end = spans[position]
+	return line[:start] + value + line[end:]
+
+# append the suffix to the tokens of a line that are in names (a set), other tokens are never changed, even if they contain a name
+def rename_tokens(line, names, suffix):
+	if names.isdisjoint(line.split()):
+		return line
+	return re.sub(r"\S+", lambda m: m.group(0)+suffix if m.group(0) in names else m.group(0), line)
+
+# check that a line was only changed by appending the suffix to whole tokens that are in names
+def renamed_tokens_only(old_line, new_line, names, suffix):
+	old_tokens = old_line.split()
+	new_tokens = new_line.split()
+	if len(old_tokens) != len(new_tokens):
+		return False
+	return all(n == o or (o in names and n == o+suffix) for o, n in zip(old_tokens, new_tokens))
 
 # create new junctions to separate incoming flow from subcatchments and other junctions
+# the new junctions, conduits, cross-sections and coordinates are built from the indexed sections, the inlets without incoming
+# conduits are renamed wherever they appear as a whole token, and the new lines are emitted in a single sweep
 # returns a list with the new nodes representing manholes (+ the old nodes which were only manholes and not junctions)
 def separate_junctions(input_file, data, settings):
 	print("\nSeparating junctions...")
 	try:
 		suffix = settings["junction_suffix"]
-		junc_to_mod = data["junctions_to_modify"]
-		with open(input_file, "r") as f:
-			lines = f.readlines()
-			lines = [lines[x].rstrip() for x in range(len(lines))]	# remove new line characters
-			if "[SUBCATCHMENTS]" in lines:
-				i = 0
-				while lines[i] != "[SUBCATCHMENTS]":
-					i += 1
-				i += 1
-				while lines[i] != "":
-					if ";" not in lines[i]:
-						temp = [x for x in lines[i].split(" ") if x != ""]
-						if temp[2] in junc_to_mod:
-							lines[i] = lines[i].replace(temp[2], temp[2]+suffix)	# replace outlet with new junction
-					i += 1
-			if "[JUNCTIONS]" in lines:
-				i = 0
-				while lines[i] != "[JUNCTIONS]":
-					i += 1
-				i += 1
-				while lines[i] != "":
-					if ";" not in lines[i]:
-						temp = [x for x in lines[i].split(" ") if x != ""]
-						if temp[0] in junc_to_mod:
-							height_offset = settings["height_offset"]	# define an elevation drop to avoid errors
-							exp_factor = 10**6	# used for removing inaccuracy of float addition
-							lines.insert(i, lines[i].replace(temp[0], temp[0]+suffix).replace(temp[1], str((float(temp[1])*exp_factor+height_offset*exp_factor)/exp_factor)))	# create new junction based on the existing one
-							i += 1
-					i += 1
-			if "[CONDUITS]" in lines:
-				i = 0
-				while lines[i] != "[CONDUITS]":
-					i += 1
-				i += 1
-				linked_junctions = []
-				ref_conduits = []
-				while lines[i] != "":
-					if ";" not in lines[i]:
-						temp = [x for x in lines[i].split(" ") if x != ""]
-						if temp[2] in junc_to_mod and temp[2] not in linked_junctions:
-							conduit_length = settings["conduit_length"]	# give the conduit a length to avoid errors
-							lines.insert(i, lines[i].replace(temp[0], temp[0]+suffix).replace(temp[1], temp[2]+suffix).replace(temp[3], str(conduit_length)))	# create new conduit, make its source the new junction and change it's length to 0 (since it is in the same spot)
-							linked_junctions.append(temp[2])	# add to list of linked junctions to avoid duplicates
-							ref_conduits.append(temp[0])	# add to list of conduits used as reference
-							i += 1
-					i += 1
-			if "[XSECTIONS]" in lines:
-				i = 0
-				while lines[i] != "[XSECTIONS]":
-					i += 1
-				i += 1
-				while lines[i] != "":
-					if ";" not in lines[i]:
-						temp = [x for x in lines[i].split(" ") if x != ""]
-						if temp[0] in ref_conduits:
-							lines.insert(i, lines[i].replace(temp[0], temp[0]+suffix))	# add new conduit cross-section
-							i += 1
-					i += 1
-			if "[COORDINATES]" in lines:
-				i = 0
-				while lines[i] != "[COORDINATES]":
-					i += 1
-				i += 1
-				while lines[i] != "":
-					if ";" not in lines[i]:
-						temp = [x for x in lines[i].split(" ") if x != ""]
-						if temp[0] in junc_to_mod:
-							coord_offset = settings["coord_offset"]
-							lines.insert(i, lines[i].replace(temp[0], temp[0]+suffix).replace(temp[1], str(float(temp[1])+coord_offset)).replace(temp[2], str(float(temp[2])+coord_offset)))	# add new coordinates
-							i += 1
-					i += 1
-			junc_of_int = []
-			for node in data["junctions_with_manholes"]:
-				if node not in junc_to_mod:
-					junc_of_int.append(node)
-			for i in range(len(lines)):
-				for node in junc_of_int:
-					for e in lines[i].split(" "):
-						if e == node:
-							lines[i] = lines[i].replace(node, node+suffix)
-		with open(input_file, "w") as f:
-			for line in lines:
-				f.write("%s\n" % line)
-		new_junctions = [x.replace(x, x+suffix) for x in data["junctions_with_manholes"]]	# modified junctions to return
+		junc_to_mod = set(data["junctions_to_modify"])
+		inp = open_inp(input_file)
+		lines = inp.lines
+		changed = {}	# {line index: changed line}
+		for i, temp in inp.rows("SUBCATCHMENTS"):
+			if temp[2] in junc_to_mod:
+				changed[i] = replace_token(lines[i], 2, temp[2]+suffix)	# replace outlet with new junction
+		inserted = {}	# {line index: [new lines to insert before it]}
+		height_offset = settings["height_offset"]	# define an elevation drop to avoid errors
+		exp_factor = 10**6	# used for removing inaccuracy of float addition
+		for i, temp in inp.rows("JUNCTIONS"):
+			if temp[0] in junc_to_mod:
+				elevation = str((float(temp[1])*exp_factor+height_offset*exp_factor)/exp_factor)
+				inserted.setdefault(i, []).append(replace_token(replace_token(lines[i], 0, temp[0]+suffix), 1, elevation))	# create new junction based on the existing one
+		linked_junctions = set()
+		ref_conduits = set()
+		conduit_length = str(settings["conduit_length"])	# give the conduit a length to avoid errors
+		for i, temp in inp.rows("CONDUITS"):
+			if temp[2] in junc_to_mod and temp[2] not in linked_junctions:
+				inserted.setdefault(i, []).append(replace_token(replace_token(replace_token(lines[i], 0, temp[0]+suffix), 1, temp[2]+suffix), 3, conduit_length))	# create new conduit, make its source the new junction and change it's length to 0 (since it is in the same spot)
+				linked_junctions.add(temp[2])	# add to set of linked junctions to avoid duplicates
+				ref_conduits.add(temp[0])	# add to set of conduits used as reference
+		for i, temp in inp.rows("XSECTIONS"):
+			if temp[0] in ref_conduits:
+				inserted.setdefault(i, []).append(replace_token(lines[i], 0, temp[0]+suffix))	# add new conduit cross-section
+		coord_offset = settings["coord_offset"]
+		for i, temp in inp.rows("COORDINATES"):
+			if temp[0] in junc_to_mod:
+				inserted.setdefault(i, []).append(replace_token(replace_token(replace_token(lines[i], 0, temp[0]+suffix), 1, str(float(temp[1])+coord_offset)), 2, str(float(temp[2])+coord_offset)))	# add new coordinates
+		# inlets that are only manholes are renamed everywhere
+		junc_of_int = set(data["junctions_with_manholes"]) - junc_to_mod
+		new_lines = []
+		for i in range(len(lines)):
+			for line in inserted.get(i, []):
+				new_lines.append(rename_tokens(line, junc_of_int, suffix))
+			line = changed.get(i, lines[i])
+			new_line = rename_tokens(line, junc_of_int, suffix)
+			if new_line is not line and not renamed_tokens_only(line, new_line, junc_of_int, suffix):
+				raise ValueError("Line " + str(i+1) + " changed by more than renaming inlets: " + lines[i])
+			new_lines.append(new_line)
+		inp.replace_lines(0, len(lines), new_lines)
+		close_inp(input_file, inp)
+		new_junctions = [x+suffix for x in data["junctions_with_manholes"]]	# modified junctions to return
 		color_print("Complete", "green")
 		return new_junctions
-	except:
+	except Exception as e:
 		color_print("Could not separate junctions", "red")
+		color_print(str(e), "red")
 		return []
 
 # add treatment to nodes in the input file
 # nodes = {node: {"pollutant": , "function": }}
 # remove_old determines if the already existing treatment in the input file should be removed
 def add_treatment(input_file, nodes, remove_old=True):
-	with open(input_file, "r") as f:
-		lines = f.readlines()
-		lines = [lines[x].rstrip() for x in range(len(lines))]	# remove new line characters
-		if "[TREATMENT]" not in lines:
-			if "[WASHOFF]" in lines:
-				i = 0
-				while lines[i] != "[WASHOFF]":
-					i += 1
-				i += 1
-				while lines[i] != "":
-					i += 1
-				i += 1
-				lines.insert(i, "[TREATMENT]")	# insert the treatment category
-				i += 1
-				lines.insert(i, ";;Node           Pollutant        Function  ")
-				i += 1
-				lines.insert(i, ";;-------------- ---------------- ----------")
-				i += 1
-				lines.insert(i, "")	# insert an empty line to separate it from the next category
-		i = 0
-		while lines[i] != "[TREATMENT]":
-			i += 1
-		i += 1
-		while lines[i] != "":
-			if remove_old:
-				if ";" not in lines[i]:
-					del lines[i]	# remove the existing treatment
-				else:
-					i += 1
-			else:
-				i += 1
-		for node in nodes:
-			lines.insert(i, node+"    "+nodes[node]["pollutant"]+"    "+nodes[node]["function"])
-	with open(input_file, "w") as f:
-		for line in lines:
-			f.write("%s\n" % line)
+	inp = open_inp(input_file)
+	if "TREATMENT" in inp:
+		start = inp.section("TREATMENT").start
+		end = inp.section("TREATMENT").end
+	else:
+		# insert the treatment category after the washoff category, or at the end of the file
+		i = inp.section("WASHOFF").end + 1 if "WASHOFF" in inp else len(inp.lines)
+		inp.replace_lines(i, i, ["[TREATMENT]", \
+					";;Node           Pollutant        Function  ", \
+					";;-------------- ---------------- ----------", \
+					""])	# insert an empty line to separate it from the next category
+		start = i + 1
+		end = i + 3
+	content = inp.lines[start:end]
+	if remove_old:
+		content = [line for line in content if ";" in line]	# remove the existing treatment
+	for node in nodes:
+		content.append(node+"    "+nodes[node]["pollutant"]+"    "+nodes[node]["function"])
+	inp.replace_lines(start, end, content)
+	close_inp(input_file, inp)
 
 # change buildup/washoff for landuses
 # type = "BUILDUP" or "WASHOFF"
 def change_buildup_washoff(input_file, type, landuse, coeff1, coeff2):
-	with open(input_file, "r") as f:
-		lines = f.readlines()
-		lines = [lines[x].rstrip() for x in range(len(lines))]	# remove new line characters
-		i = 0
-		while lines[i] != "[" + type + "]":
-			i += 1
-		i += 1
-		while lines[i] != "":
-			if ";" not in lines[i]:
-				temp = [x for x in lines[i].split(" ") if x != ""]
-				if temp[0] == landuse:
-					lines[i] = lines[i].replace(temp[3], coeff1).replace(temp[4], coeff2)
-			i += 1
-	with open(input_file, "w") as f:
-		for line in lines:
-			f.write("%s\n" % line)
+	inp = open_inp(input_file)
+	for i, temp in inp.rows(type):
+		if temp[0] == landuse:
+			inp.set_line(i, replace_token(replace_token(inp.lines[i], 3, coeff1), 4, coeff2))
+	close_inp(input_file, inp)
+
+# scale the buildup/washoff coefficients of land uses
+# factors = {land_use: [buildup coeff1, buildup coeff2, washoff coeff1, washoff coeff2]}, only the rows of pollutant are scaled
+def scale_buildup_washoff(input_file, factors, pollutant):
+	inp = open_inp(input_file)
+	for k, type in enumerate(["BUILDUP", "WASHOFF"]):
+		for i, temp in inp.rows(type):
+			if temp[0] in factors and temp[1] == pollutant:
+				line = inp.lines[i]
+				for c in range(2):
+					line = replace_token(line, 3 + c, str(float(temp[3 + c]) * float(factors[temp[0]][2*k + c])))
+				inp.set_line(i, line)
+	close_inp(input_file, inp)
 
 # change simulation time steps
 def change_time_steps(input_file, settings):
-	with open(input_file, "r") as f:
-		step_params = ["REPORT_STEP", "WET_STEP", "DRY_STEP", "ROUTING_STEP"]
-		lines = f.readlines()
-		lines = [lines[x].rstrip() for x in range(len(lines))]	# remove new line characters
-		i = 0
-		while lines[i] != "[OPTIONS]":
-			i += 1
-		i += 1
-		parameters_changed = 0
-		while parameters_changed < len(step_params):
-			if ";" not in lines[i] and lines[i] != "":
-				temp = [x for x in lines[i].split(" ") if x != ""]
-				if temp[0] in step_params:
-					lines[i] = lines[i].replace(temp[1], settings[temp[0]])
-					parameters_changed += 1
-			i += 1
-	with open(input_file, "w") as f:
-		for line in lines:
-			f.write("%s\n" % line)
+	step_params = ["REPORT_STEP", "WET_STEP", "DRY_STEP", "ROUTING_STEP"]
+	inp = open_inp(input_file)
+	for i, temp in inp.rows("OPTIONS"):
+		if temp[0] in step_params:
+			inp.set_line(i, inp.lines[i].replace(temp[1], settings[temp[0]]))
+	close_inp(input_file, inp)
 
 # create treatment scenarios and return them as a list
 # each scenario is a list of the nodes to receive treatment
-def create_treatment_scenarios(settings, junctions, landuses):
+# areas (see get_points_of_interest) are needed for sampling weights other than none
+def create_treatment_scenarios(settings, junctions, landuses, areas=None):
 	print("\nCreating treatment scenarios...")
 	treatment_scenarios = []
 	treatment_scenarios.append({})	# default scenario without treatment
 	try:
 		if settings["rank_junctions"]:
 			inlet_sets = [[x] for x in junctions]
-		elif settings["land_use_prioritization"]:
-			preferred_junctions = []
-			for landuse in settings["preferred_land_uses"]:
-				for junction in landuses[landuse]:
-					if junction not in preferred_junctions:
-						preferred_junctions.append(junction)
-			if settings["number_of_samples"] < len(preferred_junctions):
-				inlet_sets = [random.sample(preferred_junctions, settings["number_of_samples"]) for i in range(settings["number_of_scenarios"])]
-			else:
-				non_preferred_junctions = [x for x in junctions if x not in preferred_junctions]
-				inlet_sets = [random.sample(preferred_junctions, len(preferred_junctions)) + random.sample(non_preferred_junctions, settings["number_of_samples"]-len(preferred_junctions)) for i in range(settings["number_of_scenarios"])]
-			inlet_sets = [[x+settings["junction_suffix"] if settings["separate_junctions"] else x for x in s] for s in inlet_sets]
+		elif settings["use_specific_scenarios"] and not settings["land_use_prioritization"]:
+			inlet_sets = [[x+settings["junction_suffix"] if settings["separate_junctions"] else x for x in s] for s in settings["user_scenarios"]]
 		else:
-			inlet_sets = [[x+settings["junction_suffix"] if settings["separate_junctions"] else x for x in s] for s in settings["user_scenarios"]] if settings["use_specific_scenarios"] else [random.sample(junctions, settings["number_of_samples"]) for i in range(settings["number_of_scenarios"])]
+			# random scenarios, the inlets of the preferred land uses are taken first if land use prioritization is on
+			preferred_junctions = set()
+			if settings["land_use_prioritization"]:
+				for landuse in settings["preferred_land_uses"]:
+					preferred_junctions.update(landuses[landuse])
+			weights = get_sampling_weights(settings, junctions, areas)
+			sets = create_inlet_sets(len(junctions), settings["number_of_samples"], settings["number_of_scenarios"], settings["random_seed"], weights, [x in preferred_junctions for x in junctions], settings["unique_scenarios"])
+			if len(sets) < settings["number_of_scenarios"]:
+				color_print("Only " + str(len(sets)) + " different scenarios possible", "yellow")
+			inlet_sets = [[junctions[i] for i in s] for s in sets]
 		for nodes in inlet_sets:
 			treatment_data = {}
 			for node in nodes:
@@ -417,80 +400,61 @@ def create_treatment_scenarios(settings, junctions, landuses):
 		color_print("Complete", "green")
 	except Exception as e:
 		color_print("Could not create treatment scenarios", "red")
-		color_print(e, "red")
+		color_print(str(e), "red")
 	return treatment_scenarios
 
 # rank the simulated results according to pollutant removal
 def get_ranked_solutions(sim_res, criteria):
 	return sorted(sim_res, key=lambda x: x[criteria], reverse=True)
 
-# load simulation results from exported pickle files
-# the results are returned in a list
-# to avoid memeory issues, the detail resolution of the results is reduced (mod_num parameter)
-def get_simulation_results():
+# load simulation results from the result store
+# the results are returned as a ResultSet (empty if there are none), each result holds the scalar values and its series
+# are loaded when first accessed, close the set when done with the series so the result files are not kept open
+# to avoid memeory issues, the detail resolution of the series can be reduced (mod_num parameter)
+def get_simulation_results(mod_num=1):
 	print("\nReading simulation results...")
-	scenario_count = 0 if not os.path.isdir("temp") else len([f for f in listdir("temp") if isfile(join("temp", f)) and "simulation_results" in f])
-	simulation_results = []
-	display_progress(0)
-	for i in range(scenario_count):
-		mod_num = 1
-		res = pickle.load(open("temp/simulation_results_"+str(i)+".p", "rb"))
-		res["step_times"] = res["step_times"][0::mod_num]
-		res["volume_per_step"] = [sum(res["volume_per_step"][you:you+mod_num]) for you in range(0, len(res["volume_per_step"]), mod_num)]
-		res["tss_per_step"] = [sum(res["tss_per_step"][you:you+mod_num]) for you in range(0, len(res["tss_per_step"]), mod_num)]
-		res["cumulative_volume"] = res["cumulative_volume"][0::mod_num]
-		res["cumulative_tss"] = res["cumulative_tss"][0::mod_num]
-		res["volume_manhole_per_step"] = [sum(res["volume_manhole_per_step"][you:you+mod_num]) for you in range(0, len(res["volume_manhole_per_step"]), mod_num)] if res["volume_manhole_per_step"] else None
-		res["tss_manhole_per_step"] = [sum(res["tss_manhole_per_step"][you:you+mod_num]) for you in range(0, len(res["tss_manhole_per_step"]), mod_num)] if res["tss_manhole_per_step"] else None
-		res["i"] = i
-		display_progress((i+1)/scenario_count)
-		simulation_results.append(res)
+	simulation_results = ResultSet(mod_num=mod_num)
 	color_print("Complete", "green")
 	return simulation_results
 
+# add the removal with maintenance to a simulation result
+def set_maintenance_removal(res, removed_pollutant):
+	res["removal_mass_maintenance"] = removed_pollutant
+	res["removal_percent_maintenance"] = 0 if res["total_TSS"] == 0 else res["removal_mass_maintenance"] / res["total_TSS"] * 100
+	res["maintenance_removal_potential"] = res["removal_mass"] - res["removal_mass_maintenance"]
+	res["maintenance_removal_potential_percentage"] = 0 if res["removal_mass"] == 0 else res["removal_mass_maintenance"] / res["removal_mass"] * 100
+
 # calculate pollution with max capacity and maintenance interval taken into account
+# the removal is calculated for all records at once, see maintenance_engine
 def calc_maintenance_efficiency(settings):
 	simulation_results = get_simulation_results()
 	print("\nCalculating maintenance...")
-	for res in simulation_results:
-		if res["nodes"] != "system":
-			maintenance = []	# for each time step, 1 if maintenance, 0 if not
-			time_before_maintenance = settings["maintenance_interval"]*86400	# time remaining before maintenance is scheduled
-			for i in range(len(res["step_times"])-1):
-				time_before_maintenance -= (res["step_times"][i+1] - res["step_times"][i]).total_seconds()
-				if time_before_maintenance <= 0:
-					maintenance.append(1)
-					time_before_maintenance = settings["maintenance_interval"]*86400
-				else:
-					maintenance.append(0)
-			overflowed_pollutant = 0	# amount of pollutant to be added to the system total because it exceeded filter capacity
-			stored_pollutant = 0	# amount of pollutant currently in filter
-			removed_pollutant = 0	# amount of pollutant removed by filter
-			filter_efficiency = float(settings["formula"].split("=")[1])	# efficiency of the filter
-			for i in range(len(res["tss_per_step"])-1):
-				if maintenance[i] == 1:	# if maintenance is scheduled
-					removed_pollutant += stored_pollutant
-					stored_pollutant = 0	# empty filter
-				if stored_pollutant > settings["max_capacity"]*(10**6):	# unit convert max capacity from kg -> mg
-					overflowed_pollutant += res["tss_per_step"][i]	# overflow, nothing captured by filter
-				else:
-					stored_pollutant += res["tss_per_step"][i] * filter_efficiency	# captured by filter
-					overflowed_pollutant += res["tss_per_step"][i] * (1-filter_efficiency)	# not captured by filter
-			removed_pollutant += stored_pollutant	# final removal
-			total_TSS_maintenance = res["total_TSS"] - removed_pollutant
-		else:
-			removed_pollutant = 0
-		res["removal_mass_maintenance"] = removed_pollutant
-		res["removal_percent_maintenance"] = 0 if res["total_TSS"] == 0 else res["removal_mass_maintenance"] / res["total_TSS"] * 100
-		res["maintenance_removal_potential"] = res["removal_mass"] - res["removal_mass_maintenance"]
-		res["maintenance_removal_potential_percentage"] = 0 if res["removal_mass"] == 0 else res["removal_mass_maintenance"] / res["removal_mass"] * 100
+	filter_efficiency = float(settings["formula"].split("=")[1])	# efficiency of the filter
+	removed = maintenance_removal(simulation_results, settings["max_capacity"], settings["maintenance_interval"], filter_efficiency) if simulation_results else []
+	simulation_results.close()
+	for res, removed_pollutant in zip(simulation_results, removed):
+		set_maintenance_removal(res, removed_pollutant)
 	color_print("Complete", "green")
 	return simulation_results
 
+# calculate the removal with maintenance for several maintenance policies, the simulation results are loaded once
+# policies = [(max_capacity, maintenance_interval), ...] with max_capacity in kg and maintenance_interval in days
+# returns the simulation results and the removed pollutant in mg (policies x results)
+def calc_maintenance_sweep(settings, policies):
+	simulation_results = get_simulation_results()
+	print("\nCalculating maintenance for " + str(len(policies)) + " policies...")
+	filter_efficiency = float(settings["formula"].split("=")[1])	# efficiency of the filter
+	removed = maintenance_sweep(simulation_results, policies, filter_efficiency) if simulation_results else np.zeros((len(policies), 0))
+	simulation_results.close()
+	color_print("Complete", "green")
+	return simulation_results, removed
+
 # export maintenance results to excel
-def export_maintenance(settings):
+# simulation_results can be given if the removal with maintenance has already been calculated
+def export_maintenance(settings, simulation_results=None):
 	print("\nExporting results...")
-	simulation_results = calc_maintenance_efficiency(settings)
+	if simulation_results is None:
+		simulation_results = calc_maintenance_efficiency(settings)
 	with ExcelWriter(settings["results_file"]) as writer:
 		for criteria in settings["order_criteria"]:
 			sim_res = get_ranked_solutions(simulation_results, criteria)
@@ -507,7 +471,7 @@ def export_maintenance(settings):
 			DataFrame({"nodes": [str(list(x["nodes"])).replace("[", "").replace("]", "").replace("'", "").replace(settings["junction_suffix"], "") for x in sim_res], \
 						"Max capacity (kg)": [settings["max_capacity"] for x in sim_res], \
 						"Maintenance interval (days)": [settings["maintenance_interval"] for x in sim_res], \
-						"total TSS in system (kg)": [x["total_TSS"]/10**6 for x in sim_res], \
+						total_TSS_label(settings, "total TSS in system (kg)"): [x["total_TSS"]/10**6 for x in sim_res], \
 						"TSS removal max potential (kg)": [x["removal_mass"]/10**6 for x in sim_res], \
 						"TSS removal max potential (%)": [x["removal_percent"] for x in sim_res], \
 						"TSS removal with maintenance (kg)": [x["removal_mass_maintenance"]/10**6 for x in sim_res], \
@@ -520,6 +484,41 @@ def export_maintenance(settings):
 	color_print("Complete", "green")
 	print("Results exported to "+settings["results_file"])
 
+# export the results of several maintenance policies to a single excel file
+# the first sheet summarizes the policies, the other sheets give the removal of every result (rows) with every policy (columns)
+# policies = [(max_capacity, maintenance_interval), ...], removed = removed pollutant in mg (policies x results), see calc_maintenance_sweep
+def export_maintenance_sweep(settings, simulation_results, policies, removed, results_file):
+	print("\nExporting results...")
+	inlets = [k for k in range(len(simulation_results)) if list(simulation_results[k]["nodes"]) != ["system"]]
+	removal_mass = np.array([simulation_results[k]["removal_mass"] for k in inlets])
+	total_TSS = np.array([simulation_results[k]["total_TSS"] for k in inlets])
+	removed = np.asarray(removed)[:, inlets]
+	labels = [str(policy[0]) + "kg_" + str(policy[1]) + "d" for policy in policies]
+	nodes = [str(list(simulation_results[k]["nodes"])).replace("[", "").replace("]", "").replace("'", "").replace(settings["junction_suffix"], "") for k in inlets]
+	with ExcelWriter(results_file) as writer:
+		DataFrame({"policy": labels, \
+					"Max capacity (kg)": [policy[0] for policy in policies], \
+					"Maintenance interval (days)": [policy[1] for policy in policies], \
+					"TSS removal max potential (kg)": [removal_mass.sum()/10**6 for policy in policies], \
+					"TSS removal with maintenance (kg)": removed.sum(axis=1)/10**6, \
+					"TSS removal with maintenance (% of max potential)": removed.sum(axis=1) / removal_mass.sum() * 100 if removal_mass.sum() != 0 else np.zeros(len(policies)), \
+					"Mean removal with maintenance (mean/well %)": (np.divide(removed, total_TSS, out=np.zeros_like(removed), where=total_TSS != 0) * 100).mean(axis=1) if inlets else np.zeros(len(policies))}).to_excel(writer, sheet_name="policies")
+		o1_data = {"nodes": nodes, "TSS removal max potential (kg)": removal_mass/10**6}
+		o2_data = {"nodes": nodes}
+		for p in range(len(policies)):
+			o1_data[labels[p]] = removed[p]/10**6
+			o2_data[labels[p]] = np.divide(removed[p], removal_mass, out=np.zeros(len(inlets)), where=removal_mass != 0) * 100
+		DataFrame(o1_data).to_excel(writer, sheet_name="removal (kg)")
+		DataFrame(o2_data).to_excel(writer, sheet_name="removal (% of max)")
+	color_print("Complete", "green")
+	print("Results exported to " + results_file)
+
+# column label of total_TSS in the exports, marked when the results only cover the inlets of capture_inlets
+def total_TSS_label(settings, label):
+	if [x for x in settings["capture_inlets"] if x != ""]:
+		return "total TSS of capture_inlets (kg)"
+	return label
+
 # export simulation results to excel
 def export_results(settings):
 	print("\nExporting results...")
@@ -549,7 +548,7 @@ def export_results(settings):
 						"nodes": [str(list(x["nodes"])).replace("[", "").replace("]", "").replace("'", "").replace(settings["junction_suffix"], "") for x in sim_res], \
 						"total volume (10^6 liters)": [x["total_volume"]/10**6 for x in sim_res], \
 						"flow error (%)": [x["flow_error"] for x in sim_res], \
-						"total TSS (kg)": [x["total_TSS"]/10**6 for x in sim_res], \
+						total_TSS_label(settings, "total TSS (kg)"): [x["total_TSS"]/10**6 for x in sim_res], \
 						"quality error (%)": [x["quality_error"] for x in sim_res], \
 						"TSS removal (kg)": [x["removal_mass"]/10**6 for x in sim_res], \
 						"TSS removal (%)": [x["removal_percent"] for x in sim_res], \
@@ -579,6 +578,7 @@ def export_results(settings):
 				o4_data[str(k)] = [sim_res[k]["cumulative_tss"][i]/10**6 for i in range(len(sim_res[k]["cumulative_tss"])) if i % mod_num < 1]
 		DataFrame(o3_data).to_excel(writer, sheet_name="cum Vol (liter)")
 		DataFrame(o4_data).to_excel(writer, sheet_name="cum TSS (kg)")
+	simulation_results.close()
 	color_print("Complete", "green")
 	print("Results exported to "+settings["results_file"])
 
@@ -598,14 +598,30 @@ def read_settings(settings_file):
 					"REPORT_STEP", \
 					"WET_STEP", \
 					"DRY_STEP", \
-					"ROUTING_STEP"]
+					"ROUTING_STEP", \
+					"results_step", \
+					"sampling_weights", \
+					"simulation_windows"]
 		floats = ["height_offset", \
 					"conduit_length", \
 					"max_capacity", \
 					"coord_offset", \
-					"maintenance_interval"]
+					"maintenance_interval", \
+					"buildup_uncertainty", \
+					"washoff_uncertainty"]
 		integers = ["number_of_scenarios", \
-					"number_of_samples"]
+					"number_of_samples", \
+					"parallel_processes", \
+					"scenario_timeout", \
+					"batch_processes", \
+					"crew_visits_per_month", \
+					"placement_traps", \
+					"random_seed", \
+					"monte_carlo_realizations", \
+					"topology_cache_size", \
+					"checkpoint_interval", \
+					"window_warmup", \
+					"window_hotstart_size"]
 		booleans = ["create_report", \
 					"restore_backup", \
 					"create_backup", \
@@ -616,9 +632,18 @@ def read_settings(settings_file):
 					"run_simulations", \
 					"rank_junctions", \
 					"land_use_prioritization", \
-					"suppress_output"]
+					"suppress_output", \
+					"exact_integration", \
+					"verify_placement", \
+					"unique_scenarios", \
+					"resume_simulation", \
+					"validate_windows"]
 		lists = ["preferred_land_uses", \
-					"order_criteria"]
+					"order_criteria", \
+					"candidate_intervals", \
+					"monte_carlo_quantiles", \
+					"gis_formats", \
+					"capture_inlets"]
 		lines = f.readlines()
 		lines = [lines[x].rstrip().replace(" ", "") for x in range(len(lines))]
 		for i in range(len(lines)):
@@ -659,9 +684,8 @@ def write_settings(settings_file, new_values):
 				if lines[i][0] != "#":
 					temp = lines[i].split("=")
 					param = temp[0]
-					old_value = temp[1]
 					if param in new_values.keys():
-						lines[i] = lines[i].replace(old_value, new_values[param])
+						lines[i] = param + "=" + new_values[param]	# also for an empty old value
 	with open(settings_file, "w") as f:
 		for line in lines:
 			f.write("%s\n" % line)
@@ -682,135 +706,118 @@ def create_backup(filepath, suffix):
 	except:
 		color_print("\nCould not create backup", "red")
 
-# exports simulation results to csv that can be imported as Delimited Text Layer in QGIS
-def export_to_csv(settings):
+# export the SWMM parametrization as gis layers: subcatchments, nodes, manholes, links and subcatchment_outlets
+# the input file is parsed once and the features are streamed to the writers of the formats in the settings (see gis_writers)
+# csv: delimited text files in the working directory that can be imported as Delimited Text Layers in QGIS
+# geojson: one <layer>.geojson file per layer in the working directory
+# gpkg: all layers in a GeoPackage next to the input file
+# the ranking metrics of the inlets (removal_mass, removal_per_area) are joined to the manholes of the geojson and gpkg layers
+# if simulation results exist
+def export_gis(settings, formats=None):
+	formats = settings["gis_formats"] if formats is None else formats
 	input_file = settings["input_file"]
-	delimiter = "|"
-	# subcatchments
-	output_file = "subcatchments.csv"
+	inp = load_inp(input_file)	# parsed once and shared by all exported layers
+	print("\nExporting GIS layers...")
 	polygons = {}
 	landuses = {}
 	outlets = {}
 	centroids = {}
-	with open(input_file, "r") as f:
-		lines = f.readlines()
-		lines = [lines[x].rstrip() for x in range(len(lines))]	# remove new line characters
-		# geometry
-		i = 0
-		while lines[i] != "[Polygons]":
-			i += 1
-		i += 1
-		while lines[i] != "":
-			if ";" not in lines[i]:
-				temp = [x for x in lines[i].split(" ") if x != ""]
-				if temp[0] not in polygons.keys():
-					polygons[temp[0]] = []
-				polygons[temp[0]].append(temp[1] + " " + temp[2])
-			i += 1
-		# land use
-		i = 0
-		while lines[i] != "[COVERAGES]":
-			i += 1
-		i += 1
-		while lines[i] != "":
-			if ";" not in lines[i]:
-				temp = [x for x in lines[i].split(" ") if x != ""]
-				landuses[temp[0]] = temp[1]
-			i += 1
-		# outlet
-		i = 0
-		while lines[i] != "[SUBCATCHMENTS]":
-			i += 1
-		i += 1
-		while lines[i] != "":
-			if ";" not in lines[i]:
-				temp = [x for x in lines[i].split(" ") if x != ""]
-				outlets[temp[0]] = temp[2]
-			i += 1
-		# polygon centerpoint
-		for p in polygons:
-			c_x = sum([float(x.split(" ")[0]) for x in polygons[p]])/len(polygons[p])
-			c_y = sum([float(x.split(" ")[1]) for x in polygons[p]])/len(polygons[p])
-			centroids[p] = str(c_x) + " " + str(c_y)
-	with open(output_file, "w") as f:
-		f.write("id" + delimiter + "features" + delimiter + "landuses" + "\n")
-		for p in polygons:
-			f.write(p + delimiter + "POLYGON((" + ",".join(polygons[p]) + "))" + delimiter + landuses[p] + "\n")
-	# junctions
-	output_file = "nodes.csv"
 	points = {}
-	with open(input_file, "r") as f:
-		lines = f.readlines()
-		lines = [lines[x].rstrip() for x in range(len(lines))]	# remove new line characters
-		i = 0
-		while lines[i] != "[COORDINATES]":
-			i += 1
-		i += 1
-		while lines[i] != "":
-			if ";" not in lines[i]:
-				temp = [x for x in lines[i].split(" ") if x != ""]
-				points[temp[0]] = temp[1] + " " + temp[2]
-			i += 1
-	with open(output_file, "w") as f:
-		f.write("id" + delimiter + "features" + "\n")
-		for p in points:
-			f.write(p + delimiter + "POINT((" + points[p] + "))" + "\n")
+	# geometry
+	for temp in inp.records("Polygons"):
+		if temp[0] not in polygons.keys():
+			polygons[temp[0]] = []
+		polygons[temp[0]].append((temp[1], temp[2]))
+	# land use
+	for temp in inp.records("COVERAGES"):
+		landuses[temp[0]] = temp[1]
+	# outlet
+	for temp in inp.records("SUBCATCHMENTS"):
+		outlets[temp[0]] = temp[2]
+	# polygon centerpoint
+	for p in polygons:
+		c_x = sum([float(x[0]) for x in polygons[p]])/len(polygons[p])
+		c_y = sum([float(x[1]) for x in polygons[p]])/len(polygons[p])
+		centroids[p] = (str(c_x), str(c_y))
+	# junctions
+	for temp in inp.records("COORDINATES"):
+		points[temp[0]] = (temp[1], temp[2])
+	# manholes, found once for all nodes
+	manholes = set(get_points_of_interest_cached(inp, settings)["junctions_with_manholes"])
+	# ranking metrics of the inlets
+	metric_names = ["removal_mass", "removal_per_area"]
+	metrics = {}
+	if "geojson" in formats or "gpkg" in formats:
+		with get_simulation_results() as simulation_results:
+			for res in simulation_results:
+				nodes = list(res["nodes"])
+				if len(nodes) == 1 and nodes != ["system"]:
+					metrics[nodes[0].replace(settings["junction_suffix"], "")] = {name: float(res[name]) for name in metric_names}
+	# writers of every layer in every format
+	layers = {"subcatchments": ("Polygon", [("landuses", "TEXT")]), \
+				"nodes": ("Point", []), \
+				"manholes": ("Point", [(name, "REAL") for name in metric_names]), \
+				"links": ("LineString", []), \
+				"subcatchment_outlets": ("LineString", [])}
+	package = GeoPackage(input_file.replace(".inp", ".gpkg")) if "gpkg" in formats else None
+	writers = {}
+	for layer in layers:
+		geometry, fields = layers[layer]
+		writers[layer] = []
+		if "csv" in formats:
+			writers[layer].append(CsvLayerWriter(layer + ".csv", fields if layer != "manholes" else []))
+		if "geojson" in formats:
+			writers[layer].append(GeoJsonLayerWriter(layer + ".geojson", fields))
+		if package is not None:
+			writers[layer].append(package.layer(layer, geometry, fields))
+	def write(layer, id, coordinates, properties={}):
+		for writer in writers[layer]:
+			writer.write(id, layers[layer][0], coordinates, properties)
+	skipped = []
+	# subcatchments
+	for p in polygons:
+		write("subcatchments", p, polygons[p], {"landuses": landuses.get(p, "")})
+	# junctions
+	for p in points:
+		write("nodes", p, [points[p]])
 	# manholes
-	output_file = "manholes.csv"
-	with open(output_file, "w") as f:
-		f.write("id" + delimiter + "features" + "\n")
-		for p in points:
-			if p in get_points_of_interest(settings["input_file"])["junctions_with_manholes"]:
-				f.write(p + delimiter + "POINT((" + points[p] + "))" + "\n")
+	for p in points:
+		if p in manholes:
+			write("manholes", p, [points[p]], metrics.get(p.replace(settings["junction_suffix"], ""), {}))
 	# conduits
-	output_file = "links.csv"
-	with open(input_file, "r") as f:
-		lines = f.readlines()
-		lines = [lines[x].rstrip() for x in range(len(lines))]	# remove new line characters
-		links = {}	# {conduit_1: {from: junction_1, to: junction_2}, conduit_2: ...}
-		if "[CONDUITS]" in lines:
-			conduits = []
-			i = 0
-			while lines[i] != "[CONDUITS]":
-				i += 1
-			i += 1
-			while lines[i] != "":
-				if ";" not in lines[i]: conduits.append(lines[i])
-				i += 1
-			for line in conduits:
-				temp = [x for x in line.split(" ") if x != ""]
-				links[temp[0]] = {}
-				links[temp[0]]["from"] = temp[1]
-				links[temp[0]]["to"] = temp[2]
-	with open(output_file, "w") as f:
-		f.write("id" + delimiter + "features" + "\n")
-		for p in links:
-			f.write(p + delimiter + "LINESTRING((" + ",".join([points[links[p]["from"]], points[links[p]["to"]]]) + "))" + "\n")
+	for temp in inp.records("CONDUITS"):
+		if temp[1] in points and temp[2] in points:
+			write("links", temp[0], [points[temp[1]], points[temp[2]]])
+		else:
+			skipped.append(temp[0])
 	# subcatchment outlets
-	output_file = "subcatchment_outlets.csv"
-	with open(output_file, "w") as f:
-		f.write("id" + delimiter + "features" + "\n")
-		for p in outlets:
-			if outlets[p] in polygons.keys():
-				f.write(p + delimiter + "LINESTRING((" + ",".join([centroids[p], centroids[outlets[p]]]) + "))" + "\n")
-			else:
-				f.write(p + delimiter + "LINESTRING((" + ",".join([centroids[p], points[outlets[p]]]) + "))" + "\n")
-
-# do the simulations
-def simulate_scenarios(settings_file="settings.ini"):
-
-	# needed for colored print to work
-	os.system("")
-	
-	# get user settings from the settings file
-	print("\nReading data from settings file...")
-	settings = read_settings(settings_file)
+	for p in outlets:
+		if p not in centroids:
+			skipped.append(p)
+		elif outlets[p] in polygons.keys():
+			write("subcatchment_outlets", p, [centroids[p], centroids[outlets[p]]])
+		elif outlets[p] in points:
+			write("subcatchment_outlets", p, [centroids[p], points[outlets[p]]])
+		else:
+			skipped.append(p)
+	for layer in writers:
+		for writer in writers[layer]:
+			writer.close()
+	if package is not None:
+		package.close()
+	if skipped:
+		color_print("Features without coordinates were not exported: " + ", ".join(skipped), "yellow")
 	color_print("Complete", "green")
 
-	# file paths
+# export the SWMM parametrization into csv files that can be imported as Delimited Text Layers in QGIS
+def export_to_csv(settings):
+	export_gis(settings, ["csv"])
+
+# prepare the input file for the simulations
+# the backup is restored/created, the time steps are set and the junctions separated, as defined in the settings
+# returns the data about the points of interest (see get_points_of_interest)
+def prepare_input_file(settings):
 	inp_file = settings["input_file"]	# inp file path
-	report_file = inp_file.replace("inp", "rpt")	# generated report file path
-	output_file = inp_file.replace("inp", "out")	# generated output file path
 
 	# restore input file from backup copy
 	if settings["restore_backup"]:
@@ -820,24 +827,166 @@ def simulate_scenarios(settings_file="settings.ini"):
 	if settings["create_backup"]:
 		create_backup(inp_file, ".bak")
 	
+	# the input file is read once, all changes are made in memory and written at the end
+	inp = open_inp(inp_file)
+
 	# set the time steps
-	change_time_steps(inp_file, settings)
+	change_time_steps(inp, settings)
 
 	# get data from input file about the points to modify
 	print("\nReading data from input file...")
-	data = get_points_of_interest(inp_file)
+	data = get_points_of_interest_cached(inp, settings)
 	if settings["separate_junctions"]:
-		separate_junctions(inp_file, data, settings)
-		data = get_points_of_interest(inp_file)
+		separate_junctions(inp, data, settings)
+		data = get_points_of_interest_cached(inp, settings)
+	inp.save()
+	return data
+
+# simulation start and end time from the dates in the settings
+def get_simulation_period(settings):
+	start_time = datetime(int(settings["start_date"].split("/")[2]), int(settings["start_date"].split("/")[0]), int(settings["start_date"].split("/")[1]), 0, 0, 0)
+	end_time = datetime(int(settings["end_date"].split("/")[2]), int(settings["end_date"].split("/")[0]), int(settings["end_date"].split("/")[1]), 23, 59, 0)
+	return start_time, end_time
+
+# time step of the result series in seconds when integrating exactly, None when averaging over blocks of routing steps
+def get_report_step(settings):
+	if not settings["exact_integration"]:
+		return None
+	report_step = time_to_seconds(settings["results_step"])
+	if report_step <= 0:
+		report_step = time_to_seconds(settings["REPORT_STEP"])
+	return report_step
+
+# result records of a simulation in the format of write_records, one for the system followed by one per inlet
+# data: points of interest (see get_points_of_interest), plan: the captured inlets in the order of the columns 1, 2, ... of
+# the blocks and the inlets to report (see CapturePlan), column 0 is the outfall, blocks/totals: block series and totals
+# of the capture (see StepCapture.finish), step_times: end of each block as datetimes, period: (start, end) of the simulation
+# total_TSS is the sum of the loads of the reported inlets, with capture_inlets only of the listed inlets, while
+# removal_percent is relative to the system load (total_TSS_system) in both cases
+def get_result_records(data, plan, blocks, totals, step_times, period, simulation_duration, flow_error, quality_error):
+	landuses = data["junction_coverages"]
+	areas = data["junction_areas"]	# areas in ha
+	inlets = plan.inlets
+	reported = set(plan.reported)
+	volume_lateral_inflow = {}
+	volume_total_inflow = {}
+	volume_cum = {}
+	volume_tot = {}
+	pollutant_load = {}			# pollutant load (mass)
+	pollutant_load_cum = {}
+	pollutant_load_tot = {}
+	pollutant_load_removal_percent = {}		# pollutant load at node divided by system pollutant load
+	pollutant_load_removal_per_area = {}
+	
+	# calculate land use of solution in regards to area (area in m2)
+	area_covered = {inlet: {a: areas[inlet][a] * 10**4 for a in areas[inlet]} for inlet in areas}
+	area_covered["system"] = {"total": 0}
+	for inlet in areas:
+		area_covered["system"]["total"] += area_covered[inlet]["total"]
+	for landuse in landuses:
+		area_covered["system"][landuse] = 0
+		for inlet in areas:
+			area_covered["system"][landuse] += area_covered[inlet][landuse]
+	
+	# system properties
+	# volume in liters
+	# V_tot = sum( V_i ) = sum( Q_i * dt )
+	# pollutant load in mg
+	# TSS_tot = sum ( TSS_i ) = sum ( C(TSS)_i * V_i )
+	# the system inflow is the total inflow of the outfall
+	volume_lateral_inflow["system"] = list(blocks["volume_total_inflow"][:, 0])
+	volume_total_inflow["system"] = list(blocks["volume_total_inflow"][:, 0])
+	volume_cum["system"] = cumsum(volume_lateral_inflow["system"])
+	volume_tot["system"] = totals["volume_total_inflow"][0]
+	pollutant_load["system"] = list(blocks["pollutant_load"][:, 0])
+	pollutant_load_cum["system"] = cumsum(pollutant_load["system"])
+	pollutant_load_tot["system"] = totals["pollutant_load"][0]
+	pollutant_load_removal_percent["system"] = 0
+	pollutant_load_removal_per_area["system"] = 0
+	
+	# inlet properties, computed for all inlets at once on (inlets x blocks) matrices
+	# volume
+	inlet_volume = blocks["volume_lateral_inflow"][:, 1:].T
+	inlet_volume_cum = np.cumsum(inlet_volume, axis=1)
+	for k, inlet in enumerate(inlets):
+		volume_lateral_inflow[inlet] = list(inlet_volume[k])
+		volume_total_inflow[inlet] = list(blocks["volume_total_inflow"][:, k+1])
+		volume_cum[inlet] = inlet_volume_cum[k]
+		volume_tot[inlet] = totals["volume_lateral_inflow"][k+1]
+	# pollutant load, the load through each inlet minus the load arriving from its upstream inlets (see inlet_routing)
+	total_pollutant_through_node = np.ascontiguousarray(blocks["pollutant_load"][:, 1:].T)
+	attributed_load = local_loads(total_pollutant_through_node, routing_matrix(inlets, plan.routing))
+	negative = [inlet for k, inlet in enumerate(inlets) if inlet in reported and attributed_load[k].sum() < 0]
+	if negative:
+		color_print("More load arrives from upstream than passes the inlets, their load is taken as absolute value: " + ", ".join(negative), "yellow")
+	inlet_load = np.abs(attributed_load)
+	inlet_load_cum = np.cumsum(inlet_load, axis=1)
+	inlet_load_tot = inlet_load_cum[:, -1] if inlet_load.shape[1] else np.zeros(len(inlets))	# summed in step order
+	for k, inlet in enumerate(inlets):
+		if inlet not in reported:	# only captured for the routing of the reported inlets
+			continue
+		pollutant_load[inlet] = list(inlet_load[k])
+		pollutant_load_cum[inlet] = inlet_load_cum[k]
+		pollutant_load_tot[inlet] = float(inlet_load_tot[k])
+		pollutant_load_removal_percent[inlet] = 0 if pollutant_load_tot["system"] == 0 else pollutant_load_tot[inlet] / pollutant_load_tot["system"] * 100
+		pollutant_load_removal_per_area[inlet] = 0 if area_covered[inlet]["total"] == 0 else pollutant_load_tot[inlet] / area_covered[inlet]["total"]
+	
+	# export temporary results
+	ids = ["system"]
+	for inlet in plan.reported:
+		ids.append(inlet)
+	exported_results = []
+	for id in ids:
+		record = {"start": period[0], \
+							"end": period[1], \
+							"simulation_time": simulation_duration, \
+							"nodes": [id], \
+							"total_volume": volume_tot[id], \
+							"flow_error": flow_error, \
+							"total_TSS": sum([pollutant_load_tot[x] for x in pollutant_load_tot if x != "system"]), \
+							"total_TSS_system": pollutant_load_tot["system"], \
+							"quality_error": quality_error, \
+							"removal_mass": pollutant_load_tot[id], \
+							"removal_percent": pollutant_load_removal_percent[id], \
+							"removal_per_area": pollutant_load_removal_per_area[id], \
+							"step_times": step_times, \
+							"volume_per_step": volume_lateral_inflow[id], \
+							"tss_per_step": pollutant_load[id], \
+							"cumulative_volume": volume_cum[id], \
+							"cumulative_tss": pollutant_load_cum[id], \
+							"area_covered": area_covered[id], \
+							"area_covered_total": area_covered[id]["total"]}
+		record["volume_manhole_per_step"] = volume_lateral_inflow[id] if id != "system" else None
+		record["tss_manhole_per_step"] = pollutant_load[id] if id != "system" else None
+		exported_results.append(record)
+	return exported_results
+
+# do the simulations
+def simulate_scenarios(settings_file="settings.ini"):
+
+	# needed for colored print to work
+	os.system("")
+	
+	# get user settings from the settings file
+	print("\nReading data from settings file...")
+	settings = read_settings(settings_file)
+	color_print("Complete", "green")
+
+	# file paths
+	inp_file = settings["input_file"]	# inp file path
+	report_file = inp_file.replace("inp", "rpt")	# generated report file path
+	output_file = inp_file.replace("inp", "out")	# generated output file path
+
+	# prepare the input file and get data about the points to modify
+	data = prepare_input_file(settings)
 	landuses = data["junction_coverages"]
 	areas = data["junction_areas"]	# areas in ha
 	sewer_inlets = data["junctions_with_manholes"]
-	upstream_inlets = data["upstream_inlets"]
 	color_print("Complete", "green")
 	
 	# get treatment scenarios
 	if settings["create_treatment_scenarios"]:
-		treatment_scenarios = create_treatment_scenarios(settings, sewer_inlets, landuses)
+		treatment_scenarios = create_treatment_scenarios(settings, sewer_inlets, landuses, areas)
 	else:
 		treatment_scenarios = [{}]	# only default scenario without treatment
 	
@@ -848,10 +997,7 @@ def simulate_scenarios(settings_file="settings.ini"):
 		if not os.path.isdir("temp"): os.mkdir("temp")
 		
 		# delete previous simulation results, if any
-		res_files = os.listdir("temp")
-		for file in res_files:
-			if "simulation_results" in file and file.endswith(".p"):
-				os.unlink("temp/"+file)
+		delete_results()
 		
 		print("\nRunning simulation...")
 		
@@ -871,8 +1017,7 @@ def simulate_scenarios(settings_file="settings.ini"):
 				sim = Simulation(inp_file)
 
 		# set simulation start/end time
-		sim.start_time = datetime(int(settings["start_date"].split("/")[2]), int(settings["start_date"].split("/")[0]), int(settings["start_date"].split("/")[1]), 0, 0, 0)
-		sim.end_time = datetime(int(settings["end_date"].split("/")[2]), int(settings["end_date"].split("/")[0]), int(settings["end_date"].split("/")[1]), 23, 59, 0)
+		sim.start_time, sim.end_time = get_simulation_period(settings)
 
 		# simulated time in seconds
 		duration = (sim.end_time - sim.start_time).total_seconds()
@@ -881,82 +1026,57 @@ def simulate_scenarios(settings_file="settings.ini"):
 		step_times = []
 
 		# system outlet
-		outfall = Nodes(sim)[settings["outfall_node"]]
+		outfall_id = settings["outfall_node"]
 		
 		system_routing = SystemStats(sim)	# cumulative statistics
-		inlets = [node for node in Nodes(sim) if node.nodeid in sewer_inlets]	# nodes that receive water from subcatchments
-		lateral_inflow = {"system": []}	# lateral inflow at nodes
-		total_inflow = {"system": []}	# total inflow at nodes
-		volume_lateral_inflow = {}
-		volume_total_inflow = {}
-		volume_cum = {}
-		volume_tot = {}
-		quality = {"system": []}	# water quality (concentration)
-		pollutant_load = {}			# pollutant load (mass)
-		pollutant_load_cum = {}
-		pollutant_load_tot = {}
-		pollutant_load_removal_percent = {}		# pollutant load at node divided by system pollutant load
-		pollutant_load_removal_per_area = {}
-		for inlet in inlets:
-			lateral_inflow[inlet.nodeid] = []
-			total_inflow[inlet.nodeid] = []
-			quality[inlet.nodeid] = []
+		# inlets to capture, the nodes that receive water from subcatchments, restricted to capture_inlets if given
+		plan = CapturePlan(data, settings["capture_inlets"], settings["junction_suffix"], node_indices(sim, sewer_inlets))
+		for warning in plan.warnings():
+			color_print(warning, "yellow")
 		
 		# execute simulation
-		step_times.append(sim.start_time)	# add initial time stamp to list of time steps to facilitate calculation of time step duration later on
-		progressbar_simple(0)	# start progressbar at 0
+		# the outfall is captured in the first column, followed by the inlets
+		# node values are reduced to blocks and block volumes/loads are integrated during the run
+		# either over blocks of mod_num routing steps, or exactly at every step with blocks of results_step
 		mod_num = 1000
-		sim_count = 0
-		temp_lateral_inflow = {"system": []}
-		temp_total_inflow = {"system": []}
-		temp_quality = {"system": []}
-		for inlet in inlets:
-			temp_lateral_inflow[inlet.nodeid] = []
-			temp_total_inflow[inlet.nodeid] = []
-			temp_quality[inlet.nodeid] = []
-		for step in sim:
-			temp_lateral_inflow["system"].append(outfall.total_inflow)	# inflow rate in l/s
-			temp_total_inflow["system"].append(outfall.total_inflow)	# inflow rate in l/s
-			temp_quality["system"].append(outfall.pollut_quality[settings["pollutant"]])	# water quality in mg/l
-			for inlet in inlets:
-				temp_lateral_inflow[inlet.nodeid].append(inlet.lateral_inflow)
-				temp_total_inflow[inlet.nodeid].append(inlet.total_inflow)
-				temp_quality[inlet.nodeid].append(inlet.pollut_quality[settings["pollutant"]])
-			if sim_count % mod_num == 0:
-				step_times.append(sim.current_time)	# add current time stamp to the list of time steps
-				lateral_inflow["system"].append(mean(temp_lateral_inflow["system"]))	# add current system lateral inflow to list of lateral inflows at time steps
-				total_inflow["system"].append(mean(temp_total_inflow["system"]))	# add current system total inflow to list of total inflows at time steps
-				quality["system"].append(mean(temp_quality["system"]))	# add current pollution to list of pollution at time steps
-				for inlet in inlets:
-					lateral_inflow[inlet.nodeid].append(mean(temp_lateral_inflow[inlet.nodeid]))
-					total_inflow[inlet.nodeid].append(mean(temp_total_inflow[inlet.nodeid]))
-					quality[inlet.nodeid].append(mean(temp_quality[inlet.nodeid]))
-				temp_lateral_inflow = {"system": []}
-				temp_total_inflow = {"system": []}
-				temp_quality = {"system": []}
-				for inlet in inlets:
-					temp_lateral_inflow[inlet.nodeid] = []
-					temp_total_inflow[inlet.nodeid] = []
-					temp_quality[inlet.nodeid] = []
-			if not settings["suppress_output"]: progressbar_simple(sim.percent_complete)	# update progressbar to current completion
-			sim_count += 1
-		# add the last simulation data to the results, otherwise there is some loss
-		if sim_count % mod_num != 0:
-			step_times.append(sim.end_time)	# add simulation end time stamp to the list of time steps
-			lateral_inflow["system"].append(mean(temp_lateral_inflow["system"]))	# add current system lateral inflow to list of lateral inflows at time steps
-			total_inflow["system"].append(mean(temp_total_inflow["system"]))	# add current system total inflow to list of total inflows at time steps
-			quality["system"].append(mean(temp_quality["system"]))	# add current pollution to list of pollution at time steps
-			for inlet in inlets:
-				lateral_inflow[inlet.nodeid].append(mean(temp_lateral_inflow[inlet.nodeid]))
-				total_inflow[inlet.nodeid].append(mean(temp_total_inflow[inlet.nodeid]))
-				quality[inlet.nodeid].append(mean(temp_quality[inlet.nodeid]))
-			temp_lateral_inflow = {"system": []}
-			temp_total_inflow = {"system": []}
-			temp_quality = {"system": []}
-			for inlet in inlets:
-				temp_lateral_inflow[inlet.nodeid] = []
-				temp_total_inflow[inlet.nodeid] = []
-				temp_quality[inlet.nodeid] = []
+		capture = StepCapture(NodeReader(sim, [outfall_id] + plan.inlets, settings["pollutant"]), mod_num, get_report_step(settings))
+		start_time = sim.start_time
+		# resume from the checkpoint of an interrupted run of the same input file and settings, see checkpoint.py
+		# the simulation starts at the time of the checkpoint from its hotstart file, the flow and quality errors
+		# reported by swmm then only cover the resumed part
+		# the results of a resumed run are approximate, the hotstart file does not hold the complete model state
+		# checkpoints are saved at the end of a result block, once checkpoint_interval has passed
+		checkpoint_interval = settings["checkpoint_interval"] * 60	# in seconds of run time, 0 = no checkpoints
+		key = checkpoint_key(inp_file, (sim.start_time, sim.end_time), capture.reader.node_ids, settings["pollutant"], mod_num, get_report_step(settings))
+		checkpoint = read_checkpoint(key) if settings["resume_simulation"] else None
+		if checkpoint is not None:
+			capture.set_state(checkpoint["capture"])
+			sim.use_hotstart(checkpoint["hotstart_file"])
+			sim.start_time = start_time + timedelta(seconds=checkpoint["time"])
+			color_print("Resuming from the checkpoint at " + str(sim.start_time), "yellow")
+			color_print("The results of a resumed simulation are approximate, they can differ slightly from an uninterrupted run", "yellow")
+		else:
+			delete_checkpoint()	# left by a different run
+		checkpoint_timer = time.time()
+		progressbar_simple(0)	# start progressbar at 0
+		try:
+			for step in sim:
+				current_time = (sim.current_time - start_time).total_seconds()
+				capture.capture(current_time)
+				if checkpoint_interval > 0 and time.time() - checkpoint_timer >= checkpoint_interval and capture.at_block_boundary():
+					save_checkpoint(sim, capture, current_time, key)
+					checkpoint_timer = time.time()
+				if not settings["suppress_output"]: progressbar_simple(sim.percent_complete)	# update progressbar to current completion
+		except Exception as e:
+			sim.close()
+			checkpoint = read_checkpoint(key)
+			color_print("\nSimulation failed: " + str(e), "red")
+			if checkpoint is not None:
+				color_print("Run the simulation again to resume from the checkpoint at " + str(start_time + timedelta(seconds=checkpoint["time"])), "yellow")
+			raise
+		block_times, blocks = capture.finish((sim.end_time - start_time).total_seconds())
+		step_times.append(start_time)	# add initial time stamp to list of time steps to facilitate calculation of time step duration later on
+		step_times += [start_time + timedelta(seconds=t) for t in block_times]	# time stamp at the end of each block
 	
 		# set the progressbar to complete for visual pleasure
 		if not settings["suppress_output"]: progressbar_simple(1)
@@ -969,62 +1089,6 @@ def simulate_scenarios(settings_file="settings.ini"):
 		flow_error = system_routing.routing_stats["routing_error"]
 		quality_error = sim.quality_error
 		
-		# calculate land use of solution in regards to area (area in m2)
-		area_covered = {inlet: {a: areas[inlet][a] * 10**4 for a in areas[inlet]} for inlet in areas}
-		area_covered["system"] = {"total": 0}
-		for inlet in areas:
-			area_covered["system"]["total"] += area_covered[inlet]["total"]
-		for landuse in landuses:
-			area_covered["system"][landuse] = 0
-			for inlet in areas:
-				area_covered["system"][landuse] += area_covered[inlet][landuse]
-		
-		# calculate step durations
-		step_durations = [(step_times[i+1] - step_times[i]).total_seconds() for i in range(len(step_times)-1)]
-		
-		# system properties
-		# volume in liters
-		# V_tot = sum( V_i ) = sum( Q_i * dt )
-		# pollutant load in mg
-		# TSS_tot = sum ( TSS_i ) = sum ( C(TSS)_i * V_i )
-		volume_lateral_inflow["system"] = [lateral_inflow["system"][i] * step_durations[i] for i in range(len(lateral_inflow["system"]))]
-		volume_total_inflow["system"] = [total_inflow["system"][i] * step_durations[i] for i in range(len(total_inflow["system"]))]
-		volume_cum["system"] = cumsum(volume_lateral_inflow["system"])
-		volume_tot["system"] = sum(volume_lateral_inflow["system"])
-		pollutant_load["system"] = [quality["system"][i] * volume_total_inflow["system"][i] for i in range(len(quality["system"]))]
-		pollutant_load_cum["system"] = cumsum(pollutant_load["system"])
-		pollutant_load_tot["system"] = sum(pollutant_load["system"])
-		pollutant_load_removal_percent["system"] = 0
-		pollutant_load_removal_per_area["system"] = 0
-		
-		# inlet properties
-		# volume
-		for inlet in inlets:
-			volume_lateral_inflow[inlet.nodeid] = [lateral_inflow[inlet.nodeid][i] * step_durations[i] for i in range(len(lateral_inflow[inlet.nodeid]))]
-			volume_total_inflow[inlet.nodeid] = [total_inflow[inlet.nodeid][i] * step_durations[i] for i in range(len(total_inflow[inlet.nodeid]))]
-			volume_cum[inlet.nodeid] = cumsum(volume_lateral_inflow[inlet.nodeid])
-			volume_tot[inlet.nodeid] = sum(volume_lateral_inflow[inlet.nodeid])
-		# upstream pollutant contribution
-		total_volume_through_node = {}
-		total_pollutant_through_node = {}
-		upstream_pollutant_contribution = {}
-		for inlet in inlets:
-			total_volume_through_node[inlet.nodeid] = [total_inflow[inlet.nodeid][i] * step_durations[i] for i in range(len(total_inflow[inlet.nodeid]))]
-			total_pollutant_through_node[inlet.nodeid] = [quality[inlet.nodeid][i] * total_volume_through_node[inlet.nodeid][i] for i in range(len(quality[inlet.nodeid]))]
-		for inlet in inlets:
-			upstream_pollutant_contribution[inlet.nodeid] = [0 for i in range(len(total_pollutant_through_node[inlet.nodeid]))]
-			for node in upstream_inlets[inlet.nodeid]:
-				for i in range(len(upstream_pollutant_contribution[inlet.nodeid])):
-					upstream_pollutant_contribution[inlet.nodeid][i] += total_pollutant_through_node[node][i]
-		# pollutant load
-		for inlet in inlets:
-			#pollutant_load[inlet.nodeid] = [quality[inlet.nodeid][i] * volume_lateral_inflow[inlet.nodeid][i] for i in range(len(quality[inlet.nodeid]))]
-			pollutant_load[inlet.nodeid] = [abs(total_pollutant_through_node[inlet.nodeid][i] - upstream_pollutant_contribution[inlet.nodeid][i]) for i in range(len(total_pollutant_through_node[inlet.nodeid]))]
-			pollutant_load_cum[inlet.nodeid] = cumsum(pollutant_load[inlet.nodeid])
-			pollutant_load_tot[inlet.nodeid] = sum(pollutant_load[inlet.nodeid])
-			pollutant_load_removal_percent[inlet.nodeid] = 0 if pollutant_load_tot["system"] == 0 else pollutant_load_tot[inlet.nodeid] / pollutant_load_tot["system"] * 100
-			pollutant_load_removal_per_area[inlet.nodeid] = 0 if area_covered[inlet.nodeid]["total"] == 0 else pollutant_load_tot[inlet.nodeid] / area_covered[inlet.nodeid]["total"]
-		
 		# end the timer
 		timer_end = time.time()
 		
@@ -1040,35 +1104,9 @@ def simulate_scenarios(settings_file="settings.ini"):
 		
 		print("\nExporting simulation results")
 		
-		# export temporary results
-		ids = ["system"]
-		for inlet in inlets:
-			ids.append(inlet.nodeid)
-		count = 0
-		for id in ids:
-			exported_results = {"start": sim.start_time, \
-								"end": sim.end_time, \
-								"simulation_time": simulation_duration, \
-								"nodes": [id], \
-								"total_volume": volume_tot[id], \
-								"flow_error": flow_error, \
-								"total_TSS": sum([pollutant_load_tot[x] for x in pollutant_load_tot if x != "system"]), \
-								"total_TSS_system": pollutant_load_tot["system"], \
-								"quality_error": quality_error, \
-								"removal_mass": pollutant_load_tot[id], \
-								"removal_percent": pollutant_load_removal_percent[id], \
-								"removal_per_area": pollutant_load_removal_per_area[id], \
-								"step_times": step_times, \
-								"volume_per_step": volume_lateral_inflow[id], \
-								"tss_per_step": pollutant_load[id], \
-								"cumulative_volume": volume_cum[id], \
-								"cumulative_tss": pollutant_load_cum[id], \
-								"area_covered": area_covered[id], \
-								"area_covered_total": area_covered[id]["total"]}
-			exported_results["volume_manhole_per_step"] = volume_lateral_inflow[id] if id != "system" else None
-			exported_results["tss_manhole_per_step"] = pollutant_load[id] if id != "system" else None
-			pickle.dump(exported_results, open("temp/simulation_results_"+str(count)+".p", "wb"))
-			count += 1
+		exported_results = get_result_records(data, plan, blocks, capture.totals, step_times, (start_time, sim.end_time), simulation_duration, flow_error, quality_error)
+		write_records(exported_results)	# one columnar store for all nodes
+		delete_checkpoint()	# the run is complete
 		
 		color_print("\nComplete", "green")
 		
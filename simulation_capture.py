@@ -0,0 +1,217 @@
+
+# capture of node states during the simulation
+# the node values are read straight from the swmm solver and written into preallocated numpy arrays (steps x nodes)
+
+# general numpy stuff
+import numpy as np
+# swmm toolkit, used directly to avoid the per-property lookups of pyswmm node objects
+from swmm.toolkit import solver
+from pyswmm.toolkitapi import ObjectType, NodeResults, NodePollut
+# routing between the captured inlets
+from network_topology import remove_inlets
+
+# reads lateral inflow, total inflow and pollutant concentration of a fixed list of nodes
+# the node and pollutant indices are resolved once instead of on every read
+class NodeReader:
+	def __init__(self, sim, node_ids, pollutant):
+		model = sim._model
+		self.node_ids = list(node_ids)
+		self.indices = [model.getObjectIDIndex(ObjectType.NODE.value, node) for node in self.node_ids]
+		self.pollutant_index = model.getObjectIDIndex(ObjectType.POLLUT.value, pollutant)
+
+	# write the current values of all nodes into the given rows
+	def read(self, lateral_inflow, total_inflow, quality):
+		get_result = solver.node_get_result
+		get_pollutant = solver.node_get_pollutant
+		lateral = NodeResults.newLatFlow.value
+		total = NodeResults.totalinflow.value
+		qual = NodePollut.nodeQual.value
+		p = self.pollutant_index
+		lateral_inflow[:] = [get_result(i, lateral) for i in self.indices]	# inflow rate in l/s
+		total_inflow[:] = [get_result(i, total) for i in self.indices]	# inflow rate in l/s
+		quality[:] = [get_pollutant(i, qual)[p] for i in self.indices]	# water quality in mg/l
+
+# indices of the given nodes in the model, {node: index} for the nodes that exist, in the order of the model
+# the ids are looked up directly instead of iterating over all nodes of the model
+def node_indices(sim, node_ids):
+	model = sim._model
+	indices = {}
+	for node in node_ids:
+		if model.ObjectIDexist(ObjectType.NODE.value, node):
+			indices[node] = model.getObjectIDIndex(ObjectType.NODE.value, node)
+	return dict(sorted(indices.items(), key=lambda x: x[1]))
+
+# inlets to capture during a simulation and to report results for
+# data: points of interest (see sediment_traps.get_points_of_interest), selection: inlets to report, empty = all, given
+# with or without the junction suffix, indices: {inlet: index} of the inlets in the model (see node_indices), None = all
+# inlets of data in their order
+# inlets without contributing area only pass on the water of their upstream inlets, they are removed from the routing so
+# their upstream inlets are attributed to the downstream inlets directly (see network_topology.remove_inlets)
+# a reported inlet needs the load through its upstream inlets, so these are captured as well
+#	reported	inlets that get result records
+#	inlets		captured inlets, the reported inlets and their upstream inlets in the order of the model
+#	routing		{inlet: {upstream inlet: fraction}} of the captured inlets
+#	skipped		inlets without contributing area, unknown: selected inlets that are not inlets of the model
+#	selected	true if the reported inlets are restricted by a selection
+class CapturePlan:
+	def __init__(self, data, selection=[], suffix="", indices=None):
+		areas = data["junction_areas"]
+		existing = list(indices) if indices is not None else list(data["junctions_with_manholes"])
+		self.skipped = [inlet for inlet in existing if areas[inlet]["total"] == 0]
+		skipped = set(self.skipped)
+		routing = remove_inlets({inlet: data["inlet_routing"].get(inlet, {}) for inlet in existing}, self.skipped)
+		candidates = [inlet for inlet in existing if inlet not in skipped]
+		selection = [x for x in selection if x != ""]
+		self.selected = len(selection) > 0	# only the selected inlets are reported
+		if selection:
+			selected = set(selection) | set(x + suffix for x in selection)
+			self.reported = [inlet for inlet in candidates if inlet in selected]
+			found = set(self.reported) | set(x[:-len(suffix)] for x in self.reported if suffix and x.endswith(suffix))
+			self.unknown = [x for x in selection if x not in found]
+		else:
+			self.reported = candidates
+			self.unknown = []
+		needed = set(self.reported)
+		for inlet in self.reported:
+			needed.update(x for x in routing[inlet] if x in routing)
+		self.inlets = [inlet for inlet in candidates if inlet in needed]
+		self.routing = {inlet: {x: f for x, f in routing[inlet].items() if x in needed} for inlet in self.inlets}
+
+	# warnings about the plan to print before the run, action: what is done with the reported inlets (captured, ranked)
+	# the results of captured inlets hold total_TSS, which only covers the reported inlets with a selection
+	def warnings(self, action="captured"):
+		messages = []
+		if self.skipped:
+			messages.append("Inlets without contributing area are not " + action + ", their inflow is attributed to the downstream inlets: " + ", ".join(self.skipped))
+		if self.unknown:
+			messages.append("Inlets of capture_inlets not found in the model: " + ", ".join(self.unknown))
+		if self.selected:
+			messages.append("Only the " + str(len(self.reported)) + " inlets of capture_inlets are " + ("reported, total_TSS is the load of the reported inlets" if action == "captured" else action))
+		return messages
+
+# captured quantities, averaged over each block
+quantities = ["lateral_inflow", "total_inflow", "quality"]
+# integrals over each block
+# volume in liters: V = Q * dt
+# pollutant load in mg: TSS = C(TSS) * V, using the total inflow volume
+integrals = ["volume_lateral_inflow", "volume_total_inflow", "pollutant_load"]
+
+# captures the node values at every routing step and reduces them to blocks
+# each step is added to running sums, so memory use does not depend on the number of steps or the block size
+# two integration modes are available
+# block mean (report_step=None): the values are averaged over blocks of mod_num steps and the block volume/load is the
+# block mean multiplied by the block duration, the first step is a block of its own and the last block may be shorter
+# exact (report_step in seconds): Q * dt and C * Q * dt are integrated at every step using the actual step durations,
+# a block is closed at the first step reaching each multiple of report_step, independently of the routing step
+# start_time: time the capture starts at, in seconds from the simulation start, later than 0 when only a part of the
+# simulation is captured (see window_runner), the blocks stay aligned to the multiples of report_step
+class StepCapture:
+	def __init__(self, reader, mod_num=1000, report_step=None, start_time=0.0):
+		self.reader = reader
+		self.mod_num = mod_num
+		self.report_step = report_step
+		self.next_report = None if report_step is None else (start_time // report_step + 1) * report_step	# end of the current reporting interval (exact mode)
+		self.node_count = len(reader.node_ids)
+		self.row = {q: np.empty(self.node_count) for q in quantities}	# values of the current step
+		self.sums = {q: np.zeros(self.node_count) for q in quantities}	# running sums of the current block
+		self.load = np.zeros(self.node_count)	# running pollutant load of the current block (exact mode)
+		self.block_steps = 0	# routing steps in the current block
+		self.step_count = 0	# routing steps captured
+		self.previous_time = start_time	# time of the previous step, in seconds from the simulation start
+		self.block_start = start_time	# start of the current block, in seconds from the simulation start
+		self.totals = {name: np.zeros(self.node_count) for name in integrals}	# running totals over the whole simulation
+		# block series, grown when needed
+		self.series = {name: np.empty((64, self.node_count)) for name in quantities + integrals}
+		self.block_times = np.empty(64)	# time of each block end, in seconds from the simulation start
+		self.block_count = 0
+
+	# capture the current step, time is given in seconds from the simulation start
+	def capture(self, time):
+		self.reader.read(self.row["lateral_inflow"], self.row["total_inflow"], self.row["quality"])
+		self.block_steps += 1
+		if self.report_step is None:
+			for q in quantities:
+				self.sums[q] += self.row[q]
+			if self.step_count % self.mod_num == 0:
+				self._close_block(time)
+		else:
+			dt = time - self.previous_time
+			for q in quantities:
+				self.sums[q] += self.row[q] * dt
+			self.load += self.row["quality"] * self.row["total_inflow"] * dt
+			if time >= self.next_report:
+				self._close_block(time)
+				while self.next_report <= time:
+					self.next_report += self.report_step
+		self.previous_time = time
+		self.step_count += 1
+
+	# reduce the current block, add its volume and pollutant load to the totals and start a new block
+	def _close_block(self, time):
+		duration = time - self.block_start
+		if self.report_step is None:
+			values = {q: self.sums[q] / self.block_steps for q in quantities}
+			values["volume_lateral_inflow"] = values["lateral_inflow"] * duration
+			values["volume_total_inflow"] = values["total_inflow"] * duration
+			values["pollutant_load"] = values["quality"] * values["volume_total_inflow"]
+		else:
+			values = {q: self.sums[q] / duration if duration > 0 else np.zeros(self.node_count) for q in quantities}	# time weighted means
+			values["volume_lateral_inflow"] = self.sums["lateral_inflow"].copy()
+			values["volume_total_inflow"] = self.sums["total_inflow"].copy()
+			values["pollutant_load"] = self.load.copy()
+			self.load[:] = 0
+		for name in integrals:
+			self.totals[name] += values[name]
+		self._append(values, time)
+		for q in quantities:
+			self.sums[q][:] = 0
+		self.block_steps = 0
+		self.block_start = time
+
+	# add a block to the series
+	def _append(self, values, time):
+		if self.block_count == len(self.block_times):
+			size = 2 * self.block_count
+			for name in self.series:
+				grown = np.empty((size, self.node_count))
+				grown[:self.block_count] = self.series[name][:self.block_count]
+				self.series[name] = grown
+			grown = np.empty(size)
+			grown[:self.block_count] = self.block_times[:self.block_count]
+			self.block_times = grown
+		for name in self.series:
+			self.series[name][self.block_count] = values[name]
+		self.block_times[self.block_count] = time
+		self.block_count += 1
+
+	# true right after a block was closed, the capture then holds no partly integrated block
+	def at_block_boundary(self):
+		return self.block_steps == 0
+
+	# state of the capture, everything except the reader, used for checkpoints (see checkpoint.py)
+	def get_state(self):
+		state = {name: value for name, value in self.__dict__.items() if name != "reader"}
+		state["series"] = {name: self.series[name][:self.block_count].copy() for name in self.series}
+		state["block_times"] = self.block_times[:self.block_count].copy()
+		return state
+
+	# continue from a state returned by get_state, the nodes have to be the same
+	def set_state(self, state):
+		if state["node_count"] != self.node_count:
+			raise ValueError("The checkpoint was captured for " + str(state["node_count"]) + " nodes, not " + str(self.node_count))
+		for name, value in state.items():
+			setattr(self, name, value)
+		size = max(64, 2 * self.block_count)
+		self.series = {name: np.empty((size, self.node_count)) for name in state["series"]}
+		for name in self.series:
+			self.series[name][:self.block_count] = state["series"][name]
+		self.block_times = np.empty(size)
+		self.block_times[:self.block_count] = state["block_times"]
+
+	# close the last (partial) block
+	# in block mean mode the block ends at end_time, in exact mode at the last captured step
+	# returns the block end times and {name: array of (blocks x nodes)} for the quantities and integrals
+	def finish(self, end_time):
+		if self.block_steps > 0:
+			self._close_block(end_time if self.report_step is None else self.previous_time)
+		return self.block_times[:self.block_count], {name: self.series[name][:self.block_count] for name in self.series}
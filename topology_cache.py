@@ -0,0 +1,90 @@
+
+# persistent cache of the points of interest of input files (see sediment_traps.get_points_of_interest)
+# the parsed network data is stored on disk, compressed, under a hash of the input file content, so an unchanged model is
+# only parsed once, also across runs and processes
+# the least recently used entries are deleted when the cache grows larger than its maximum size
+
+from inp_parser import InpIndex, InpDocument
+# for colored print
+from utilities import color_print
+import hashlib
+import pickle
+import zlib
+import os
+
+cache_folder = os.path.join("temp", "topology_cache")
+# changed whenever the cached data changes, so entries of older versions are never used
+cache_version = "2"
+
+# hash of the content of an input file, given as a path, an index or a document
+# the lines are hashed as they are written by write_inp, so a document and the file it is saved to have the same hash
+def inp_hash(source):
+	content = hashlib.sha256(cache_version.encode("utf-8"))
+	if isinstance(source, (InpIndex, InpDocument)):
+		for line in source.lines:
+			content.update((line + "\n").encode("utf-8"))
+	else:
+		with open(source, "r") as f:
+			for line in f:
+				content.update((line.rstrip() + "\n").encode("utf-8"))
+	return content.hexdigest()
+
+# cached data of a hash, None if the hash is not in the cache
+def read_cache(key, folder=cache_folder):
+	path = os.path.join(folder, key + ".p.z")
+	try:
+		with open(path, "rb") as f:
+			data = pickle.loads(zlib.decompress(f.read()))
+		os.utime(path)	# mark as recently used
+		return data
+	except Exception:	# not cached, or written by an interrupted process
+		return None
+
+# store the data of a hash, the file is written under a temporary name and renamed, so other processes never read half a file
+def write_cache(key, data, max_size, folder=cache_folder):
+	os.makedirs(folder, exist_ok=True)
+	path = os.path.join(folder, key + ".p.z")
+	temp_path = path + "." + str(os.getpid())
+	with open(temp_path, "wb") as f:
+		f.write(zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)))
+	os.replace(temp_path, path)
+	evict_cache(max_size, folder)
+
+# delete the least recently used entries until the cache is at most max_size bytes
+# suffix: file extension of the entries, also used for the hotstart files of window_runner
+def evict_cache(max_size, folder=cache_folder, suffix=".p.z"):
+	entries = []
+	for item in os.listdir(folder):
+		if item.endswith(suffix):
+			stat = os.stat(os.path.join(folder, item))
+			entries.append((stat.st_mtime, stat.st_size, item))
+	entries.sort()
+	total = sum(entry[1] for entry in entries)
+	for mtime, size, item in entries:
+		if total <= max_size:
+			break
+		try:
+			os.unlink(os.path.join(folder, item))
+		except OSError:	# deleted by another process
+			pass
+		total -= size
+
+# the points of interest of an input file, from the cache if the same content was parsed before, otherwise from compute
+# source: path, index or document of the input file, compute: function parsing the source (get_points_of_interest)
+# max_size: maximum size of the cache in MB, 0 = no caching
+# the warnings found while parsing are printed again when the data is read from the cache
+def cached_points_of_interest(source, compute, max_size):
+	if max_size <= 0:
+		return compute(source)
+	key = inp_hash(source)
+	data = read_cache(key)
+	if data is not None:
+		for warning in data["warnings"]:
+			color_print(warning, "yellow")
+		return data
+	data = compute(source)
+	try:
+		write_cache(key, data, max_size * 10**6)
+	except OSError as e:
+		color_print("Could not write the topology cache: " + str(e), "yellow")
+	return data
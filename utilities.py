@@ -100,3 +100,17 @@ def print_iterable(it):
 	for i in it:
 		print(i)
 
+
+# convert a time in hh:mm:ss format to seconds
+def time_to_seconds(s):
+	parts = [int(x) for x in s.split(":")]
+	while len(parts) < 3:
+		parts.insert(0, 0)
+	return parts[0]*3600 + parts[1]*60 + parts[2]
+
+# format a duration in seconds as hh:mm:ss
+def format_duration(seconds):
+	hours = "{:02d}".format(int(seconds//3600))
+	minutes = "{:02d}".format(int((seconds%3600)//60))
+	secs = "{:02d}".format(int(seconds%3600%60))
+	return hours + ":" + minutes + ":" + secs
@@ -0,0 +1,246 @@
+
+# simulation of the period of the settings file in time windows (e.g. months) that run in parallel processes
+# every window is seeded either by a warm-up run of window_warmup days before its start, or by the hotstart file saved at its
+# start by an earlier continuous run of the same input file, and only the steps inside the window are captured
+# the block series of the windows are stitched in time order into one result set, stored like the results of simulate_scenarios
+# the windows are always integrated exactly with blocks of results_step (see StepCapture), as blocks of routing steps would
+# start anew in every window and give other block means than a continuous run
+# with validate_windows = 1 the period is also simulated in one continuous run, in parallel with the windows
+# the continuous run saves the hotstart files of the window starts for later runs, and the stitched totals are compared with
+# the continuous totals in a validation report
+# the stitched results are approximate, the validation report is the check of a window length and warm-up for a model
+# neither a warm-up nor a hotstart file gives a window the exact state of the continuous run: a swmm hotstart file does
+# not hold the complete model state (e.g. the runoff of the subcatchments), and the results of swmm also depend on the end
+# time of the simulation, so the windows can differ from the continuous run by some percent in single windows
+# the hotstart files are kept in temp/windows, the least recently used are deleted above window_hotstart_size MB
+
+import sediment_traps
+# import pyswmm modules
+from pyswmm import SystemStats
+# import utility functions
+from utilities import color_print, display_progress, format_duration
+# for capturing node values during the simulation
+from simulation_capture import NodeReader, StepCapture, CapturePlan
+# for storing the stitched results
+from result_store import write_records
+# for identifying the hotstart files of an input file
+from topology_cache import inp_hash, evict_cache
+# location of the hotstart files of the window starts
+from checkpoint import hotstart_folder
+# for parallel execution
+from concurrent.futures import ProcessPoolExecutor, as_completed
+# for running a window in a temporary folder
+from scenario_runner import WorkerSimulation
+# for data export
+from pandas import DataFrame, ExcelWriter
+from datetime import datetime, timedelta
+import numpy as np
+import hashlib
+import time
+import os
+
+# split the period into windows of a calendar month, a calendar year or a number of days
+# window: "month", "year" or the number of days
+# returns [(window_start, window_end), ...] as datetimes, the last window ends at end_time
+def get_windows(start_time, end_time, window):
+	windows = []
+	window_start = start_time
+	while window_start < end_time:
+		if window == "month":
+			window_end = datetime(window_start.year + window_start.month // 12, window_start.month % 12 + 1, 1)
+		elif window == "year":
+			window_end = datetime(window_start.year + 1, 1, 1)
+		else:
+			window_end = window_start + timedelta(days=int(window))
+		window_end = min(window_end, end_time)
+		windows.append((window_start, window_end))
+		window_start = window_end
+	return windows
+
+# path of the hotstart file with the state of the input file at time, reached by a continuous run from the period start
+# the file is saved at the first routing step at or after time, so it holds the state of up to one routing step later
+def hotstart_path(key, time):
+	return os.path.abspath(os.path.join(hotstart_folder, key[:16] + "_" + time.strftime("%Y%m%d%H%M%S") + ".hsf"))
+
+# identifies the state of the model at a time, from the content of the input file and the start of the period
+def hotstart_key(inp_file, period_start):
+	return hashlib.sha256((inp_hash(inp_file) + str(period_start)).encode("utf-8")).hexdigest()
+
+# simulate a window, executed in a worker process
+# the simulation starts at simulation_start, from hotstart_file if given, and the capture at window_start
+# save_hotstarts: [(time, path), ...] hotstart files to save during the run (the continuous run)
+# the report and output files are written into a temporary folder inside work_folder, see scenario_runner.WorkerSimulation
+# returns the block end times (seconds from the period start), block series and totals of the capture, or the reason of the failure
+def run_window(index, inp_file, inlets, settings, period_start, window, simulation_start, hotstart_file=None, save_hotstarts=[], work_folder="temp"):
+	result = {"index": index, "window": window, "status": "complete"}
+	with WorkerSimulation("window_" + str(index) + "_", result, work_folder) as worker:
+		sim = worker.open(inp_file)
+		sim.start_time = simulation_start
+		sim.end_time = window[1]
+		if hotstart_file is not None:
+			sim.use_hotstart(hotstart_file)
+		system_routing = SystemStats(sim)	# cumulative statistics
+		capture_start = (window[0] - period_start).total_seconds()
+		capture = StepCapture(NodeReader(sim, [settings["outfall_node"]] + inlets, settings["pollutant"]), 1000, sediment_traps.get_report_step(dict(settings, exact_integration=1)), capture_start)
+		hotstarts = sorted(save_hotstarts)
+		def save_hotstarts_due(sim):
+			while hotstarts and sim.current_time >= hotstarts[0][0]:
+				path = hotstarts.pop(0)[1]
+				sim.save_hotstart(path + ".tmp")
+				os.replace(path + ".tmp", path)	# never read half written by a window
+		worker.run(capture, period_start, capture_start=capture_start, on_step=save_hotstarts_due)	# the warm-up is not captured
+		result["block_times"], result["blocks"] = capture.finish((window[1] - period_start).total_seconds())
+		result["totals"] = capture.totals
+		result["flow_error"] = system_routing.routing_stats["routing_error"]
+		result["quality_error"] = sim.quality_error
+	return result
+
+# join the captures of consecutive windows into the capture of the whole period
+# returns the block end times, block series and totals in the format of StepCapture.finish
+def stitch_windows(results):
+	results = sorted(results, key=lambda r: r["window"][0])
+	block_times = np.concatenate([r["block_times"] for r in results])
+	blocks = {name: np.concatenate([r["blocks"][name] for r in results]) for name in results[0]["blocks"]}
+	totals = {name: np.sum([r["totals"][name] for r in results], axis=0) for name in results[0]["totals"]}
+	return block_times, blocks, totals
+
+# result records of a capture of the period, see sediment_traps.get_result_records
+def window_records(data, plan, period, block_times, blocks, totals, simulation_time, flow_error, quality_error):
+	step_times = [period[0] + timedelta(seconds=t) for t in block_times]
+	return sediment_traps.get_result_records(data, plan, blocks, totals, step_times, period, simulation_time, flow_error, quality_error)
+
+# compare the stitched records with the records of the continuous run and export the validation report
+def export_validation(settings, windowed, continuous, results, continuous_result, period, results_file):
+	print("\nExporting validation report...")
+	nodes = [r["nodes"][0] for r in windowed]
+	stitched = np.array([r["removal_mass"] for r in windowed])
+	reference = np.array([r["removal_mass"] for r in continuous])
+	difference = stitched - reference
+	relative = np.divide(difference, reference, out=np.zeros_like(difference), where=reference != 0) * 100
+	# pollutant load at the outfall within each window, from the block series of both runs
+	outfall_continuous = continuous_result["blocks"]["pollutant_load"][:, 0]
+	window_rows = {"Window start": [], "Window end": [], "Seed": [], "Simulation time": [], "Outfall TSS stitched (kg)": [], "Outfall TSS continuous (kg)": []}
+	for r in sorted(results, key=lambda r: r["window"][0]):
+		window_start = (r["window"][0] - period[0]).total_seconds()
+		window_end = (r["window"][1] - period[0]).total_seconds()
+		in_window = (continuous_result["block_times"] > window_start) & (continuous_result["block_times"] <= window_end)
+		window_rows["Window start"].append(r["window"][0])
+		window_rows["Window end"].append(r["window"][1])
+		window_rows["Seed"].append(r["seed"])
+		window_rows["Simulation time"].append(r["simulation_time"])
+		window_rows["Outfall TSS stitched (kg)"].append(r["totals"]["pollutant_load"][0]/10**6)
+		window_rows["Outfall TSS continuous (kg)"].append(outfall_continuous[in_window].sum()/10**6)
+	with ExcelWriter(results_file) as writer:
+		DataFrame({"Node": nodes, \
+					"TSS removal continuous (kg)": reference/10**6, \
+					"TSS removal stitched (kg)": stitched/10**6, \
+					"Difference (kg)": difference/10**6, \
+					"Difference (%)": relative}).to_excel(writer, sheet_name="removal_mass")
+		DataFrame({"Total": ["total_TSS", "total_TSS_system"], \
+					"Continuous (kg)": [continuous[0]["total_TSS"]/10**6, continuous[0]["total_TSS_system"]/10**6], \
+					"Stitched (kg)": [windowed[0]["total_TSS"]/10**6, windowed[0]["total_TSS_system"]/10**6], \
+					"Difference (%)": [(windowed[0][x] - continuous[0][x]) / continuous[0][x] * 100 if continuous[0][x] != 0 else 0 for x in ["total_TSS", "total_TSS_system"]]}).to_excel(writer, sheet_name="totals")
+		DataFrame(window_rows).to_excel(writer, sheet_name="windows")
+	inlets = [k for k in range(len(nodes)) if nodes[k] != "system"]
+	print("Largest difference of the removal_mass of the inlets: " + ("%.3f" % np.abs(relative[inlets]).max() if inlets else "0") + " %")
+	for x in ["total_TSS", "total_TSS_system"]:
+		print("Difference of " + x + ": " + ("%.3f" % ((windowed[0][x] - continuous[0][x]) / continuous[0][x] * 100 if continuous[0][x] != 0 else 0)) + " %")
+	color_print("Complete", "green")
+	print("Validation report exported to " + results_file)
+
+# prepare the input file, simulate the windows in parallel, store the stitched results and optionally validate them
+def run_windows(settings_file="settings.ini"):
+
+	# needed for colored print to work
+	os.system("")
+
+	print("\nReading data from settings file...")
+	settings = sediment_traps.read_settings(settings_file)
+	color_print("Complete", "green")
+	if not settings["exact_integration"]:
+		color_print("The windows are integrated exactly with blocks of results_step, although exact_integration = 0", "yellow")
+
+	data = sediment_traps.prepare_input_file(settings)
+	# inlets to capture, restricted to capture_inlets if given, see CapturePlan
+	plan = CapturePlan(data, settings["capture_inlets"], settings["junction_suffix"])
+	color_print("Complete", "green")
+	for warning in plan.warnings():
+		color_print(warning, "yellow")
+
+	inp_file = os.path.abspath(settings["input_file"])
+	period = sediment_traps.get_simulation_period(settings)
+	windows = get_windows(period[0], period[1], settings["simulation_windows"])
+	warmup = timedelta(days=settings["window_warmup"])
+	key = hotstart_key(inp_file, period[0])
+	work_folder = os.path.abspath("temp")
+	if not os.path.isdir(hotstart_folder): os.makedirs(hotstart_folder)
+	use_hotstarts = settings["window_hotstart_size"] > 0	# 0 = no hotstart files are saved or used
+
+	# the continuous run is the longest, it is submitted first
+	tasks = []
+	if settings["validate_windows"]:
+		tasks.append((-1, period, period[0], None, [(w[0], hotstart_path(key, w[0])) for w in windows[1:] if use_hotstarts and not os.path.isfile(hotstart_path(key, w[0]))], "continuous"))
+	for index, window in enumerate(windows):
+		if index == 0:
+			tasks.append((index, window, window[0], None, [], "period start"))
+		elif use_hotstarts and os.path.isfile(hotstart_path(key, window[0])):
+			os.utime(hotstart_path(key, window[0]))	# mark as recently used
+			tasks.append((index, window, window[0], hotstart_path(key, window[0]), [], "hotstart"))
+		else:
+			tasks.append((index, window, max(period[0], window[0] - warmup), None, [], "warm-up"))
+
+	processes = settings["parallel_processes"] if settings["parallel_processes"] > 0 else (os.cpu_count() or 1)
+	processes = max(1, min(processes, len(tasks)))
+	print("\nRunning " + str(len(windows)) + " windows" + (" and the continuous run" if settings["validate_windows"] else "") + " in " + str(processes) + " processes...")
+	timer_start = time.time()
+	results = []
+	continuous_result = None
+	failed = []
+	display_progress(0)
+	with ProcessPoolExecutor(max_workers=processes) as executor:
+		futures = {executor.submit(run_window, index, inp_file, plan.inlets, settings, period[0], window, simulation_start, hotstart_file, save_hotstarts, work_folder): seed \
+					for index, window, simulation_start, hotstart_file, save_hotstarts, seed in tasks}
+		for done, future in enumerate(as_completed(futures)):
+			try:
+				result = future.result()
+			except Exception as e:	# the worker process itself failed
+				result = {"index": -2, "status": "failed: " + str(e)}
+			result["seed"] = futures[future]
+			if result["status"] != "complete":
+				failed.append(result)
+			elif result["index"] == -1:
+				continuous_result = result
+			else:
+				results.append(result)
+			display_progress((done + 1)/len(tasks))
+	if use_hotstarts:
+		evict_cache(settings["window_hotstart_size"] * 10**6, hotstart_folder, ".hsf")
+	if failed:
+		color_print("\n" + str(len(failed)) + " runs failed", "red")
+		for r in failed:
+			color_print(("Continuous run" if r["index"] == -1 else "Window " + str(r["index"])) + ": " + r["status"], "red")
+		if len(results) < len(windows):
+			return
+	else:
+		color_print("\nComplete", "green")
+	simulation_time = format_duration(time.time() - timer_start)
+	print("\nTotal simulation time: " + simulation_time)
+
+	print("\nStitching windows...")
+	block_times, blocks, totals = stitch_windows(results)
+	# the largest errors of the windows
+	flow_error = max([r["flow_error"] for r in results], key=abs)
+	quality_error = max([r["quality_error"] for r in results], key=abs)
+	windowed = window_records(data, plan, period, block_times, blocks, totals, simulation_time, flow_error, quality_error)
+	write_records(windowed)
+	color_print("Complete", "green")
+
+	if continuous_result is not None:
+		continuous = window_records(data, plan, period, continuous_result["block_times"], continuous_result["blocks"], continuous_result["totals"], continuous_result["simulation_time"], continuous_result["flow_error"], continuous_result["quality_error"])
+		if not os.path.isdir("results"): os.mkdir("results")
+		results_file = "results/" + settings["results_file"].replace(".xlsx", "_" + settings["res_id"] + "_windows_validation.xlsx")
+		export_validation(settings, windowed, continuous, results, continuous_result, period, results_file)
+
+if __name__ == "__main__":
+	run_windows()
+	print("\nProgram terminated")